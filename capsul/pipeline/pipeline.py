@@ -10,6 +10,7 @@
 # System import
 import logging
 from copy import deepcopy
+from contextlib import contextmanager
 import types
 import tempfile
 import os
@@ -35,6 +36,7 @@ from capsul.process import get_process_instance
 from topological_sort import GraphNode
 from topological_sort import Graph
 from pipeline_nodes import Plug
+from pipeline_links import LinkIndex
 from pipeline_nodes import ProcessNode
 from pipeline_nodes import PipelineNode
 from pipeline_nodes import Switch
@@ -111,6 +113,11 @@ class Pipeline(Process):
     which allows to select one processing branch betwen several, and disables
     the unselected ones.
 
+    Activations are updated incrementally: only the neighbourhood of the
+    nodes, plugs and links which have changed since the last update is
+    evaluated again. Set the :py:attr:`incremental_activation` attribute to
+    False to always recompute the activation of the whole pipeline.
+
     **Pipeline steps**
 
     Pipelines may define execution steps: they are user-oriented groups of nodes
@@ -147,12 +154,14 @@ class Pipeline(Process):
     remove_link
     export_parameter
     workflow_ordered_nodes
+    workflow_nodes_dependencies
     workflow_graph
     update_nodes_and_plugs_activation
     parse_link
     parse_parameter
     find_empty_parameters
     count_items
+    batch_update
     define_pipeline_steps
     add_pipeline_step
     remove_pipeline_step
@@ -167,6 +176,12 @@ class Pipeline(Process):
     # this value to False will make it visible.
     hide_nodes_activation = True
 
+    # By default activations are updated incrementally, only around the
+    # nodes, plugs and links that have changed. Changing this value to False
+    # will force a full recomputation on each update (useful to check the
+    # incremental results).
+    incremental_activation = True
+
     def __init__(self, autoexport_nodes_parameters=True, **kwargs):
         """ Initialize the Pipeline class
 
@@ -191,20 +206,29 @@ class Pipeline(Process):
         self.pipeline_node = PipelineNode(self, '', self)
         self.nodes[''] = self.pipeline_node
         self.do_not_export = set()
+        self._link_index = LinkIndex()
+        self._activation_dirty_units = set()
+        self._activation_full_update_needed = True
+        self._forward_activations = {}
+        self._workflow_graphs = {}
+        self._workflow_lists = {}
         self.parent_pipeline = None
-        self._disable_update_nodes_and_plugs_activation = 1
+        self._disable_update_nodes_and_plugs_activation = 0
         self._must_update_nodes_and_plugs_activation = False
-        self.pipeline_definition()
 
-        self.workflow_repr = ""
-        self.workflow_list = []
+        # Build the pipeline in a single transaction: activations are
+        # computed once, when the pipeline is complete
+        with self.batch_update():
+            self.pipeline_definition()
 
-        if autoexport_nodes_parameters:
-            self.autoexport_nodes_parameters()
+            self.workflow_repr = ""
+            self.workflow_list = []
 
-        # Refresh pipeline activation
-        self._disable_update_nodes_and_plugs_activation -= 1
-        self.update_nodes_and_plugs_activation()
+            if autoexport_nodes_parameters:
+                self.autoexport_nodes_parameters()
+
+            # Refresh pipeline activation
+            self.update_nodes_and_plugs_activation()
 
     ##############
     # Methods    #
@@ -224,18 +248,21 @@ class Pipeline(Process):
 
         If plug is not optional and if the plug has to be exported
         """
-        for node_name, node in self.nodes.iteritems():
-            if node_name == "":
-                    continue
-            for parameter_name, plug in node.plugs.iteritems():
-                if parameter_name in ("nodes_activation", "selection_changed"):
-                    continue
-                if (((node_name, parameter_name) not in self.do_not_export and
-                    ((plug.output and not plug.links_to) or
-                     (not plug.output and not plug.links_from)) and
-                    not self.nodes[node_name].get_trait(parameter_name).optional)):
+        with self.batch_update():
+            for node_name, node in self.nodes.iteritems():
+                if node_name == "":
+                        continue
+                for parameter_name, plug in node.plugs.iteritems():
+                    if parameter_name in ("nodes_activation",
+                                          "selection_changed"):
+                        continue
+                    if (((node_name, parameter_name) not in self.do_not_export
+                        and ((plug.output and not plug.links_to) or
+                             (not plug.output and not plug.links_from)) and
+                        not self.nodes[node_name].get_trait(
+                            parameter_name).optional)):
 
-                    self.export_parameter(node_name, parameter_name)
+                        self.export_parameter(node_name, parameter_name)
 
     def add_trait(self, name, trait):
         """ Add a trait to the pipeline
@@ -257,8 +284,10 @@ class Pipeline(Process):
             optional = bool(trait.optional)
             plug = Plug(output=output, optional=optional)
             self.pipeline_node.plugs[name] = plug
-            plug.on_trait_change(self.update_nodes_and_plugs_activation,
-                                 'enabled')
+            plug.on_trait_change(
+                SomaPartial(self._activation_changed, self.pipeline_node,
+                            plug), 'enabled')
+            self._set_activation_dirty(self.pipeline_node, plug)
 
     def remove_trait(self, name):
         """ Remove a trait to the pipeline
@@ -291,7 +320,7 @@ class Pipeline(Process):
 
     def add_process(self, name, process, do_not_export=None,
                     make_optional=None, inputs_to_copy=None,
-                    inputs_to_clean=None, **kwargs):
+                    inputs_to_clean=None, requirements=None, **kwargs):
         """ Add a new node in the pipeline
 
         Parameters
@@ -308,6 +337,9 @@ class Pipeline(Process):
             a list of item to copy.
         inputs_to_clean: list of str (optional)
             a list of temporary items.
+        requirements: dict (optional)
+            the resources needed by the node execution, overriding those
+            declared by the process (see Process.requirements).
         """      
         # Unique constrains
         make_optional = set(make_optional or [])
@@ -334,10 +366,24 @@ class Pipeline(Process):
             node.name = name
             node.pipeline = self
             process.parent_pipeline = self
+            # The links of the sub-pipeline are now indexed by this pipeline
+            self._link_index.merge(process._link_index)
+            process._set_link_index(self._link_index)
         else:
             node = ProcessNode(self, name, process)
+            if requirements:
+                node.requirements.update(requirements)
         self.nodes[name] = node
 
+        # The new node activation has to be computed at the next update.
+        # Nodes of a sub-pipeline have been activated as a top-level pipeline
+        # and have to be evaluated again in the context of this pipeline.
+        if isinstance(process, Pipeline):
+            for sub_node in process.all_nodes():
+                self._set_activation_dirty(sub_node)
+        else:
+            self._set_activation_dirty(node)
+
         # If a default value is given to a parameter, change the corresponding
         # plug so that it gets activated even if not linked
         for parameter_name in kwargs:
@@ -448,6 +494,7 @@ class Pipeline(Process):
         # Create the node
         node = Switch(self, name, inputs, outputs, make_optional=make_optional)
         self.nodes[name] = node
+        self._set_activation_dirty(node)
 
         # Export the switch controller to the pipeline node
         if export_switch:
@@ -567,6 +614,9 @@ class Pipeline(Process):
                                   dest_plug, weak_link))
         dest_plug.links_from.add((source_node_name, source_plug_name,
                                   source_node, source_plug, weak_link))
+        self._link_index.add_link(source_node, source_plug_name, source_plug,
+                                  dest_node, dest_plug_name, dest_plug,
+                                  weak_link)
 
         # Set a connected_output property
         if (isinstance(dest_node, ProcessNode) and
@@ -588,8 +638,47 @@ class Pipeline(Process):
         source_node.connect(source_plug_name, dest_node, dest_plug_name)
         dest_node.connect(dest_plug_name, source_node, source_plug_name)
 
-        # Refresh pipeline activation
-        self.update_nodes_and_plugs_activation()
+        # Refresh pipeline activation around the new link
+        self._set_activation_dirty(source_node, source_plug)
+        self._activation_changed(dest_node, dest_plug)
+
+    @contextmanager
+    def batch_update(self):
+        """ Context manager grouping several pipeline modifications in a
+        single transaction.
+
+        Nodes and plugs activations, and their side effects (traits hiding,
+        propagation of values through links that become active, and
+        selection_changed events), are postponed until the end of the
+        outermost transaction, where they are performed once.
+
+        ::
+
+            with pipeline.batch_update():
+                pipeline.add_link('node1.output->node2.input')
+                pipeline.export_parameter('node2', 'output')
+                pipeline.nodes_activation.node3 = False
+        """
+        if self.parent_pipeline is not None:
+            # Only the top level pipeline can manage transactions
+            with self.parent_pipeline.batch_update():
+                yield
+            return
+        self.delay_update_nodes_and_plugs_activation()
+        try:
+            yield
+        finally:
+            self.restore_update_nodes_and_plugs_activation()
+
+    def _set_link_index(self, link_index):
+        """ Make this pipeline and its sub-pipelines use a shared links
+        index.
+        """
+        self._link_index = link_index
+        for node in self.nodes.itervalues():
+            if (isinstance(node, PipelineNode) and
+                    node is not self.pipeline_node):
+                node.process._set_link_index(link_index)
 
     def remove_link(self, link):
         """ Remove a link between pipeline nodes
@@ -615,6 +704,9 @@ class Pipeline(Process):
                                       source_node, source_plug, True))
         dest_plug.links_from.discard((source_node_name, source_plug_name,
                                       source_node, source_plug, False))
+        self._link_index.remove_link(source_plug, dest_plug)
+        self._set_activation_dirty(source_node, source_plug)
+        self._set_activation_dirty(dest_node, dest_plug)
 
         # Set a connected_output property
         if (isinstance(dest_node, ProcessNode) and
@@ -745,6 +837,7 @@ class Pipeline(Process):
             list of (plug_name,plug) containing all plugs that have been
             activated
         """
+        link_index = self._link_index
         plugs_activated = []
         # If a node is disabled, it will never be activated
         if node.enabled:
@@ -771,8 +864,9 @@ class Pipeline(Process):
                         else:
                             # Look for a non weak link connected to an
                             # activated plug in order to activate the plug
-                            for nn, pn, n, p, weak_link in plug.links_from:
-                                if not weak_link and p.activated:
+                            for link in link_index.links_from_of(plug):
+                                if (not link & 1 and
+                                        link_index.link_plug(link).activated):
                                     plug.activated = True
                                     plugs_activated.append((plug_name, plug))
                                     break
@@ -817,11 +911,12 @@ class Pipeline(Process):
             # weak_activation will be True if there is at least one
             # weak link connected to an activated plug
             weak_activation = False
-            for nn, pn, n, p, weak_link in links:
-                if weak_link:
-                    weak_activation = (weak_activation or p.activated)
+            for link in links:
+                activated = link_index.link_plug(link).activated
+                if link & 1:
+                    weak_activation = (weak_activation or activated)
                 else:
-                    if p.activated:
+                    if activated:
                         plug_activated = True
                         break
                     else:
@@ -832,6 +927,7 @@ class Pipeline(Process):
                 plug_activated = weak_activation
             return plug_activated
 
+        link_index = self._link_index
         plugs_deactivated = []
         # If node has already been  deactivated there is nothing to do
         if node.activated:
@@ -847,17 +943,19 @@ class Pipeline(Process):
                     if (isinstance(node, PipelineNode) and
                        node is not self.pipeline_node and output):
                         plug_activated = (
-                            check_plug_activation(plug, plug.links_to) and
-                            check_plug_activation(plug, plug.links_from))
+                            check_plug_activation(
+                                plug, link_index.links_to_of(plug)) and
+                            check_plug_activation(
+                                plug, link_index.links_from_of(plug)))
                     else:
                         if node is self.pipeline_node:
                             output = not output
                         if output:
                             plug_activated = check_plug_activation(
-                                plug, plug.links_to)
+                                plug, link_index.links_to_of(plug))
                         else:
                             plug_activated = check_plug_activation(
-                                plug, plug.links_from)
+                                plug, link_index.links_from_of(plug))
 
                     # Plug must be deactivated, record it in result and check
                     # if this deactivation also deactivate the node
@@ -895,12 +993,16 @@ class Pipeline(Process):
         self._disable_update_nodes_and_plugs_activation -= 1
         if self._disable_update_nodes_and_plugs_activation == 0 and \
                 self._must_update_nodes_and_plugs_activation:
-            self.update_nodes_and_plugs_activation()
+            self._refresh_nodes_and_plugs_activation()
 
     def update_nodes_and_plugs_activation(self):
         """ Reset all nodes and plugs activations according to the current
         state of the pipeline (i.e. switch selection, nodes disabled, etc.).
         Activations are set according to the following rules.
+
+        This method always recomputes the activation of the whole pipeline.
+        Changes made through the pipeline API (links, nodes and plugs
+        enabling, switches) are handled incrementally.
         """
         if not hasattr(self, 'parent_pipeline'):
             # self is being initialized (the call comes from self.__init__).
@@ -909,16 +1011,125 @@ class Pipeline(Process):
             # Only the top level pipeline can manage activations
             self.parent_pipeline.update_nodes_and_plugs_activation()
             return
+        self._activation_full_update_needed = True
+        self._refresh_nodes_and_plugs_activation()
+
+    def _set_activation_dirty(self, node, plug=None):
+        """ Record that the activation of a node (or of one of its plugs)
+        has to be evaluated again at the next activation update.
+
+        Parameters
+        ----------
+        node: Node (mandatory)
+            the node that has changed
+        plug: Plug (optional)
+            the plug that has changed. If not given, the whole node is
+            considered.
+        """
+        if not hasattr(self, 'parent_pipeline'):
+            # self is being initialized (the call comes from self.__init__).
+            return
+        # The pipeline structure has changed
+        self._workflow_graphs = {}
+        if self.parent_pipeline is not None:
+            # Only the top level pipeline can manage activations
+            self.parent_pipeline._set_activation_dirty(node, plug)
+            return
+        if node is self.pipeline_node and plug is None:
+            self._activation_full_update_needed = True
+        else:
+            self._activation_dirty_units.add(
+                self._activation_unit(node, plug))
+
+    def _activation_changed(self, node, plug=None):
+        """ Callback used when a node or a plug has been enabled or disabled:
+        record the change and update the pipeline activations.
+
+        Parameters
+        ----------
+        node: Node (mandatory)
+            the node that has changed
+        plug: Plug (optional)
+            the plug that has changed. If not given, the whole node is
+            considered.
+        """
+        if not hasattr(self, 'parent_pipeline'):
+            # self is being initialized (the call comes from self.__init__).
+            return
+        if self.parent_pipeline is not None:
+            # Only the top level pipeline can manage activations
+            self.parent_pipeline._activation_changed(node, plug)
+            return
+        self._set_activation_dirty(node, plug)
+        self._refresh_nodes_and_plugs_activation()
+
+    def _refresh_nodes_and_plugs_activation(self):
+        """ Update the activations of the top level pipeline, either
+        incrementally from the recorded changes, or for the whole pipeline.
+        """
         if self._disable_update_nodes_and_plugs_activation:
             self._must_update_nodes_and_plugs_activation = True
             return
+        if (self._activation_full_update_needed
+                or not self.incremental_activation
+                or getattr(self, '_debug_activations', None)
+                or not self.pipeline_node.activated):
+            self._full_update_nodes_and_plugs_activation()
+        elif self._activation_dirty_units:
+            self._incremental_update_nodes_and_plugs_activation()
+
+    def _activation_unit(self, node, plug):
+        """ Get the smallest pipeline element whose activation is evaluated
+        as a whole: the node itself, except for the top level pipeline node
+        which plugs are evaluated independently.
+        """
+        if node is self.pipeline_node and plug is not None:
+            return plug
+        return node
+
+    def _activation_unit_node(self, unit):
+        """ Get the node of an activation unit.
+        """
+        if isinstance(unit, Plug):
+            return self.pipeline_node
+        return unit
+
+    def _activation_unit_elements(self, unit):
+        """ Get the node and plugs which activation is held by an activation
+        unit.
+        """
+        if isinstance(unit, Plug):
+            return [unit]
+        return [unit] + unit.plugs.values()
 
+    def _activation_unit_neighbours(self, unit, downstream_only=False):
+        """ Iterate over the activation units linked to an activation unit.
+        """
+        if isinstance(unit, Plug):
+            plugs = [unit]
+        else:
+            plugs = unit.plugs.itervalues()
+        link_index = self._link_index
+        for plug in plugs:
+            if downstream_only:
+                links = link_index.links_to_of(plug)
+            else:
+                links = link_index.neighbour_links(plug)
+            for link in links:
+                yield self._activation_unit(link_index.link_node(link),
+                                            link_index.link_plug(link))
+
+    def _full_update_nodes_and_plugs_activation(self):
+        """ Reset all nodes and plugs activations of the pipeline (see
+        :py:meth:`update_nodes_and_plugs_activation`).
+        """
         self._disable_update_nodes_and_plugs_activation += 1
 
         debug = getattr(self, '_debug_activations', None)
         if debug:
             debug = open(debug, 'w')
             print >> debug, self.id
+        link_index = self._link_index
 
         # Remember all links that are inactive (i.e. at least one of the two
         # plugs is inactive) in order to execute a callback if they become
@@ -926,10 +1137,11 @@ class Pipeline(Process):
         inactive_links = []
         for node in self.all_nodes():
             for source_plug_name, source_plug in node.plugs.iteritems():
-                for nn, pn, n, p, weak_link in source_plug.links_to:
+                for link in link_index.links_to_of(source_plug):
+                    p = link_index.link_plug(link)
                     if not source_plug.activated or not p.activated:
                         inactive_links.append((node, source_plug_name,
-                                               source_plug, n, pn, p))
+                                               source_plug, link))
 
         # Initialization : deactivate all nodes and their plugs
         for node in self.all_nodes():
@@ -951,15 +1163,28 @@ class Pipeline(Process):
                     if debug:
                         print >> debug, '%d+%s:%s' % (
                             iteration, node.full_name, plug_name)
-                    for nn, pn, n, p, weak_link in plug.links_to.union(plug.links_from):
-                        if not weak_link and p.enabled:
-                            new_nodes_to_check.add(n)
+                    for link in link_index.neighbour_links(plug):
+                        if (not link & 1 and
+                                link_index.link_plug(link).enabled):
+                            new_nodes_to_check.add(
+                                link_index.link_node(link))
                 if (not node_activated) and node.activated:
                     if debug:
                         print >> debug, '%d+%s' % (iteration, node.full_name)
             nodes_to_check = new_nodes_to_check
             iteration += 1
 
+        # Remember forward activations: they are the starting point of
+        # incremental updates
+        forward_activations = {}
+        for node in self.all_nodes():
+            forward_activations[node] = node.activated
+            for plug in node.plugs.itervalues():
+                forward_activations[plug] = plug.activated
+        self._forward_activations = forward_activations
+        self._activation_dirty_units.clear()
+        self._activation_full_update_needed = False
+
         # Backward deactivation : deactivate plugs that should not been
         # activated and propagate deactivation to neighbouring plugs
         nodes_to_check = set(self.all_nodes())
@@ -976,9 +1201,10 @@ class Pipeline(Process):
                         if debug:
                             print >> debug, '%d-%s:%s' % (
                                 iteration, node.full_name, plug_name)
-                        for nn, pn, n, p, weak_link in plug.links_from.union(plug.links_to):
-                            if p.activated:
-                                new_nodes_to_check.add(n)
+                        for link in link_index.neighbour_links(plug):
+                            if link_index.link_plug(link).activated:
+                                new_nodes_to_check.add(
+                                    link_index.link_node(link))
                     if not node.activated:
                         # If the node has been deactivated, force deactivation
                         # of all plugs that are still active and propagate
@@ -992,9 +1218,10 @@ class Pipeline(Process):
                                 if debug:
                                     print >> debug, '%d=%s:%s' % (
                                         iteration, node.full_name, plug_name)
-                                for nn, pn, n, p, weak_link in plug.links_from.union(plug.links_to):
-                                    if p.activated:
-                                        new_nodes_to_check.add(n)
+                                for link in link_index.neighbour_links(plug):
+                                    if link_index.link_plug(link).activated:
+                                        new_nodes_to_check.add(
+                                            link_index.link_node(link))
             nodes_to_check = new_nodes_to_check
             iteration += 1
 
@@ -1017,21 +1244,278 @@ class Pipeline(Process):
                     node.process.user_traits_changed = True
 
         # Execute a callback for all links that have become active.
-        for node, source_plug_name, source_plug, n, pn, p in inactive_links:
-            if (source_plug.activated and p.activated):
+        for node, source_plug_name, source_plug, link in inactive_links:
+            if (source_plug.activated and
+                    link_index.link_plug(link).activated):
                 value = node.get_plug_value(source_plug_name)
-                node._callbacks[(source_plug_name, n, pn)](value)
+                node._callbacks[(source_plug_name,
+                                 link_index.link_node(link),
+                                 link_index.link_plug_name(link))](value)
 
-        # Refresh views relying on plugs and nodes selection
+        # Refresh views relying on plugs and nodes selection, and forget
+        # the workflow graphs
         for node in self.all_nodes():
             if isinstance(node, PipelineNode):
+                node.process._workflow_graphs = {}
                 node.process.selection_changed = True
+        self._invalidate_workflow_graphs()
 
         self._disable_update_nodes_and_plugs_activation -= 1
 
+    def _incremental_update_nodes_and_plugs_activation(self):
+        """ Update nodes and plugs activations around the changes recorded
+        since the last update (see :py:meth:`_set_activation_dirty`).
+
+        The result is the same as the one of a full update: the forward
+        activation is computed again for the nodes downstream the changes,
+        then the backward deactivation is propagated from the elements whose
+        forward activation or links have changed. If the top level pipeline
+        node activation changes, a full update is performed.
+        """
+        self._disable_update_nodes_and_plugs_activation += 1
+
+        dirty_units = self._activation_dirty_units
+        self._activation_dirty_units = set()
+        forward_activations = self._forward_activations
+        link_index = self._link_index
+        elements = self._activation_unit_elements
+        neighbours = self._activation_unit_neighbours
+
+        # Activations before the update, for all the elements that may be
+        # modified, and nodes of the saved plugs
+        old_activations = {}
+        plug_nodes = {}
+
+        def save_activations(unit):
+            node = self._activation_unit_node(unit)
+            for element in elements(unit):
+                if element not in old_activations:
+                    old_activations[element] = element.activated
+                    if isinstance(element, Plug):
+                        plug_nodes[element] = node
+
+        # Forward activation: only the units downstream the changes have to
+        # be evaluated again
+        cone = set(dirty_units)
+        units_to_check = list(dirty_units)
+        while units_to_check:
+            unit = units_to_check.pop()
+            for neighbour in neighbours(unit, downstream_only=True):
+                if neighbour not in cone:
+                    cone.add(neighbour)
+                    units_to_check.append(neighbour)
+        cone_nodes = set(unit for unit in cone if not isinstance(unit, Plug))
+        for unit in cone:
+            save_activations(unit)
+
+        # Plugs linked to the cone inputs get their forward activation back
+        boundary_plugs = []
+        for node in cone_nodes:
+            for plug in node.plugs.itervalues():
+                if plug.output:
+                    continue
+                for link in link_index.links_from_of(plug):
+                    n = link_index.link_node(link)
+                    p = link_index.link_plug(link)
+                    if self._activation_unit(n, p) not in cone:
+                        if p not in old_activations:
+                            old_activations[p] = p.activated
+                            plug_nodes[p] = n
+                        boundary_plugs.append(p)
+                        p.activated = forward_activations.get(p, False)
+        for unit in cone:
+            for element in elements(unit):
+                element.activated = False
+            if isinstance(unit, Plug) and unit.enabled:
+                # For the top-level pipeline node, all enabled plugs are
+                # activated
+                unit.activated = True
+        nodes_to_check = cone_nodes
+        while nodes_to_check:
+            new_nodes_to_check = set()
+            for node in nodes_to_check:
+                for plug_name, plug in self._check_local_node_activation(node):
+                    for link in link_index.neighbour_links(plug):
+                        n = link_index.link_node(link)
+                        if not link & 1 and n in cone_nodes \
+                                and link_index.link_plug(link).enabled:
+                            new_nodes_to_check.add(n)
+            nodes_to_check = new_nodes_to_check
+
+        # Record the new forward activations and the units where they have
+        # increased or decreased
+        increased_units = set()
+        decreased_units = set()
+        for unit in cone:
+            for element in elements(unit):
+                activated = element.activated
+                if activated != forward_activations.get(element, False):
+                    if activated:
+                        increased_units.add(unit)
+                    else:
+                        decreased_units.add(unit)
+                forward_activations[element] = activated
+        for plug in boundary_plugs:
+            plug.activated = old_activations[plug]
+
+        # Units that may be activated after the backward deactivation while
+        # they were not before: they are connected to a changed unit through
+        # units having elements activated by the forward pass but not
+        # activated before the update. Theses units restart from their
+        # forward activation, other ones from their previous activation.
+        def may_be_reactivated(unit):
+            for element in elements(unit):
+                if forward_activations.get(element, False) and \
+                        not old_activations.get(element, element.activated):
+                    return True
+            return False
+
+        reactivated_units = dirty_units | increased_units
+        units_to_check = list(reactivated_units)
+        while units_to_check:
+            unit = units_to_check.pop()
+            for neighbour in neighbours(unit):
+                if neighbour not in reactivated_units \
+                        and may_be_reactivated(neighbour):
+                    reactivated_units.add(neighbour)
+                    units_to_check.append(neighbour)
+        for unit in reactivated_units:
+            save_activations(unit)
+            for element in elements(unit):
+                element.activated = forward_activations.get(element, False)
+        for unit in cone.difference(reactivated_units):
+            for element in elements(unit):
+                element.activated = (old_activations[element]
+                                     and forward_activations[element])
+
+        # Backward deactivation: start from the changed units and their
+        # neighbours, and propagate deactivations
+        nodes_to_check = set()
+        for unit in reactivated_units:
+            nodes_to_check.add(self._activation_unit_node(unit))
+        for unit in decreased_units.union(dirty_units):
+            nodes_to_check.add(self._activation_unit_node(unit))
+            for neighbour in neighbours(unit):
+                nodes_to_check.add(self._activation_unit_node(neighbour))
+        while nodes_to_check:
+            new_nodes_to_check = set()
+            for node in nodes_to_check:
+                save_activations(node)
+                test = self._check_local_node_deactivation(node)
+                if test:
+                    for plug_name, plug in test:
+                        for link in link_index.neighbour_links(plug):
+                            if link_index.link_plug(link).activated:
+                                new_nodes_to_check.add(
+                                    link_index.link_node(link))
+                    if not node.activated:
+                        for plug_name, plug in node.plugs.iteritems():
+                            if plug.activated:
+                                plug.activated = False
+                                for link in link_index.neighbour_links(plug):
+                                    if link_index.link_plug(link).activated:
+                                        new_nodes_to_check.add(
+                                            link_index.link_node(link))
+            nodes_to_check = new_nodes_to_check
+
+        self._disable_update_nodes_and_plugs_activation -= 1
+        if not self.pipeline_node.activated:
+            # The whole pipeline has been deactivated: this cannot be
+            # handled locally
+            for element, activated in old_activations.iteritems():
+                element.activated = activated
+            self._full_update_nodes_and_plugs_activation()
+            return
+
+        self._disable_update_nodes_and_plugs_activation += 1
+
+        # Nodes that have at least one activation change, and source nodes of
+        # links that may have become active, in the same order as in a full
+        # update
+        changed_nodes = set()
+        callback_nodes = set()
+        for element, activated in old_activations.iteritems():
+            if element.activated == activated:
+                continue
+            if isinstance(element, Plug):
+                node = plug_nodes[element]
+                changed_nodes.add(node)
+                if element.activated:
+                    callback_nodes.add(node)
+                    for link in link_index.links_from_of(element):
+                        callback_nodes.add(link_index.link_node(link))
+            else:
+                changed_nodes.add(element)
+        ordered_nodes = [node for node in self.all_nodes()
+                         if node in changed_nodes or node in callback_nodes]
+
+        # Update processes to hide or show their traits according to the
+        # corresponding plug activation
+        for node in ordered_nodes:
+            if isinstance(node, ProcessNode) and node in changed_nodes:
+                traits_changed = False
+                for plug_name, plug in node.plugs.iteritems():
+                    trait = node.process.trait(plug_name)
+                    if plug.activated:
+                        if getattr(trait, "hidden", False):
+                            trait.hidden = False
+                            traits_changed = True
+                    else:
+                        if not getattr(trait, "hidden", False):
+                            trait.hidden = True
+                            traits_changed = True
+                if traits_changed:
+                    node.process.user_traits_changed = True
+
+        # Execute a callback for all links that have become active.
+        activated_links = []
+        for node in ordered_nodes:
+            if node not in callback_nodes:
+                continue
+            for source_plug_name, source_plug in node.plugs.iteritems():
+                if not source_plug.activated:
+                    continue
+                for link in link_index.links_to_of(source_plug):
+                    p = link_index.link_plug(link)
+                    if p.activated and not (
+                            old_activations.get(source_plug, True) and
+                            old_activations.get(p, True)):
+                        activated_links.append(
+                            (node, source_plug_name,
+                             link_index.link_node(link),
+                             link_index.link_plug_name(link)))
+        for node, source_plug_name, n, pn in activated_links:
+            value = node.get_plug_value(source_plug_name)
+            node._callbacks[(source_plug_name, n, pn)](value)
+
+        # Refresh views relying on plugs and nodes selection, and forget
+        # the workflow graphs
+        changed_pipelines = set(node.pipeline for node in changed_nodes)
+        for pipeline in changed_pipelines:
+            pipeline._invalidate_workflow_graphs()
+        changed_pipelines.add(self)
+        for node in self.all_nodes():
+            if isinstance(node, PipelineNode) and \
+                    node.process in changed_pipelines:
+                node.process.selection_changed = True
+
+        self._disable_update_nodes_and_plugs_activation -= 1
+
+    def _invalidate_workflow_graphs(self):
+        """ Forget the workflow graphs of this pipeline and of its parent
+        pipelines.
+        """
+        pipeline = self
+        while pipeline is not None:
+            pipeline._workflow_graphs = {}
+            pipeline = pipeline.parent_pipeline
+
     def workflow_graph(self, remove_disabled_steps=True):
         """ Generate a workflow graph
 
+        The graph is kept until the nodes activations, the enabled steps or
+        the pipeline links change, and must not be modified.
+
         Returns
         -------
         graph: topological_sort.Graph
@@ -1042,6 +1526,32 @@ class Pipeline(Process):
             in the workflow graph.
             Default: True
         """
+        disabled_steps = ()
+        if remove_disabled_steps:
+            steps = getattr(self, 'pipeline_steps', Controller())
+            disabled_steps = tuple(
+                step for step in steps.user_traits()
+                if not getattr(steps, step))
+        graph = self._workflow_graphs.get(disabled_steps)
+        if graph is None:
+            graph = self._build_workflow_graph(disabled_steps)
+            self._workflow_graphs[disabled_steps] = graph
+        return graph
+
+    def _build_workflow_graph(self, disabled_steps):
+        """ Generate a workflow graph.
+
+        Parameters
+        ----------
+        disabled_steps: sequence
+            the disabled steps whose nodes are not included in the graph.
+
+        Returns
+        -------
+        graph: topological_sort.Graph
+            graph representation of the workflow from the current state of
+            the pipeline
+        """
 
         def insert(pipeline, node_name, plug, dependencies):
             """ Browse the plug links and add the correspondings edges
@@ -1049,8 +1559,9 @@ class Pipeline(Process):
             """
 
             # Main loop
-            for (dest_node_name, dest_plug_name, dest_node, dest_plug,
-                 weak_link) in plug.links_to:
+            for link in link_index.links_to_of(plug):
+                dest_node = link_index.link_node(link)
+                dest_node_name = dest_node.name
 
                 # Ignore the link if it is pointing to a node in a
                 # sub-pipeline or in the parent pipeline
@@ -1072,14 +1583,13 @@ class Pipeline(Process):
         # Create a graph and a list of graph node edges
         graph = Graph()
         dependencies = set()
+        link_index = self._link_index
 
-        if remove_disabled_steps:
-            steps = getattr(self, 'pipeline_steps', Controller())
-            disabled_nodes = set()
-            for step, trait in steps.user_traits().iteritems():
-                if not getattr(steps, step):
-                    disabled_nodes.update(
-                        [self.nodes[node] for node in trait.nodes])
+        disabled_nodes = set()
+        for step in disabled_steps:
+            disabled_nodes.update(
+                [self.nodes[node]
+                 for node in self.pipeline_steps.trait(step).nodes])
 
         # Add activated Process nodes in the graph
         for node_name, node in self.nodes.iteritems():
@@ -1090,8 +1600,7 @@ class Pipeline(Process):
 
             # Select only active Process nodes
             if node.activated and not isinstance(node, Switch) \
-                    and (not remove_disabled_steps
-                         or node not in disabled_nodes):
+                    and node not in disabled_nodes:
 
                 # If a Pipeline is found: the meta graph node parameter
                 # contains a sub Graph
@@ -1134,6 +1643,12 @@ class Pipeline(Process):
         # Create a graph and a list of graph node edges
         graph = self.workflow_graph(remove_disabled_steps)
 
+        # Reuse the workflow of an unchanged graph
+        cached = self._workflow_lists.get(remove_disabled_steps)
+        if cached is not None and cached[0] is graph:
+            self.workflow_repr = cached[1]
+            return list(cached[2])
+
         # Start the topologival sort
         ordered_list = graph.topological_sort()
 
@@ -1160,7 +1675,53 @@ class Pipeline(Process):
         # Generate the final workflow by flattenin graphs structures
         workflow_list = []
         walk_workflow(ordered_list, workflow_list)
+        self._workflow_lists[remove_disabled_steps] = (
+            graph, self.workflow_repr, workflow_list)
+
+        return list(workflow_list)
+
+    def workflow_nodes_dependencies(self, remove_disabled_steps=True):
+        """ Generate a workflow: list of process nodes to execute, with the
+        nodes that have to be executed before each of them.
+
+        The nodes of a sub-pipeline depend on all the nodes their pipeline
+        depends on.
+
+        Parameters
+        ----------
+        remove_disabled_steps: bool (optional)
+            When set, disabled steps (and their children) will not be included
+            in the workflow graph.
+            Default: True
+
+        Returns
+        -------
+        workflow_list: list of tuple
+            an ordered list of (node, dependencies) where dependencies is the
+            set of nodes that have to be executed before node
+        """
+        def walk_workflow(graph, dependencies, workflow_list):
+            """ Recursive fonction to go through pipelines' graphs. Returns
+            all the process nodes of the graph.
+            """
+            graph_nodes = {}
+            for name, meta in graph.topological_sort():
+                node_dependencies = set(dependencies)
+                for pnode in graph.find_node(name).links_from:
+                    node_dependencies.update(graph_nodes[pnode.name])
+                if isinstance(meta, list):
+                    graph_nodes[name] = meta
+                    workflow_list.extend(
+                        (node, node_dependencies) for node in meta)
+                else:
+                    graph_nodes[name] = walk_workflow(
+                        meta, node_dependencies, workflow_list)
+            return [node for nodes in graph_nodes.itervalues()
+                    for node in nodes]
 
+        workflow_list = []
+        walk_workflow(self.workflow_graph(remove_disabled_steps), set(),
+                      workflow_list)
         return workflow_list
 
     def _run_process(self):
@@ -1200,6 +1761,7 @@ class Pipeline(Process):
             optional
         """
         empty_params = []
+        link_index = self._link_index
         # walk all activated nodes, recursively
         nodes = [(node_name, node) \
             for node_name, node in self.nodes.iteritems() \
@@ -1231,17 +1793,24 @@ class Pipeline(Process):
                     continue # non-null value: not an empty parameter.
                 optional = bool(parameter.optional)
                 valid = True
-                links = list(plug.links_from.union(plug.links_to))
+                # links are recorded with the node they are seen from
+                links = [(node, link)
+                         for link in link_index.neighbour_links(plug)]
                 if len(links) == 0:
                     if optional:
                         # an optional, non-connected output can stay empty
                         continue
                 # check where this plug is linked
                 while links:
-                    link = links.pop(0)
-                    oplug = link[3]
-                    if link[0] == '':
-                        if link[2] == self.nodes['']:
+                    lnode, link = links.pop(0)
+                    onode = link_index.link_node(link)
+                    oplug = link_index.link_plug(link)
+                    # the linked node is the pipeline node of the pipeline
+                    # the link belongs to
+                    if isinstance(onode, PipelineNode) and (
+                            onode is lnode or
+                            lnode.pipeline is onode.process):
+                        if onode is self.pipeline_node:
                             # linked to the main node: keep it as is
                             valid = False
                             break
@@ -1249,7 +1818,8 @@ class Pipeline(Process):
                         # needed only if this pipeline plug is used later,
                         # or mandatory
                         if oplug.optional:
-                            links += oplug.links_to
+                            links += [(onode, olink) for olink
+                                      in link_index.links_to_of(oplug)]
                     optional &= bool(oplug.optional)
                 if valid:
                     empty_params.append((node, plug_name, optional))
@@ -1634,12 +2204,14 @@ class Pipeline(Process):
         trait = self.pipeline_steps.trait(step_name)
         trait.nodes = nodes
         setattr(self.pipeline_steps, step_name, True)
+        self._invalidate_workflow_graphs()
 
     def remove_pipeline_step(self, step_name):
         '''Remove the given step
         '''
         if self.user_traits().has_key('pipeline_steps'):
             self.pipeline_steps.remove_trait(step_name)
+            self._invalidate_workflow_graphs()
 
     def disabled_pipeline_steps_nodes(self):
         '''List nodes disabled for runtime execution
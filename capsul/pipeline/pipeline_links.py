@@ -0,0 +1,349 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import logging
+from array import array
+from itertools import chain
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+
+class LinkIndex(object):
+    """ Compact index of the links between the plugs of a pipeline.
+
+    Nodes and plugs are given integer identifiers and the links are stored
+    in array-backed adjacency lists, where each item encodes the linked plug
+    identifier and the weak link flag. This structure is kept in sync by
+    :py:meth:`Pipeline.add_link <capsul.pipeline.pipeline.Pipeline.add_link>`
+    and :py:meth:`Pipeline.remove_link
+    <capsul.pipeline.pipeline.Pipeline.remove_link>` and is shared by a
+    pipeline and all its sub-pipelines, so that the pipeline graph can be
+    traversed without building links sets or tuples at each step.
+
+    The plugs `links_to` and `links_from` sets are still available, and read
+    by the GUI, XML and workflow code: the index does not replace them, it
+    speeds up the traversals and uses some additional memory. The adjacency
+    array of a plug is only allocated for its first link in each direction.
+
+    Attributes
+    ----------
+    nodes : list
+        the indexed nodes, by node identifier
+    plugs : list
+        the indexed plugs, by plug identifier
+    plug_names : list
+        the names of the indexed plugs in their node, by plug identifier
+    plug_nodes : array
+        the node identifier of each plug
+    links_to : list of array
+        the successors of each plug (an empty tuple if it has none)
+    links_from : list of array
+        the predecessors of each plug (an empty tuple if it has none)
+    in_degree : array
+        the number of links coming to each node
+    out_degree : array
+        the number of links leaving each node
+
+    Methods
+    -------
+    add_link
+    remove_link
+    links_to_of
+    links_from_of
+    neighbour_links
+    link_node
+    link_plug
+    link_plug_name
+    is_weak
+    successors
+    predecessors
+    neighbours
+    node_degree
+    merge
+    """
+
+    def __init__(self):
+        """ Create an empty links index.
+        """
+        self._node_ids = {}
+        self._plug_ids = {}
+        self.nodes = []
+        self.plugs = []
+        self.plug_names = []
+        self.plug_nodes = array("l")
+        self.links_to = []
+        self.links_from = []
+        self.in_degree = array("l")
+        self.out_degree = array("l")
+        # The indexed links as (source_id, encoded destination) pairs
+        self._links = set()
+
+    def _get_plug_id(self, node, plug_name, plug):
+        """ Get the identifier of a plug, registering the plug and its node
+        if needed.
+        """
+        plug_id = self._plug_ids.get(plug)
+        if plug_id is None:
+            node_id = self._node_ids.get(node)
+            if node_id is None:
+                node_id = len(self.nodes)
+                self._node_ids[node] = node_id
+                self.nodes.append(node)
+                self.in_degree.append(0)
+                self.out_degree.append(0)
+            plug_id = len(self.plugs)
+            self._plug_ids[plug] = plug_id
+            self.plugs.append(plug)
+            self.plug_names.append(plug_name)
+            self.plug_nodes.append(node_id)
+            self.links_to.append(())
+            self.links_from.append(())
+        return plug_id
+
+    def add_link(self, source_node, source_plug_name, source_plug, dest_node,
+                 dest_plug_name, dest_plug, weak_link=False):
+        """ Index a link between two plugs.
+
+        Parameters
+        ----------
+        source_node: Node (mandatory)
+            the node of the link source plug
+        source_plug_name: str (mandatory)
+            the name of the source plug
+        source_plug: Plug (mandatory)
+            the source plug
+        dest_node: Node (mandatory)
+            the node of the link destination plug
+        dest_plug_name: str (mandatory)
+            the name of the destination plug
+        dest_plug: Plug (mandatory)
+            the destination plug
+        weak_link: bool (optional)
+            the weak link flag
+        """
+        source_id = self._get_plug_id(source_node, source_plug_name,
+                                      source_plug)
+        dest_id = self._get_plug_id(dest_node, dest_plug_name, dest_plug)
+        weak_link = int(bool(weak_link))
+        link = (source_id, dest_id << 1 | weak_link)
+        if link in self._links:
+            return
+        self._links.add(link)
+        links_to = self.links_to[source_id]
+        if not links_to:
+            links_to = self.links_to[source_id] = array("l")
+        links_from = self.links_from[dest_id]
+        if not links_from:
+            links_from = self.links_from[dest_id] = array("l")
+        links_to.append(dest_id << 1 | weak_link)
+        links_from.append(source_id << 1 | weak_link)
+        self.out_degree[self.plug_nodes[source_id]] += 1
+        self.in_degree[self.plug_nodes[dest_id]] += 1
+
+    def remove_link(self, source_plug, dest_plug):
+        """ Remove the weak and non weak links between two plugs from the
+        index.
+
+        Parameters
+        ----------
+        source_plug: Plug (mandatory)
+            the link source plug
+        dest_plug: Plug (mandatory)
+            the link destination plug
+        """
+        source_id = self._plug_ids.get(source_plug)
+        dest_id = self._plug_ids.get(dest_plug)
+        if source_id is None or dest_id is None:
+            return
+        links_to = self.links_to[source_id]
+        links_from = self.links_from[dest_id]
+        for weak_link in (0, 1):
+            link = (source_id, dest_id << 1 | weak_link)
+            if link in self._links:
+                self._links.remove(link)
+                links_to.remove(dest_id << 1 | weak_link)
+                links_from.remove(source_id << 1 | weak_link)
+                self.out_degree[self.plug_nodes[source_id]] -= 1
+                self.in_degree[self.plug_nodes[dest_id]] -= 1
+
+    def links_to_of(self, plug):
+        """ Get the encoded links leaving a plug.
+
+        Parameters
+        ----------
+        plug: Plug (mandatory)
+            a plug
+
+        Returns
+        -------
+        links: array
+            the encoded links, to be decoded with :py:meth:`link_node`,
+            :py:meth:`link_plug`, :py:meth:`link_plug_name` and
+            :py:meth:`is_weak`
+        """
+        plug_id = self._plug_ids.get(plug)
+        if plug_id is None:
+            return ()
+        return self.links_to[plug_id]
+
+    def links_from_of(self, plug):
+        """ Get the encoded links coming to a plug.
+
+        Parameters
+        ----------
+        plug: Plug (mandatory)
+            a plug
+
+        Returns
+        -------
+        links: array
+            the encoded links (see :py:meth:`links_to_of`)
+        """
+        plug_id = self._plug_ids.get(plug)
+        if plug_id is None:
+            return ()
+        return self.links_from[plug_id]
+
+    def neighbour_links(self, plug):
+        """ Iterate over the encoded links leaving, then coming to a plug.
+
+        Parameters
+        ----------
+        plug: Plug (mandatory)
+            a plug
+
+        Returns
+        -------
+        links: iterator
+            the encoded links (see :py:meth:`links_to_of`)
+        """
+        plug_id = self._plug_ids.get(plug)
+        if plug_id is None:
+            return iter(())
+        return chain(self.links_to[plug_id], self.links_from[plug_id])
+
+    def link_node(self, link):
+        """ Get the node of the plug an encoded link points to.
+        """
+        return self.nodes[self.plug_nodes[link >> 1]]
+
+    def link_plug(self, link):
+        """ Get the plug an encoded link points to.
+        """
+        return self.plugs[link >> 1]
+
+    def link_plug_name(self, link):
+        """ Get the name of the plug an encoded link points to.
+        """
+        return self.plug_names[link >> 1]
+
+    @staticmethod
+    def is_weak(link):
+        """ Get the weak link flag of an encoded link.
+        """
+        return bool(link & 1)
+
+    def _iter_links(self, links):
+        """ Iterate over encoded links.
+        """
+        for link in links:
+            plug_id = link >> 1
+            yield (self.nodes[self.plug_nodes[plug_id]],
+                   self.plug_names[plug_id], self.plugs[plug_id],
+                   bool(link & 1))
+
+    def successors(self, plug):
+        """ Iterate over the plugs a plug is linked to.
+
+        Parameters
+        ----------
+        plug: Plug (mandatory)
+            a plug
+
+        Returns
+        -------
+        links: generator of tuple
+            (node, plug_name, plug, weak_link) for each linked plug
+        """
+        plug_id = self._plug_ids.get(plug)
+        if plug_id is None:
+            return iter(())
+        return self._iter_links(self.links_to[plug_id])
+
+    def predecessors(self, plug):
+        """ Iterate over the plugs linked to a plug.
+
+        Parameters
+        ----------
+        plug: Plug (mandatory)
+            a plug
+
+        Returns
+        -------
+        links: generator of tuple
+            (node, plug_name, plug, weak_link) for each linked plug
+        """
+        plug_id = self._plug_ids.get(plug)
+        if plug_id is None:
+            return iter(())
+        return self._iter_links(self.links_from[plug_id])
+
+    def neighbours(self, plug):
+        """ Iterate over the successors, then the predecessors of a plug.
+
+        Parameters
+        ----------
+        plug: Plug (mandatory)
+            a plug
+
+        Returns
+        -------
+        links: generator of tuple
+            (node, plug_name, plug, weak_link) for each linked plug
+        """
+        return self._iter_links(self.neighbour_links(plug))
+
+    def node_degree(self, node):
+        """ Get the number of links coming to and leaving a node.
+
+        Parameters
+        ----------
+        node: Node (mandatory)
+            a node
+
+        Returns
+        -------
+        degree: tuple
+            (in_degree, out_degree)
+        """
+        node_id = self._node_ids.get(node)
+        if node_id is None:
+            return 0, 0
+        return self.in_degree[node_id], self.out_degree[node_id]
+
+    def merge(self, other):
+        """ Add all the links of another index to this one.
+
+        Parameters
+        ----------
+        other: LinkIndex (mandatory)
+            the index to merge
+        """
+        for source_id, links_to in enumerate(other.links_to):
+            source_node = other.nodes[other.plug_nodes[source_id]]
+            for link in links_to:
+                dest_id = link >> 1
+                self.add_link(
+                    source_node, other.plug_names[source_id],
+                    other.plugs[source_id],
+                    other.nodes[other.plug_nodes[dest_id]],
+                    other.plug_names[dest_id], other.plugs[dest_id],
+                    link & 1)
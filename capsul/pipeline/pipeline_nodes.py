@@ -155,11 +155,12 @@ class Node(Controller):
             # update plugs list
             self.plugs[plug_name] = plug
             # add an event on plug to validate the pipeline
-            plug.on_trait_change(pipeline.update_nodes_and_plugs_activation,
-                                 "enabled")
+            plug.on_trait_change(
+                SomaPartial(pipeline._activation_changed, self, plug),
+                "enabled")
 
         # add an event on the Node instance traits to validate the pipeline
-        self.on_trait_change(pipeline.update_nodes_and_plugs_activation,
+        self.on_trait_change(SomaPartial(pipeline._activation_changed, self),
                              "enabled")
 
     @property
@@ -369,6 +370,9 @@ class ProcessNode(Node):
     ----------
     process : process instance
         the process instance stored in the pipeline node
+    requirements : dict
+        the resources needed by the node execution overriding those
+        declared by the process (see Process.requirements)
 
     Methods
     -------
@@ -376,6 +380,7 @@ class ProcessNode(Node):
     get_plug_value
     set_plug_value
     get_trait
+    get_requirements
     """
     def __init__(self, pipeline, name, process, **kwargs):
         """ Generate a ProcessNode
@@ -393,6 +398,7 @@ class ProcessNode(Node):
         """
         self.process = process
         self.kwargs = kwargs
+        self.requirements = {}
         inputs = []
         outputs = []
         for parameter, trait in self.process.user_traits().iteritems():
@@ -467,6 +473,19 @@ class ProcessNode(Node):
             value = Undefined
         setattr(self.process, plug_name, value)
 
+    def get_requirements(self):
+        """ Return the resources needed by the node execution
+
+        Returns
+        -------
+        requirements: dict
+            the process requirements (see Process.get_requirements) updated
+            with the node requirements
+        """
+        requirements = self.process.get_requirements()
+        requirements.update(self.requirements)
+        return requirements
+
     def get_trait(self, trait_name):
         """ Return the desired trait
 
@@ -648,7 +667,7 @@ class Switch(Node):
             self.plugs[plug_name].enabled = True
 
         # refresh the pipeline
-        self.pipeline.update_nodes_and_plugs_activation()
+        self.pipeline._activation_changed(self)
 
         # Refresh the links to the output plugs
         for output_plug_name in self._outputs:
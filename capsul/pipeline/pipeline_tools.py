@@ -8,9 +8,12 @@
 
 # System import
 import os
+import json
+import hashlib
 import logging
 import tempfile
 import subprocess
+from collections import deque
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -23,6 +26,9 @@ except ImportError:
 
 # Capsul import
 from capsul.pipeline import Pipeline, PipelineNode, Switch
+from capsul.pipeline.topological_sort import Graph
+from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.process.runtime_history import process_input_size
 from soma.controller import Controller
 
 
@@ -688,9 +694,9 @@ def where_is_plug_value_from(plug, recursive=True):
         origin node is in a runtime pipeline step, which only records top-level
         nodes.
     '''
-    links = [link + (None, ) for link in plug.links_from]
+    links = deque((link, None) for link in plug.links_from)
     while links:
-        node_name, param_name, node, in_plug, weak, parent = links.pop(0)
+        (node_name, param_name, node, in_plug, weak), parent = links.popleft()
         if not node.activated or not node.enabled:
             # disabled nodes are not influencing
             continue
@@ -699,7 +705,7 @@ def where_is_plug_value_from(plug, recursive=True):
             switch_value = node.switch
             switch_input = '%s_switch_%s' % (switch_value, param_name)
             in_plug = node.plugs[switch_input]
-            links += [link + (parent, ) for link in in_plug.links_from]
+            links.extend((link, parent) for link in in_plug.links_from)
         elif recursive and isinstance(node, PipelineNode):
             # either output from a sibling sub_pipeline
             # or input from parent pipeline
@@ -710,7 +716,7 @@ def where_is_plug_value_from(plug, recursive=True):
                 new_parent = node
             else:
                 new_parent = parent
-            links += [link + (new_parent, ) for link in in_plug.links_from]
+            links.extend((link, new_parent) for link in in_plug.links_from)
         else:
             # output of a process: found it
             # in non-recursive mode, a pipeline is regarded as a process.
@@ -948,3 +954,230 @@ def create_output_directories(process):
         if not os.path.exists(directory):
             os.makedirs(directory)
 
+
+def _node_duration(node, durations):
+    '''
+    Get the estimated duration of a process node, indexed by node, by node
+    name or by process id in a durations dict, None if not found.
+    '''
+    duration = durations.get(node)
+    if duration is None:
+        duration = durations.get(node.name)
+    if duration is None:
+        duration = durations.get(node.process.id)
+    return duration
+
+
+def nodes_bottom_levels(graph, durations=None):
+    '''
+    Compute the bottom level of each process node of a pipeline workflow
+    graph: the estimated duration of the longest chain of processes starting
+    with the node, up to the end of the whole workflow.
+
+    Sub-pipelines graphs are analysed recursively: the bottom level of a
+    sub-pipeline node includes the longest path following its pipeline.
+
+    Parameters
+    ----------
+    graph: Graph (mandatory)
+        a workflow graph, as returned by Pipeline.workflow_graph()
+    durations: dict (optional)
+        estimated duration of the processes, indexed by node, by node name
+        or by process id (see :py:func:`nodes_estimated_durations`).
+        Processes without estimate get the mean of the given durations, and
+        each process has a duration of 1 if no duration is given.
+
+    Returns
+    -------
+    bottom_levels: dict
+        the bottom level of each process node {node: bottom_level}.
+    '''
+    durations = durations or {}
+    default_duration = 1.
+    if durations:
+        default_duration = float(sum(durations.itervalues())) / len(durations)
+    graph_lengths = {}
+
+    def node_duration(node):
+        duration = _node_duration(node, durations)
+        if duration is None:
+            return default_duration
+        return duration
+
+    def cost(name, meta):
+        if isinstance(meta, Graph):
+            if meta not in graph_lengths:
+                graph_lengths[meta] = meta.critical_path(cost)[1]
+            return graph_lengths[meta]
+        return sum(node_duration(node) for node in meta)
+
+    def walk_graph(graph, offset, bottom_levels):
+        for name, bottom_level in graph.bottom_levels(cost).iteritems():
+            meta = graph.find_node(name).meta
+            if isinstance(meta, Graph):
+                walk_graph(meta, offset + bottom_level - cost(name, meta),
+                           bottom_levels)
+            else:
+                for node in meta:
+                    bottom_levels[node] = offset + bottom_level
+
+    bottom_levels = {}
+    walk_graph(graph, 0., bottom_levels)
+    return bottom_levels
+
+
+def critical_path_priorities(graph, durations=None):
+    '''
+    Rank the process nodes of a pipeline workflow graph according to their
+    bottom levels (see :py:func:`nodes_bottom_levels`): the nodes on the
+    critical path get the highest priorities.
+
+    Parameters
+    ----------
+    graph: Graph (mandatory)
+        a workflow graph, as returned by Pipeline.workflow_graph()
+    durations: dict (optional)
+        estimated duration of the processes, indexed by node, by node name or
+        by process id.
+
+    Returns
+    -------
+    priorities: dict
+        the priority of each process node {node: priority}, from 0 for the
+        nodes with the shortest bottom level.
+    '''
+    bottom_levels = nodes_bottom_levels(graph, durations)
+    ranks = dict((bottom_level, rank) for rank, bottom_level
+                 in enumerate(sorted(set(bottom_levels.itervalues()))))
+    return dict((node, ranks[bottom_level])
+                for node, bottom_level in bottom_levels.iteritems())
+
+
+def nodes_estimated_durations(pipeline, history):
+    '''
+    Estimate the duration of the process nodes of a pipeline from their
+    recorded executions.
+
+    The size of the existing input files of each node is used to select
+    the executions of its process on inputs of similar sizes. Nodes whose
+    process has never been executed are not estimated.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline to estimate
+    history: RuntimeHistory (mandatory)
+        the recorded executions
+        (see :py:class:`capsul.process.runtime_history.RuntimeHistory`)
+
+    Returns
+    -------
+    durations: dict
+        the estimated duration in seconds of the process nodes
+        {node: duration}, suitable for :py:func:`critical_path_priorities`.
+    '''
+    durations = {}
+    for node in pipeline.workflow_ordered_nodes():
+        duration = history.estimate_duration(
+            node.process.id, process_input_size(node.process))
+        if duration is not None:
+            durations[node] = duration
+    return durations
+
+
+def cheap_nodes(pipeline, max_duration, durations=None):
+    '''
+    Find the process nodes of a pipeline whose estimated duration is below
+    a threshold.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline to analyse
+    max_duration: float (mandatory)
+        the duration threshold in seconds
+    durations: dict (optional)
+        estimated duration of the processes, indexed by node, by node name or
+        by process id. Processes without estimate are estimated from their
+        walltime requirement.
+
+    Returns
+    -------
+    nodes: set
+        the process nodes estimated to last at most max_duration. Nodes
+        without any estimate are not included.
+    '''
+    durations = durations or {}
+    nodes = set()
+    for node in pipeline.workflow_ordered_nodes():
+        duration = _node_duration(node, durations)
+        if duration is None:
+            duration = node.get_requirements()["walltime"]
+        if duration is not None and duration <= max_duration:
+            nodes.add(node)
+    return nodes
+
+
+def _structure_description(pipeline, prefix, description):
+    '''
+    Append the structure of a pipeline and of its sub-pipelines to a list
+    of json-compatible items.
+    '''
+    steps = getattr(pipeline, 'pipeline_steps', None)
+    if steps is not None:
+        description.append(
+            [prefix, 'steps',
+             sorted((step, bool(getattr(steps, step)))
+                    for step in steps.user_traits())])
+    for node_name in sorted(pipeline.nodes):
+        node = pipeline.nodes[node_name]
+        node_path = prefix + [node_name]
+        node_description = [node_path, node.__class__.__name__,
+                            node.enabled, node.activated]
+        if isinstance(node, Switch):
+            node_description.append(node.switch)
+        elif hasattr(node, 'process'):
+            process = node.process
+            node_description.append(process.id)
+            if isinstance(process, ProcessIteration):
+                node_description += [process.process.id,
+                                     sorted(process.iterative_parameters)]
+        plugs = []
+        for plug_name in sorted(node.plugs):
+            plug = node.plugs[plug_name]
+            plugs.append([plug_name, plug.enabled, plug.activated,
+                          sorted([dest_node_name, dest_plug_name, weak_link]
+                                 for dest_node_name, dest_plug_name,
+                                 dest_node, dest_plug, weak_link
+                                 in plug.links_to)])
+        node_description.append(plugs)
+        description.append(node_description)
+        if node_name != '' and isinstance(node, PipelineNode):
+            _structure_description(node.process, node_path, description)
+
+
+def structural_fingerprint(pipeline):
+    '''
+    Compute a fingerprint of the structure of a pipeline, independent of its
+    parameters values.
+
+    The fingerprint covers the nodes and their processes, the links, the
+    nodes and plugs activations, the switches selections and the enabled
+    steps, of the pipeline and of its sub-pipelines. Two pipelines with the
+    same fingerprint produce the same workflow graph, so that the analysis
+    of this graph can be shared (see
+    :py:func:`capsul.pipeline.pipeline_workflow.workflow_from_pipeline`).
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the pipeline to describe
+
+    Returns
+    -------
+    fingerprint: str
+        the md5 hex digest of the pipeline structure.
+    '''
+    description = [pipeline.id]
+    _structure_description(pipeline, [], description)
+    return hashlib.md5(json.dumps(description)).hexdigest()
@@ -13,48 +13,382 @@ A single available function:
 workflow = workflow_from_pipeline(pipeline)
 """
 import os
+import json
 import socket
+import tempfile
+from collections import deque
 
-import soma_workflow.client as swclient
-
-from capsul.pipeline import Pipeline, Switch
+from capsul.pipeline import Pipeline, PipelineNode, Switch
 from capsul.pipeline import pipeline_tools
+from capsul.pipeline.process_iteration import ProcessIteration
 from capsul.process import Process
+from capsul.process.runtime_history import get_runtime_history
+from capsul.study_config.memory import get_argument_hash
 from capsul.pipeline.topological_sort import Graph
+from capsul.utils.lazy_import import lazy_import
 from traits.api import Directory, Undefined, File, Str, Any
 from soma.sorted_dictionary import OrderedDict
 
+# soma-workflow is only imported when a workflow is built
+swclient = lazy_import("soma_workflow.client")
 
-def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
-                           jobs_priority=0, create_directories=True):
-    """ Create a soma-workflow workflow from a Capsul Pipeline
+
+def _walltime(seconds):
+    """ Format a duration in seconds as hours:minutes:seconds.
+    """
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
+
+
+def pbs_native_specification(requirements):
+    """ Translate process requirements into a PBS/Torque native
+    specification.
 
     Parameters
     ----------
-    pipeline: Pipeline (mandatory)
-        a CAPSUL pipeline
-    study_config: StudyConfig (optional), or dict
-        holds information about file transfers and shared resource paths.
-        If not specified, no translation/transfers will be used.
-    disabled_nodes: sequence of pipeline nodes (Node instances) (optional)
-        such nodes will be disabled on-the-fly in the pipeline, file transfers
-        will be adapted accordingly (outputs may become inputs in the resulting
-        workflow), and temporary files will be checked. If a disabled node was
-        to produce a temporary files which is still used in an enabled node,
-        then a ValueError exception will be raised.
-        If disabled_nodes is not passed, they will possibly be taken from the
-        pipeline (if available) using disabled steps:
-        see Pipeline.define_steps()
-    jobs_priority: int (optional, default: 0)
-        set this priority on soma-workflow jobs.
-    create_directories: bool (optional, default: True)
-        if set, needed output directories (which will contain output files)
-        will be created in a first job, which all other ones depend on.
+    requirements: dict (mandatory)
+        the process requirements (see Process.get_requirements)
 
     Returns
     -------
-    workflow: Workflow
-        a soma-workflow workflow
+    native_specification: str
+        the resources options, None if nothing is required.
+    """
+    resources = []
+    if requirements.get("cpu") and requirements["cpu"] > 1:
+        resources.append("nodes=1:ppn=%d" % requirements["cpu"])
+    if requirements.get("memory"):
+        resources.append("mem=%dmb" % requirements["memory"])
+    if requirements.get("walltime"):
+        resources.append("walltime=%s" % _walltime(requirements["walltime"]))
+    if not resources:
+        return None
+    return "-l " + ",".join(resources)
+
+
+def slurm_native_specification(requirements):
+    """ Translate process requirements into a SLURM native specification.
+
+    Parameters
+    ----------
+    requirements: dict (mandatory)
+        the process requirements (see Process.get_requirements)
+
+    Returns
+    -------
+    native_specification: str
+        the resources options, None if nothing is required.
+    """
+    options = []
+    if requirements.get("cpu") and requirements["cpu"] > 1:
+        options.append("--cpus-per-task=%d" % requirements["cpu"])
+    if requirements.get("memory"):
+        options.append("--mem=%dM" % requirements["memory"])
+    if requirements.get("walltime"):
+        options.append("--time=%s" % _walltime(requirements["walltime"]))
+    if not options:
+        return None
+    return " ".join(options)
+
+
+# The translations of the process requirements into the native
+# specification of the jobs, indexed by scheduler type
+NATIVE_SPECIFICATION_FORMATS = {
+    "pbs": pbs_native_specification,
+    "slurm": slurm_native_specification,
+}
+
+
+# Python code running the python commands of several processes one after
+# the other: the command line arguments of each process are preceded by
+# their number and by the python code of the process command
+_BATCH_CODE = (
+    "import sys\n"
+    "args = sys.argv[1:]\n"
+    "while args:\n"
+    "    size = int(args[0])\n"
+    "    code = args[1]\n"
+    "    sys.argv = [sys.argv[0]] + args[2:2 + size]\n"
+    "    args = args[2 + size:]\n"
+    "    exec(code, {\"__name__\": \"__main__\"})\n")
+
+# Python code creating directories, given on the command line or listed
+# in a json file by subtrees: [[root, [relative paths]], ...]. The json
+# file is removed once the directories are created.
+_DIRECTORIES_CODE = (
+    "import errno, json, os, sys\n"
+    "args = sys.argv[1:]\n"
+    "subtrees = []\n"
+    "list_file = None\n"
+    "if args[:1] == [\"-f\"]:\n"
+    "    list_file = args[1]\n"
+    "    with open(list_file) as f:\n"
+    "        subtrees = json.load(f)\n"
+    "    args = args[2:]\n"
+    "subtrees.append([\"\", args])\n"
+    "for root, paths in subtrees:\n"
+    "    for path in [root] + [os.path.join(root, p) for p in paths]:\n"
+    "        if path and not os.path.isdir(path):\n"
+    "            try:\n"
+    "                os.makedirs(path)\n"
+    "            except OSError as e:\n"
+    "                if e.errno != errno.EEXIST:\n"
+    "                    raise\n"
+    "if list_file is not None:\n"
+    "    os.remove(list_file)\n")
+
+# The maximum total size of the directories passed on the command line of
+# a directories creation job: longer lists are written in a file
+DIRECTORIES_INLINE_SIZE = 32768
+
+# The maximum number of workflow skeletons kept in the skeleton cache
+SKELETON_CACHE_SIZE = 32
+
+# The workflow skeletons of the recently converted pipeline structures
+# (see workflow_from_pipeline)
+_workflow_skeletons = OrderedDict()
+
+
+def clear_workflow_skeletons():
+    """ Empty the cache of workflow skeletons.
+    """
+    _workflow_skeletons.clear()
+
+
+def _nodes_by_path(pipeline, prefix=()):
+    """ Index the nodes of a pipeline and of its sub-pipelines by their path,
+    the tuple of the node names from the top level pipeline.
+    """
+    nodes = {}
+    for node_name, node in pipeline.nodes.iteritems():
+        if node_name == '':
+            continue
+        path = prefix + (node_name, )
+        nodes[path] = node
+        if isinstance(node, PipelineNode):
+            nodes.update(_nodes_by_path(node.process, path))
+    return nodes
+
+
+def _graph_paths(graph, processes, graphs, prefix=()):
+    """ Find the path of the processes and sub-graphs of a workflow graph.
+    """
+    for node_name, node in graph._nodes.iteritems():
+        path = prefix + (node_name, )
+        if isinstance(node.meta, Graph):
+            graphs[node.meta] = path
+            _graph_paths(node.meta, processes, graphs, path)
+        else:
+            for pipeline_node in node.meta:
+                processes[pipeline_node.process] = path
+
+
+def _workflow_skeleton(graph, jobs, dependencies, groups, root_jobs,
+                       batched_jobs):
+    """ Extract the structure of a converted workflow graph.
+
+    The skeleton describes the jobs and groups by the path of their
+    pipeline nodes, and the dependencies and root elements by the
+    ('job', index) or ('group', index) keys of the jobs and groups. It does
+    not hold any parameter value.
+
+    Parameters
+    ----------
+    graph: Graph (mandatory)
+        the converted workflow graph
+    jobs, dependencies, groups, root_jobs: (mandatory)
+        the conversion of the graph (see workflow_from_graph)
+    batched_jobs: dict (mandatory)
+        the pipeline nodes of each fused job, in execution order
+
+    Returns
+    -------
+    skeleton: dict
+        the 'jobs' (kind, node paths, name, priority, step name), the
+        'groups' ('group', name, elements keys) or ('iteration', name, node
+        path, priority, step name), the 'dependencies' and the 'root'
+        elements keys.
+    """
+    processes = {}
+    _graph_paths(graph, processes, {})
+    keys = {}
+    job_specs = []
+    job_processes = {}
+    for process, job in jobs.iteritems():
+        # iterations jobs are built with their group
+        if not isinstance(process, tuple):
+            job_processes.setdefault(job, process)
+    for job, process in job_processes.iteritems():
+        if job in batched_jobs:
+            kind = 'batch'
+            paths = [processes[pipeline_node.process]
+                     for pipeline_node in batched_jobs[job]]
+        else:
+            kind = 'job'
+            paths = [processes[process]]
+        keys[job] = ('job', len(job_specs))
+        job_specs.append((kind, paths, job.name, job.priority,
+                          job.user_storage))
+    group_specs = []
+    for group in groups.itervalues():
+        keys[group] = ('group', len(group_specs))
+        group_specs.append(None)
+    for owner, group in groups.iteritems():
+        if isinstance(owner, Graph):
+            spec = ('group', group.name,
+                    [keys[element] for element in group.elements])
+        else:
+            spec = ('iteration', group.name, processes[owner],
+                    group.elements[0].priority,
+                    group.elements[0].user_storage)
+        group_specs[keys[group][1]] = spec
+    return {
+        'jobs': job_specs,
+        'groups': group_specs,
+        'dependencies': [(keys[source], keys[dest])
+                         for source, dest in dependencies],
+        'root': [keys[element] for element in root_jobs.itervalues()]
+    }
+
+
+def _job_identity(process):
+    """ Identify the execution of a process by its id, the hash of its
+    inputs (see :py:func:`capsul.study_config.memory.get_argument_hash`) and
+    its outputs: two jobs with the same identity do the same work. The
+    processes using temporary files must not be identified this way, since
+    their temporary values are not unique across conversions.
+
+    Returns
+    -------
+    identity: tuple
+        the process identity, None if the parameters cannot be hashed.
+    """
+    try:
+        input_hash = get_argument_hash(process)[0]
+        outputs = json.dumps(sorted(
+            (name, None if value is Undefined else value)
+            for name, value in (
+                (name, process.get_parameter(name))
+                for name, trait in process.user_traits().iteritems()
+                if trait.output)))
+    except (TypeError, ValueError):
+        return None
+    return (process.id, input_hash, outputs)
+
+
+def _merge_duplicate_jobs(jobs, dependencies, root_jobs, job_identities,
+                          first_jobs):
+    """ Run only once the jobs of a workflow doing the same work.
+
+    Each duplicate job is replaced by a barrier job depending on the first
+    job with the same identity: the jobs depending on the duplicate thus
+    wait for the first job, and the groups containing the duplicate are
+    kept.
+
+    Parameters
+    ----------
+    jobs: list of Job (mandatory)
+        the workflow jobs, where the duplicates are replaced
+    dependencies: set (mandatory)
+        the workflow dependencies
+    root_jobs: list (mandatory)
+        the workflow root group elements, where the duplicates are replaced
+    job_identities: dict (mandatory)
+        the identity of the jobs (see _job_identity)
+    first_jobs: dict (mandatory)
+        the first job of each identity, updated with the new identities. It
+        may be shared by several calls to merge the jobs of several
+        workflows.
+
+    Returns
+    -------
+    dependencies: set
+        the workflow dependencies, using the barrier jobs
+    """
+    replacements = {}
+    for index, job in enumerate(jobs):
+        identity = job_identities.get(job)
+        if identity is None:
+            continue
+        first_job = first_jobs.setdefault(identity, job)
+        if first_job is not job:
+            barrier = swclient.BarrierJob(name=job.name)
+            replacements[job] = barrier
+            jobs[index] = barrier
+            dependencies.add((first_job, job))
+    if not replacements:
+        return dependencies
+    _replace_elements(root_jobs, replacements)
+    return set((replacements.get(source, source),
+                replacements.get(dest, dest))
+               for source, dest in dependencies)
+
+
+def _replace_elements(elements, replacements):
+    """ Replace jobs in a list of group elements and in their sub-groups.
+    """
+    for index, item in enumerate(elements):
+        if item in replacements:
+            elements[index] = replacements[item]
+        elif isinstance(item, swclient.Group):
+            _replace_elements(item.elements, replacements)
+
+
+def _get_swf_resource_conf(study_config):
+    """ Get the configuration of the soma-workflow computing resource of a
+    study, None if it is not configured.
+    """
+    computing_resource = getattr(
+        study_config, 'somaworkflow_computing_resource', None)
+    if computing_resource is None:
+        return None
+    resources_conf = getattr(
+        study_config, 'somaworkflow_computing_resources_config', None)
+    if resources_conf is None:
+        return None
+    return getattr(resources_conf, computing_resource, None)
+
+
+def _get_swf_paths(study_config):
+    """ Get the transferred paths and the translated paths of the
+    soma-workflow computing resource of a study.
+    """
+    resource_conf = _get_swf_resource_conf(study_config)
+    if resource_conf is None:
+        return [], {}
+    return (resource_conf.transfer_paths,
+            resource_conf.path_translations.export_to_dict())
+
+
+def _workflow_elements(pipeline, study_config={}, disabled_nodes=None,
+                       jobs_priority=0, create_directories=True,
+                       prioritize_critical_path=False,
+                       nodes_durations=None, runtime_history=None,
+                       native_specification_format=None,
+                       batch_max_duration=None,
+                       use_skeleton_cache=False, deduplicate_jobs=False):
+    """ Convert a Capsul Pipeline to the elements of a soma-workflow
+    workflow
+
+    Parameters
+    ----------
+    see workflow_from_pipeline()
+
+    Returns
+    -------
+    jobs: list of Job
+        the jobs of the processes
+    dependencies: set
+        the (source, destination) dependencies between jobs and groups
+    root_jobs: list
+        the jobs and groups of the workflow root group
+    job_directories: dict
+        the (translated) output directories of the jobs, empty if
+        create_directories is not set.
+    job_identities: dict
+        the identity of the jobs (see _job_identity), empty if
+        deduplicate_jobs is not set.
     """
 
     class TempFile(unicode):
@@ -105,7 +439,7 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
 
     def build_job(process, temp_map={}, shared_map={}, transfers=[{}, {}],
                   shared_paths={}, forbidden_temp=set(), name='', priority=0,
-                  step_name=''):
+                  step_name='', requirements=None):
         """ Create a soma-workflow Job from a Capsul Process
 
         Parameters
@@ -127,6 +461,9 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             priority assigned to the job
         step_name: str (optional)
             the step name will be stored in the job user_storage variable
+        requirements: dict (optional)
+            the resources needed by the job, translated into its native
+            specification. If not given, the process requirements are used.
 
         Returns
         -------
@@ -212,11 +549,190 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             referenced_output_files
                 =output_replaced_paths \
                     + [x[0] for x in oproc_transfers.values()],
-            priority=priority)
+            priority=priority,
+            native_specification=_native_specification(
+                requirements or process.get_requirements()))
+        if step_name:
+            job.user_storage = step_name
+        # the temporary files names are only unique in a conversion, the
+        # jobs using them are never merged
+        if deduplicate_jobs and not input_replaced_paths \
+                and not output_replaced_paths:
+            job_identities[job] = _job_identity(process)
+        if create_directories:
+            job_directories[job] = _output_directories(process)
+        return job
+
+    def build_iteration_jobs(process, temp_map={}, shared_map={},
+                             transfers=[{}, {}], shared_paths={},
+                             forbidden_temp=set(), name='', priority=0,
+                             step_name='', requirements=None):
+        """ Create one soma-workflow Job per iteration of a Capsul
+        ProcessIteration
+
+        Each job executes the iterated process with the regular parameters
+        values and the iteration values of the iterative parameters.
+        Iterative output lists are thus produced together by the jobs, and
+        are available to the jobs depending on all of them.
+
+        Parameters
+        ----------
+        process: ProcessIteration (mandatory)
+            a CAPSUL process iteration instance
+        name: string (optional)
+            jobs base name. If empty, use the iterated process name.
+        other parameters:
+            see build_job()
+
+        Returns
+        -------
+        jobs: list of Job
+            a soma-workflow Job instance for each iteration
+        """
+        size, no_output_value = process.iterations_size()
+        iterated_process = process.process
+        if not name:
+            name = iterated_process.name
+        saved_values = dict(
+            (param_name, getattr(iterated_process, param_name))
+            for param_name in iterated_process.user_traits()
+            if param_name not in ('nodes_activation', 'selection_changed'))
+        jobs = []
+        try:
+            for param_name in process.regular_parameters:
+                setattr(iterated_process, param_name,
+                        getattr(process, param_name))
+            for iteration in xrange(size or 0):
+                for param_name, value in process.iteration_values(
+                        iteration, no_output_value).iteritems():
+                    setattr(iterated_process, param_name, value)
+                jobs.append(build_job(
+                    iterated_process, temp_map, shared_map, transfers,
+                    shared_paths, forbidden_temp=forbidden_temp,
+                    name='%s_%d' % (name, iteration), priority=priority,
+                    step_name=step_name, requirements=requirements))
+        finally:
+            for param_name, value in saved_values.iteritems():
+                setattr(iterated_process, param_name, value)
+        return jobs
+
+    def build_batch_job(chain, priority=0):
+        """ Create a soma-workflow Job running the jobs of a chain of process
+        nodes one after the other in a single python process
+
+        Parameters
+        ----------
+        chain: list of tuples (mandatory)
+            the (pipeline node, job) of each process, in execution order.
+            Each job command must be a python command.
+        priority: int (optional)
+            priority assigned to the job
+
+        Returns
+        -------
+        job: Job
+            a soma-workflow Job instance that will execute all the processes
+        """
+        command = ["python", "-c", _BATCH_CODE]
+        input_files = []
+        output_files = []
+        known_outputs = set()
+        requirements = {"cpu": None, "memory": None, "walltime": 0}
+        for pipeline_node, job in chain:
+            command += [str(len(job.command) - 3)] + job.command[2:]
+            input_files += [path for path in job.referenced_input_files
+                            if path not in known_outputs]
+            output_files += job.referenced_output_files
+            known_outputs.update(job.referenced_output_files)
+            for name, value in pipeline_node.get_requirements().iteritems():
+                if name == "walltime":
+                    if value is None or requirements[name] is None:
+                        requirements[name] = None
+                    else:
+                        requirements[name] += value
+                elif value is not None:
+                    requirements[name] = max(requirements[name], value)
+        job = swclient.Job(
+            name="+".join(pipeline_node.name for pipeline_node, job in chain),
+            command=command,
+            referenced_input_files=input_files,
+            referenced_output_files=output_files,
+            priority=priority,
+            native_specification=_native_specification(requirements))
+        step_name = chain[0][1].user_storage
         if step_name:
             job.user_storage = step_name
+        if create_directories:
+            directories = []
+            for pipeline_node, chain_job in chain:
+                directories += [directory
+                                for directory in job_directories[chain_job]
+                                if directory not in directories]
+            job_directories[job] = directories
         return job
 
+    def batch_chains(graph, jobs, root_jobs, batched_nodes):
+        """ Fuse the jobs of the linear chains of cheap process nodes of a
+        graph
+
+        Parameters
+        ----------
+        graph: Graph (mandatory)
+            a CAPSUL graph
+        jobs: dict (mandatory)
+            the jobs of the graph processes, updated with the fused jobs.
+        root_jobs: dict (mandatory)
+            the root jobs of the graph, where a fused job replaces the jobs
+            of its chain.
+        batched_nodes: set (mandatory)
+            the process nodes which may be fused
+        """
+        def batchable(node):
+            if not isinstance(node.meta, list) or len(node.meta) != 1:
+                return None
+            pipeline_node = node.meta[0]
+            job = jobs.get(pipeline_node.process)
+            if (pipeline_node not in batched_nodes or job is None
+                    or job.command[:2] != ["python", "-c"]):
+                return None
+            return pipeline_node, job
+
+        def chained(node, next_node):
+            return (node.links_to == [next_node] and
+                    next_node.links_from == [node] and
+                    batchable(node)[1].user_storage
+                        == batchable(next_node)[1].user_storage)
+
+        for node in graph._nodes.itervalues():
+            # Start a chain from a node which does not follow another one
+            if batchable(node) is None:
+                continue
+            if len(node.links_from) == 1:
+                previous_node = node.links_from[0]
+                if (batchable(previous_node) is not None
+                        and chained(previous_node, node)):
+                    continue
+            chain = [node]
+            while len(chain[-1].links_to) == 1:
+                next_node = chain[-1].links_to[0]
+                if (batchable(next_node) is None
+                        or not chained(chain[-1], next_node)):
+                    break
+                chain.append(next_node)
+            if len(chain) < 2:
+                continue
+
+            # Replace the chain jobs by a single job
+            chain = [batchable(node) for node in chain]
+            job = build_batch_job(
+                chain, priority=max(job.priority for node, job in chain))
+            for pipeline_node, chain_job in chain:
+                jobs[pipeline_node.process] = job
+                del root_jobs[pipeline_node.process]
+            root_jobs[chain[0][0].process] = job
+            batched_jobs[job] = [pipeline_node
+                                 for pipeline_node, chain_job in chain]
+
     def build_group(name, jobs):
         """ Create a group of jobs
 
@@ -235,10 +751,10 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         return swclient.Group(jobs, name=name)
 
     def get_jobs(group, groups):
-        gqueue = list(group.elements)
+        gqueue = deque(group.elements)
         jobs = []
         while gqueue:
-            group_or_job = gqueue.pop(0)
+            group_or_job = gqueue.popleft()
             if group_or_job in groups:
                 gqueue += group_or_job.elements
             else:
@@ -282,20 +798,26 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
               process = node
           setattr(process, plug_name, Undefined)
 
-    def _get_swf_paths(study_config):
-        computing_resource = getattr(
-            study_config, 'somaworkflow_computing_resource', None)
-        if computing_resource is None:
-            return [], {}
-        resources_conf = getattr(
-            study_config, 'somaworkflow_computing_resources_config', None)
-        if resources_conf is None:
-            return [], {}
-        resource_conf = getattr(resources_conf, computing_resource, None)
-        if resource_conf is None:
-            return [], {}
-        return (resource_conf.transfer_paths,
-                resource_conf.path_translations.export_to_dict())
+    def _get_native_specification_format(study_config):
+        resource_conf = _get_swf_resource_conf(study_config)
+        spec_format = getattr(resource_conf, 'native_specification_format',
+                              None)
+        if spec_format in (None, Undefined, ''):
+            return None
+        return spec_format
+
+    def _native_specification(requirements):
+        if native_specification_format is None:
+            return None
+        if callable(native_specification_format):
+            return native_specification_format(requirements)
+        if native_specification_format not in NATIVE_SPECIFICATION_FORMATS:
+            raise ValueError(
+                "Unknown native specification format '%s', expect one of %s"
+                % (native_specification_format,
+                   sorted(NATIVE_SPECIFICATION_FORMATS)))
+        return NATIVE_SPECIFICATION_FORMATS[native_specification_format](
+            requirements)
 
     def _propagate_transfer(node, param, path, output, transfers,
                             transfer_item):
@@ -381,9 +903,9 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         in_transfers = {}
         out_transfers = {}
         transfers = [in_transfers, out_transfers]
-        todo_nodes = [pipeline.pipeline_node]
+        todo_nodes = deque([pipeline.pipeline_node])
         while todo_nodes:
-            node = todo_nodes.pop(0)
+            node = todo_nodes.popleft()
             if hasattr(node, 'process'):
                 process = node.process
             else:
@@ -413,10 +935,9 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
                                                 transfer_item)
                             break
             if hasattr(process, 'nodes'):
-                todo_nodes += [sub_node
-                               for name, sub_node in process.nodes.iteritems()
-                               if name != ''
-                                  and not isinstance(sub_node, Switch)]
+                todo_nodes.extend(
+                    sub_node for name, sub_node in process.nodes.iteritems()
+                    if name != '' and not isinstance(sub_node, Switch))
         return transfers
 
     def _expand_nodes(nodes):
@@ -427,15 +948,15 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         -------
         set of leaf nodes.
         '''
-        nodes_list = list(nodes)
+        nodes_list = deque(nodes)
         expanded_nodes = set()
         while nodes_list:
-            node = nodes_list.pop(0)
+            node = nodes_list.popleft()
             if not hasattr(node, 'process'):
                 continue # switch or something
             if isinstance(node.process, Pipeline):
-                nodes_list.extend([p for p in node.process.nodes.itervalues()
-                                   if p is not node])
+                nodes_list.extend(p for p in node.process.nodes.itervalues()
+                                  if p is not node)
             else:
                 expanded_nodes.add(node)
         return expanded_nodes
@@ -482,7 +1003,8 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     def workflow_from_graph(graph, temp_map={}, shared_map={},
                             transfers=[{}, {}], shared_paths={},
                             disabled_nodes=set(), forbidden_temp=set(),
-                            jobs_priority=0, steps={}, current_step=''):
+                            jobs_priority=0, steps={}, current_step='',
+                            priorities={}, batched_nodes=set()):
         """ Convert a CAPSUL graph to a soma-workflow workflow
 
         Parameters
@@ -507,6 +1029,10 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             node name -> step name dict
         current_step: str (optional)
             the parent node step name
+        priorities: dict (optional)
+            pipeline node -> priority added to jobs_priority dict
+        batched_nodes: set (optional)
+            process nodes whose jobs are fused when they form linear chains
 
         Returns
         -------
@@ -534,21 +1060,51 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
                 sub_jobs = {}
                 for pipeline_node in node.meta:
                     process = pipeline_node.process
-                    if (not isinstance(process, Pipeline) and
+                    if isinstance(process, ProcessIteration) and \
+                            pipeline_node not in disabled_nodes:
+                        # Iterations are distributed in a group of jobs
+                        iteration_jobs = build_iteration_jobs(
+                            process, temp_map, shared_map, transfers,
+                            shared_paths, forbidden_temp=forbidden_temp,
+                            name=pipeline_node.name,
+                            priority=jobs_priority +
+                                priorities.get(pipeline_node, 0),
+                            step_name=current_step or
+                                steps.get(pipeline_node.name),
+                            requirements=dict(
+                                process.process.get_requirements(),
+                                **pipeline_node.requirements))
+                        if iteration_jobs:
+                            group = build_group(pipeline_node.name,
+                                                iteration_jobs)
+                            groups[process] = group
+                            root_jobs[process] = group
+                            sub_jobs.update(
+                                ((process, iteration), job)
+                                for iteration, job
+                                in enumerate(iteration_jobs))
+                    elif (not isinstance(process, Pipeline) and
                             isinstance(process, Process) and
                             pipeline_node not in disabled_nodes):
                         job = build_job(process, temp_map, shared_map,
                                         transfers, shared_paths,
                                         forbidden_temp=forbidden_temp,
                                         name=pipeline_node.name,
-                                        priority=jobs_priority,
+                                        priority=jobs_priority +
+                                            priorities.get(pipeline_node, 0),
                                         step_name=current_step or
-                                            steps.get(pipeline_node.name))
+                                            steps.get(pipeline_node.name),
+                                        requirements=
+                                            pipeline_node.get_requirements())
                         sub_jobs[process] = job
                         root_jobs[process] = job
                        #node.job = job
                 jobs.update(sub_jobs)
 
+        # Fuse the chains of cheap jobs
+        if batched_nodes:
+            batch_chains(graph, jobs, root_jobs, batched_nodes)
+
         # Recurence on graph node
         for node_name, node in group_nodes.iteritems():
             wf_graph = node.meta
@@ -557,7 +1113,8 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
                 = workflow_from_graph(
                     wf_graph, temp_map, shared_map, transfers,
                     shared_paths, disabled_nodes, jobs_priority=jobs_priority,
-                    steps=steps, current_step=step_name)
+                    steps=steps, current_step=step_name,
+                    priorities=priorities, batched_nodes=batched_nodes)
             group = build_group(node_name, sub_root_jobs.values())
             groups[node.meta] = group
             root_jobs[node.meta] = group
@@ -565,25 +1122,27 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             groups.update(sub_groups)
             dependencies.update(sub_deps)
 
+        def node_job(meta):
+            # job or group of a graph node, None for disabled nodes
+            if isinstance(meta, list):
+                process = meta[0].process
+                if process in jobs:
+                    return jobs[process]
+                # iterative node group
+                return groups.get(process)
+            return groups[meta]
+
         # Add dependencies between a source job and destination jobs
         for node_name, node in graph._nodes.iteritems():
             # Source job
-            if isinstance(node.meta, list):
-                if node.meta[0].process in jobs:
-                    sjob = jobs[node.meta[0].process]
-                else:
-                    continue # disabled node
-            else:
-                sjob = groups[node.meta]
+            sjob = node_job(node.meta)
+            if sjob is None:
+                continue # disabled node
             # Destination jobs
             for dnode in node.links_to:
-                if isinstance(dnode.meta, list):
-                    if dnode.meta[0].process in jobs:
-                        djob = jobs[dnode.meta[0].process]
-                    else:
-                        continue # disabled node
-                else:
-                    djob = groups[dnode.meta]
+                djob = node_job(dnode.meta)
+                if djob is None or djob is sjob:
+                    continue # disabled node or fused jobs
                 dependencies.add((sjob, djob))
 
         # sort root jobs/groups
@@ -593,32 +1152,104 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
         root_jobs = OrderedDict([x[1:] for x in root_jobs_list])
         return jobs, dependencies, groups, root_jobs
 
-    def _create_directories_job(pipeline, shared_map={}, shared_paths={},
-                                priority=0, transfer_paths=[]):
-        def _is_transfer(d, transfer_paths):
-            for path in transfer_paths:
-                if d.startswith(os.path.join(path, '')):
-                    return True
-            return False
-
-        directories = [d
-                       for d in pipeline_tools.get_output_directories(
-                          pipeline)[1]
-                       if not _is_transfer(d, transfer_paths)]
-        if len(directories) == 0:
-            return None # no dirs to create.
-        paths = []
-        # check for path translations
-        for path in directories:
-            new_path = _translated_path(path, shared_map, shared_paths)
-            paths.append(new_path or path)
-        # FIXME: maybe use a python command to avoid the shell command mkdir
-        cmdline = ['mkdir', '-p'] + paths
-        job = swclient.Job(
-            name='output directories creation',
-            command=cmdline,
-            priority=priority)
-        return job
+    def workflow_from_skeleton(skeleton, nodes, temp_map={}, shared_map={},
+                               transfers=[{}, {}], shared_paths={},
+                               forbidden_temp=set()):
+        """ Build the jobs of a workflow skeleton from the current values
+        of a pipeline
+
+        Parameters
+        ----------
+        skeleton: dict (mandatory)
+            the workflow structure (see _workflow_skeleton)
+        nodes: dict (mandatory)
+            the pipeline nodes indexed by path (see _nodes_by_path)
+        other parameters:
+            see workflow_from_graph()
+
+        Returns
+        -------
+        jobs, dependencies, groups, root_jobs:
+            see workflow_from_graph()
+        """
+        elements = {}
+        jobs = {}
+        groups = {}
+        for index, (kind, paths, name, priority, step_name) \
+                in enumerate(skeleton['jobs']):
+            key = ('job', index)
+            chain = []
+            for path in paths:
+                node = nodes[path]
+                chain.append((node, build_job(
+                    node.process, temp_map, shared_map, transfers,
+                    shared_paths, forbidden_temp=forbidden_temp,
+                    name=node.name if kind == 'batch' else name,
+                    priority=priority, step_name=step_name,
+                    requirements=node.get_requirements())))
+            if kind == 'batch':
+                job = build_batch_job(chain, priority=priority)
+            else:
+                job = chain[0][1]
+            jobs[key] = job
+            elements[key] = job
+
+        def group_element(key):
+            if key in elements:
+                return elements[key]
+            spec = skeleton['groups'][key[1]]
+            if spec[0] == 'iteration':
+                kind, name, path, priority, step_name = spec
+                node = nodes[path]
+                process = node.process
+                iteration_jobs = build_iteration_jobs(
+                    process, temp_map, shared_map, transfers, shared_paths,
+                    forbidden_temp=forbidden_temp, name=name,
+                    priority=priority, step_name=step_name,
+                    requirements=dict(process.process.get_requirements(),
+                                      **node.requirements))
+                jobs.update(((key, iteration), job)
+                            for iteration, job in enumerate(iteration_jobs))
+                group = build_group(name, iteration_jobs)
+            else:
+                kind, name, group_elements = spec
+                group = build_group(
+                    name, [group_element(element)
+                           for element in group_elements])
+            groups[key] = group
+            elements[key] = group
+            return group
+
+        dependencies = set((group_element(source), group_element(dest))
+                           for source, dest in skeleton['dependencies'])
+        root_jobs = OrderedDict([(key, group_element(key))
+                                 for key in skeleton['root']])
+        return jobs, dependencies, groups, root_jobs
+
+    def _output_directories(process):
+        """ Get the (translated) directories of the output files of a
+        process, which are not transfered
+        """
+        directories = []
+        for param_name, trait in process.user_traits().iteritems():
+            if not (trait.output and isinstance(trait.trait_type, File)
+                    or isinstance(trait.trait_type, Directory)):
+                continue
+            value = getattr(process, param_name)
+            if value is None or value is Undefined \
+                    or isinstance(value, TempFile):
+                continue
+            directory = os.path.dirname(value)
+            if directory in ('', '.') or any(
+                    directory.startswith(os.path.join(path, ''))
+                    for path in swf_paths[0]):
+                continue
+            # check for path translations
+            directory = _translated_path(
+                directory, shared_map, swf_paths[1]) or directory
+            if directory not in directories:
+                directories.append(directory)
+        return directories
 
     # TODO: handle formats in a separate, centralized place
     # formats: {name: ext_props}
@@ -638,11 +1269,15 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     for format, values in formats.iteritems():
         merged_formats.update(values)
 
+    job_identities = {}
+    job_directories = {}
     temp_map = assign_temporary_filenames(pipeline)
-    temp_subst_list = [(x1, x2[0]) for x1, x2 in temp_map.iteritems()]
-    temp_subst_map = dict(temp_subst_list)
+    temp_subst_map = dict((x1, x2[0]) for x1, x2 in temp_map.iteritems())
     shared_map = {}
     swf_paths = _get_swf_paths(study_config)
+    if native_specification_format is None:
+        native_specification_format = _get_native_specification_format(
+            study_config)
     transfers = _get_transfers(pipeline, swf_paths[0], merged_formats)
     #print 'disabling nodes:', disabled_nodes
     # get complete list of disabled leaf nodes
@@ -657,12 +1292,6 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     #print 'SWF transfers:', swf_paths[0]
     #print 'shared paths:', swf_paths[1]
 
-    if create_directories:
-        # create job
-        dirs_job = _create_directories_job(
-            pipeline, shared_map=shared_map, shared_paths=swf_paths[1],
-            transfer_paths=swf_paths[0])
-
     # build steps map
     steps = {}
     if hasattr(pipeline, 'pipeline_steps'):
@@ -671,32 +1300,429 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
             nodes = step.nodes
             steps.update(dict([(node, step_name) for node in nodes]))
 
+    # The durations give the priorities and the fused jobs
+    if prioritize_critical_path or batch_max_duration is not None:
+        if runtime_history is None:
+            runtime_history = get_runtime_history()
+        if nodes_durations is None and runtime_history is not None:
+            nodes_durations = pipeline_tools.nodes_estimated_durations(
+                pipeline, runtime_history)
+
+    # Look for the skeleton of a workflow with the same structure
+    skeleton = None
+    if use_skeleton_cache:
+        nodes = _nodes_by_path(pipeline)
+        paths = dict((node, path) for path, node in nodes.iteritems())
+        empty_iterations = []
+        for path, node in nodes.iteritems():
+            if isinstance(getattr(node, 'process', None), ProcessIteration):
+                try:
+                    size = node.process.iterations_size()[0]
+                except ValueError:
+                    size = None
+                if not size:
+                    empty_iterations.append(path)
+        durations = None
+        if nodes_durations and (prioritize_critical_path
+                                or batch_max_duration is not None):
+            durations = tuple(sorted(
+                (paths.get(key, key), duration)
+                for key, duration in nodes_durations.iteritems()))
+        skeleton_key = (
+            pipeline_tools.structural_fingerprint(pipeline),
+            tuple(sorted(paths[node] for node in disabled_nodes
+                         if node in paths)),
+            tuple(sorted(empty_iterations)),
+            jobs_priority, prioritize_critical_path, batch_max_duration,
+            durations)
+        skeleton = _workflow_skeletons.get(skeleton_key)
+
     # Get a graph
+    batched_jobs = {}
     try:
-        graph = pipeline.workflow_graph()
-        (jobs, dependencies, groups, root_jobs) = workflow_from_graph(
-                  graph, temp_subst_map, shared_map, transfers, swf_paths[1],
-                  disabled_nodes=disabled_nodes, forbidden_temp=remove_temp,
-                  steps=steps)
+        if skeleton is not None:
+            (jobs, dependencies, groups, root_jobs) = workflow_from_skeleton(
+                skeleton, nodes, temp_subst_map, shared_map, transfers,
+                swf_paths[1], forbidden_temp=remove_temp)
+        else:
+            graph = pipeline.workflow_graph()
+            priorities = {}
+            batched_nodes = set()
+            if prioritize_critical_path:
+                priorities = pipeline_tools.critical_path_priorities(
+                    graph, nodes_durations)
+            if batch_max_duration is not None:
+                batched_nodes = pipeline_tools.cheap_nodes(
+                    pipeline, batch_max_duration, nodes_durations)
+            (jobs, dependencies, groups, root_jobs) = workflow_from_graph(
+                      graph, temp_subst_map, shared_map, transfers,
+                      swf_paths[1], disabled_nodes=disabled_nodes,
+                      forbidden_temp=remove_temp,
+                      jobs_priority=jobs_priority, steps=steps,
+                      priorities=priorities, batched_nodes=batched_nodes)
+            if use_skeleton_cache:
+                if len(_workflow_skeletons) >= SKELETON_CACHE_SIZE:
+                    del _workflow_skeletons[_workflow_skeletons.keys()[0]]
+                _workflow_skeletons[skeleton_key] = _workflow_skeleton(
+                    graph, jobs, dependencies, groups, root_jobs,
+                    batched_jobs)
     finally:
         restore_empty_filenames(temp_map)
 
-    all_jobs = jobs.values()
+    # fused jobs run several processes
+    all_jobs = []
+    known_jobs = set()
+    for job in jobs.itervalues():
+        if job not in known_jobs:
+            known_jobs.add(job)
+            all_jobs.append(job)
     root_jobs = root_jobs.values()
+    return all_jobs, dependencies, root_jobs, job_directories, job_identities
 
-    # if directories have to be created, all other primary jobs will depend
-    # on this first one
-    if create_directories and dirs_job is not None:
+
+def _directories_subtrees(directories):
+    """ Group the directories to create by subtree.
+
+    The directories whose subdirectories are created are removed, and the
+    others are grouped by branch: the first directory below the common
+    root of all the directories.
+
+    Parameters
+    ----------
+    directories: list of str (mandatory)
+        the directories to create
+
+    Returns
+    -------
+    subtrees: list
+        the [branch, [directories relative to the branch]] of each branch.
+    """
+    parents = set()
+    for directory in directories:
+        parent = os.path.dirname(directory)
+        while parent not in parents and parent != directory:
+            parents.add(parent)
+            directory, parent = parent, os.path.dirname(parent)
+    leaves = sorted(set(directories) - parents)
+    if not leaves:
+        return []
+    common = os.path.dirname(os.path.commonprefix(
+        [leaf + os.sep for leaf in leaves]))
+    subtrees = OrderedDict()
+    for leaf in leaves:
+        relative_path = os.path.relpath(leaf, common)
+        if relative_path == '.':
+            branch = leaf
+        else:
+            branch = os.path.join(common, relative_path.split(os.sep)[0])
+        subtrees.setdefault(branch, []).append(
+            os.path.relpath(leaf, branch))
+    return [[branch, [path for path in paths if path != '.']]
+            for branch, paths in subtrees.iteritems()]
+
+
+def _directories_job(directories, name='output directories creation',
+                     priority=0, list_directory=None, transfer_paths=(),
+                     shared_paths={}):
+    """ Create a soma-workflow Job creating directories with a python
+    command.
+
+    The directories are given on the command line unless they are too
+    long (see DIRECTORIES_INLINE_SIZE): then they are listed by subtree in
+    a json file read by the job, to avoid exceeding the command line
+    length limit. The job removes this file once the directories are
+    created. On a remote computing resource, the file is transferred if it
+    is in one of the transfer_paths, or translated if it is in one of the
+    shared_paths.
+
+    Parameters
+    ----------
+    directories: list (mandatory)
+        the directories to create, as paths or soma-workflow translated
+        paths
+    name: str (optional)
+        the job name
+    priority: int (optional)
+        priority assigned to the job
+    list_directory: str (optional)
+        the directory where the directories list file is written, which
+        must be readable by the job. Default: the temporary directory.
+    transfer_paths: list (optional)
+        the directories transferred to the computing resource
+    shared_paths: dict (optional)
+        the translated directories: {directory: (namespace, uuid)}
+
+    Returns
+    -------
+    job: Job
+        the soma-workflow Job instance
+    """
+    paths = [directory for directory in directories
+             if isinstance(directory, basestring)]
+    # translated paths are only known on the computing resource
+    translated_paths = [directory for directory in directories
+                        if not isinstance(directory, basestring)]
+    subtrees = _directories_subtrees(paths)
+    command = ['python', '-c', _DIRECTORIES_CODE]
+    referenced_input_files = []
+    if sum(len(path) + 1 for path in paths) > DIRECTORIES_INLINE_SIZE:
+        fd, list_file = tempfile.mkstemp(
+            prefix='capsul_directories_', suffix='.json', dir=list_directory)
+        with os.fdopen(fd, 'w') as open_file:
+            json.dump(subtrees, open_file)
+        for base_dir in transfer_paths:
+            if list_file.startswith(os.path.join(base_dir, '')):
+                list_file = swclient.FileTransfer(
+                    is_input=True, client_path=list_file)
+                referenced_input_files.append(list_file)
+                break
+        else:
+            for base_dir, (namespace, uuid) in shared_paths.iteritems():
+                if list_file.startswith(base_dir + os.sep):
+                    list_file = swclient.SharedResourcePath(
+                        list_file[len(base_dir) + 1:], namespace, uuid=uuid)
+                    break
+        command += ['-f', list_file]
+    else:
+        for branch, relative_paths in subtrees:
+            command += [os.path.join(branch, path)
+                        for path in relative_paths] or [branch]
+    return swclient.Job(
+        name=name,
+        command=command + translated_paths,
+        referenced_input_files=referenced_input_files,
+        priority=priority)
+
+
+def _add_directories_jobs(jobs, dependencies, root_jobs, job_directories,
+                          priority=0, split=False, list_directory=None,
+                          transfer_paths=(), shared_paths={}):
+    """ Add the jobs creating the output directories of the jobs of a
+    workflow.
+
+    Parameters
+    ----------
+    jobs: list of Job (mandatory)
+        the workflow jobs, updated with the new jobs
+    dependencies: set (mandatory)
+        the workflow dependencies, updated with the new jobs dependencies
+    root_jobs: list (mandatory)
+        the workflow root group elements, updated with the new jobs
+    job_directories: dict (mandatory)
+        the directories to create for each job
+    priority: int (optional)
+        priority assigned to the jobs
+    split: bool (optional)
+        if not set, a single job creates all the directories, and all the
+        jobs without other dependency depend on it. Otherwise a job creates
+        the directories of each branch (see _directories_subtrees), and
+        only the jobs writing in a branch depend on its job.
+    list_directory, transfer_paths, shared_paths: (optional)
+        see _directories_job()
+    """
+    directories = []
+    known_directories = set()
+    for job in jobs:
+        for directory in job_directories.get(job, ()):
+            if directory not in known_directories:
+                known_directories.add(directory)
+                directories.append(directory)
+    if len(directories) == 0:
+        return # no dirs to create.
+
+    if not split:
+        dirs_job = _directories_job(directories, priority=priority,
+                                    list_directory=list_directory,
+                                    transfer_paths=transfer_paths,
+                                    shared_paths=shared_paths)
         dependend_jobs = set()
         for dependency in dependencies:
             dependend_jobs.add(dependency[1])
-        new_deps = [(dirs_job, job) for job in all_jobs
+        new_deps = [(dirs_job, job) for job in jobs
                     if job not in dependend_jobs]
         dependencies.update(new_deps)
-        all_jobs.insert(0, dirs_job)
+        jobs.insert(0, dirs_job)
         root_jobs.insert(0, dirs_job)
+        return
 
-    workflow = swclient.Workflow(jobs=all_jobs,
+    # One job per branch, the translated paths are created together
+    branches = OrderedDict()
+    paths = [directory for directory in directories
+             if isinstance(directory, basestring)]
+    for branch, relative_paths in _directories_subtrees(paths):
+        branches[branch] = [os.path.join(branch, path)
+                            for path in relative_paths] or [branch]
+    translated_paths = [directory for directory in directories
+                        if not isinstance(directory, basestring)]
+    if translated_paths:
+        branches[None] = translated_paths
+    branch_jobs = {}
+    dirs_jobs = []
+    for branch, branch_directories in branches.iteritems():
+        name = 'output directories creation'
+        if branch is not None:
+            name += ' (%s)' % branch
+        dirs_job = _directories_job(branch_directories, name=name,
+                                    priority=priority,
+                                    list_directory=list_directory,
+                                    transfer_paths=transfer_paths,
+                                    shared_paths=shared_paths)
+        dirs_jobs.append(dirs_job)
+        for directory in branch_directories:
+            branch_jobs[directory] = dirs_job
+
+    # A directory is created by the job of its branch, the parent
+    # directories of the branches by any job of their subdirectories
+    for job in jobs:
+        for directory in job_directories.get(job, ()):
+            dirs_job = branch_jobs.get(directory)
+            if dirs_job is None:
+                path = os.path.join(directory, '')
+                for branch, branch_directories in branches.iteritems():
+                    branch_path = os.path.join(branch or '', '')
+                    if branch is not None and (
+                            path.startswith(branch_path)
+                            or branch_path.startswith(path)):
+                        dirs_job = branch_jobs[branch_directories[0]]
+                        break
+                branch_jobs[directory] = dirs_job
+            dependencies.add((dirs_job, job))
+    jobs[0:0] = dirs_jobs
+    root_jobs[0:0] = dirs_jobs
+
+
+def _directories_list_directory(study_config):
+    """ Get the directory where the directories lists of the directories
+    creation jobs are written: the study output directory if it exists,
+    the temporary directory otherwise.
+    """
+    output_directory = getattr(study_config, 'output_directory', None)
+    if isinstance(output_directory, basestring) \
+            and os.path.isdir(output_directory):
+        return output_directory
+    return None
+
+
+def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
+                           jobs_priority=0, create_directories=True,
+                           prioritize_critical_path=False,
+                           nodes_durations=None, runtime_history=None,
+                           native_specification_format=None,
+                           batch_max_duration=None,
+                           use_skeleton_cache=False,
+                           deduplicate_jobs=False,
+                           split_directories_job=False):
+    """ Create a soma-workflow workflow from a Capsul Pipeline
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        a CAPSUL pipeline
+    study_config: StudyConfig (optional), or dict
+        holds information about file transfers and shared resource paths.
+        If not specified, no translation/transfers will be used.
+    disabled_nodes: sequence of pipeline nodes (Node instances) (optional)
+        such nodes will be disabled on-the-fly in the pipeline, file transfers
+        will be adapted accordingly (outputs may become inputs in the resulting
+        workflow), and temporary files will be checked. If a disabled node was
+        to produce a temporary files which is still used in an enabled node,
+        then a ValueError exception will be raised.
+        If disabled_nodes is not passed, they will possibly be taken from the
+        pipeline (if available) using disabled steps:
+        see Pipeline.define_steps()
+    jobs_priority: int (optional, default: 0)
+        set this priority on soma-workflow jobs.
+    create_directories: bool (optional, default: True)
+        if set, needed output directories (which will contain output files)
+        will be created in a first job, which all other ones depend on.
+        The job runs a python command, which reads the directories from a
+        file written in the study output directory (or in the temporary
+        directory) when they are too many for the command line, and removes
+        this file.
+    prioritize_critical_path: bool (optional, default: False)
+        if set, jobs_priority is increased for each job according to the
+        length of the longest chain of jobs it starts, so that the jobs on
+        the critical path of the workflow are run first (see
+        :py:func:`capsul.pipeline.pipeline_tools.critical_path_priorities`).
+    nodes_durations: dict (optional)
+        estimated durations of the processes, indexed by node name or by
+        process id, used to find the critical path. If not given, all the
+        processes have the same duration.
+    runtime_history: RuntimeHistory (optional)
+        if nodes_durations is not given, the durations of the processes are
+        estimated from their executions recorded in this history (see
+        :py:func:`capsul.pipeline.pipeline_tools.nodes_estimated_durations`).
+        The current runtime history is used if not given
+        (see :py:func:`capsul.process.runtime_history.set_runtime_history`).
+    native_specification_format: str or function (optional)
+        the scheduler type ('pbs' or 'slurm', see
+        NATIVE_SPECIFICATION_FORMATS) or a function translating the
+        requirements of a process (see Process.get_requirements) into the
+        native specification of its job. If not given, the
+        native_specification_format of the soma-workflow computing resource
+        configuration is used. Without format, the jobs have no native
+        specification.
+    batch_max_duration: float (optional)
+        if set, the jobs of the chains of process nodes whose estimated
+        duration in seconds is below this threshold are fused in a single
+        job running the processes one after the other in one python process,
+        to save the scheduling and startup overhead of each job. Only linear
+        chains are fused, so no parallelism is lost. Durations are taken
+        from nodes_durations, from the runtime history, or from the
+        processes walltime requirements: nodes without estimate are not
+        fused.
+    use_skeleton_cache: bool (optional, default: False)
+        if set, the structure of the workflow (jobs, groups and
+        dependencies) is kept in a cache indexed by the structural
+        fingerprint of the pipeline (see
+        :py:func:`capsul.pipeline.pipeline_tools.structural_fingerprint`),
+        the disabled nodes, the empty iterations and the priorities. The
+        following conversions of pipelines with the same structure, for
+        instance the same pipeline for another subject, skip the graph
+        analysis and only build the jobs from the parameters values.
+    deduplicate_jobs: bool (optional, default: False)
+        if set, the jobs running the same process with the same inputs and
+        outputs, such as the preparation of a template used in several
+        branches, are only run once. The duplicates are replaced by barrier
+        jobs depending on the first job, so that the jobs depending on them
+        fan out from this first job.
+    split_directories_job: bool (optional, default: False)
+        if set, the output directories are created by a job per branch of
+        the directories tree (ie. per subject directory) instead of a single
+        job, and each job only waits for the creation of the branches it
+        writes in.
+
+    Returns
+    -------
+    workflow: Workflow
+        a soma-workflow workflow
+    """
+    (jobs, dependencies, root_jobs, job_directories, job_identities) \
+        = _workflow_elements(
+            pipeline, study_config=study_config,
+            disabled_nodes=disabled_nodes, jobs_priority=jobs_priority,
+            create_directories=create_directories,
+            prioritize_critical_path=prioritize_critical_path,
+            nodes_durations=nodes_durations, runtime_history=runtime_history,
+            native_specification_format=native_specification_format,
+            batch_max_duration=batch_max_duration,
+            use_skeleton_cache=use_skeleton_cache,
+            deduplicate_jobs=deduplicate_jobs)
+    if deduplicate_jobs:
+        dependencies = _merge_duplicate_jobs(
+            jobs, dependencies, root_jobs, job_identities, {})
+
+    # if directories have to be created, all other primary jobs will depend
+    # on this first one
+    if create_directories:
+        transfer_paths, shared_paths = _get_swf_paths(study_config)
+        _add_directories_jobs(
+            jobs, dependencies, root_jobs, job_directories,
+            split=split_directories_job,
+            list_directory=_directories_list_directory(study_config),
+            transfer_paths=transfer_paths, shared_paths=shared_paths)
+
+    workflow = swclient.Workflow(jobs=jobs,
         dependencies=dependencies,
         root_group=root_jobs,
         name=pipeline.name)
@@ -704,6 +1730,107 @@ def workflow_from_pipeline(pipeline, study_config={}, disabled_nodes=None,
     return workflow
 
 
+def workflow_from_pipeline_batch(pipeline, parameters_sets, study_config={},
+                                 completion=None, group_name=None, name=None,
+                                 create_directories=True,
+                                 deduplicate_jobs=True,
+                                 split_directories_job=False, **kwargs):
+    """ Create a single soma-workflow workflow running a pipeline for several
+    parameters sets, for instance for several subjects.
+
+    The parameters sets are applied one after the other to the pipeline,
+    which is converted after each of them: they may be given by a generator
+    and no copy of the pipeline is made. The jobs of each parameters set are
+    put in their own group. The output directories of all the sets are
+    created together, and the jobs doing the same work, such as the
+    preparation of a template shared by all the subjects, are only run
+    once.
+
+    Parameters
+    ----------
+    pipeline: Pipeline (mandatory)
+        the CAPSUL pipeline. It keeps the values of the last parameters set.
+    parameters_sets: iterable of dict (mandatory)
+        the {parameter name: value} values of the pipeline parameters for
+        each execution, or the FOM attributes if completion is given.
+    study_config: StudyConfig (optional), or dict
+        see workflow_from_pipeline()
+    completion: ProcessWithFom (optional)
+        the FOM completion of the pipeline. If given, each parameters set
+        holds attributes which are used to complete the pipeline parameters
+        (see :py:class:`capsul.process.process_with_fom.ProcessWithFom`).
+    group_name: str (optional)
+        the format of the groups names, filled with the parameters set
+        values and its 'index', ie. 'subject_{subject}'. Default:
+        '<pipeline name>_{index}'.
+    name: str (optional)
+        the workflow name. Default: the pipeline name.
+    create_directories: bool (optional, default: True)
+        if set, the output directories of all the parameters sets are
+        created in a first job.
+    split_directories_job: bool (optional, default: False)
+        if set, the output directories are created by a job per branch
+        (see workflow_from_pipeline()).
+    deduplicate_jobs: bool (optional, default: True)
+        if set, the jobs running the same process with the same inputs and
+        outputs are only run once (see workflow_from_pipeline()).
+    kwargs:
+        other workflow_from_pipeline() parameters. The workflow skeleton
+        cache is used unless use_skeleton_cache is set to False.
+
+    Returns
+    -------
+    workflow: Workflow
+        a soma-workflow workflow
+    """
+    if group_name is None:
+        group_name = pipeline.name + '_{index}'
+    kwargs.setdefault('use_skeleton_cache', True)
+    all_jobs = []
+    all_dependencies = set()
+    groups = []
+    all_job_directories = {}
+    first_jobs = {}
+    for index, parameters in enumerate(parameters_sets):
+        if completion is not None:
+            completion.attributes.update(parameters)
+            completion.create_completion()
+        else:
+            for parameter, value in parameters.iteritems():
+                setattr(pipeline, parameter, value)
+        (jobs, dependencies, root_jobs, job_directories, job_identities) \
+            = _workflow_elements(
+                pipeline, study_config=study_config,
+                create_directories=create_directories,
+                deduplicate_jobs=deduplicate_jobs, **kwargs)
+        all_job_directories.update(job_directories)
+
+        # Run once the jobs already built for the previous sets
+        if deduplicate_jobs:
+            dependencies = _merge_duplicate_jobs(
+                jobs, dependencies, root_jobs, job_identities, first_jobs)
+
+        all_jobs += jobs
+        all_dependencies.update(dependencies)
+        groups.append(swclient.Group(
+            root_jobs, name=group_name.format(index=index, **parameters)))
+
+    if create_directories:
+        transfer_paths, shared_paths = _get_swf_paths(study_config)
+        _add_directories_jobs(
+            all_jobs, all_dependencies, groups, all_job_directories,
+            split=split_directories_job,
+            list_directory=_directories_list_directory(study_config),
+            transfer_paths=transfer_paths, shared_paths=shared_paths)
+
+    workflow = swclient.Workflow(jobs=all_jobs,
+        dependencies=all_dependencies,
+        root_group=groups,
+        name=name or pipeline.name)
+
+    return workflow
+
+
 def local_workflow_run(workflow_name, workflow):
     """ Create a soma-workflow controller and submit a workflow
 
@@ -7,15 +7,66 @@
 # for details.
 ##########################################################################
 
+from multiprocessing.pool import ThreadPool
+
 from traits.api import List, Undefined
 
 from capsul.process import Process
 from capsul.process import get_process_instance
+from capsul.process.worker_pool import get_worker_pool
+from capsul.process.runtime_history import get_runtime_history
+
+
+def _run_iteration(task):
+    """ Execute one iteration on a new instance of the iterated process.
+
+    Parameters
+    ----------
+    task: tuple (mandatory)
+        (process_source, parameters, output_names): the process identifier
+        given to get_process_instance, the parameters values to set and the
+        names of the output parameters to return.
+
+    Returns
+    -------
+    outputs: dict
+        the values of the output parameters after execution.
+    """
+    process_source, parameters, output_names = task
+    process = get_process_instance(process_source)
+    for name, value in parameters.iteritems():
+        setattr(process, name, value)
+    process()
+    return dict((name, getattr(process, name)) for name in output_names)
+
 
 class ProcessIteration(Process):
-    def __init__(self, process, iterative_parameters):
+    """ Iterate a process over lists of values of some of its parameters.
+
+    By default, iterations are executed one after the other on the same
+    process instance. If parallel_workers is greater than one, each iteration
+    is executed on a new instance of the process, by a pool of
+    parallel_workers threads (parallel_backend='thread') or by the
+    persistent worker processes shared by the session
+    (parallel_backend='process', see capsul.process.worker_pool). With the
+    'process' backend, the process identifier and the parameters values
+    have to be picklable.
+    """
+    def __init__(self, process, iterative_parameters, parallel_workers=1,
+                 parallel_backend='thread'):
         super(ProcessIteration, self).__init__()
         self.process = get_process_instance(process)
+        self.parallel_workers = parallel_workers
+        self.parallel_backend = parallel_backend
+
+        # Identifier used to create a new process instance for each parallel
+        # iteration
+        if hasattr(self.process, '_nipype_interface'):
+            self._process_source = self.process._nipype_interface.__class__
+        elif isinstance(process, Process):
+            self._process_source = process.__class__
+        else:
+            self._process_source = process
         self.regular_parameters = set()
         self.iterative_parameters = set(iterative_parameters)
         
@@ -34,7 +85,20 @@ class ProcessIteration(Process):
                 self.regular_parameters.add(name)
                 self.add_trait(name, trait)
                 
-    def _run_process(self):
+    def iterations_size(self):
+        """ Get the number of iterations from the iterative parameters
+        values.
+
+        Returns
+        -------
+        size: int
+            the number of iterations (None if there is no iterative
+            parameter).
+        no_output_value: bool
+            True if the iterative outputs have no value and have to be
+            collected after each iteration, False if their values are given
+            (None if there is no iterative output).
+        """
         # Check that all iterative parameter value have the same size
         no_output_value = None
         size = None
@@ -70,9 +134,63 @@ class ProcessIteration(Process):
                     
         if size_error:
             raise ValueError('Iterative parameter values must be lists of the same size: %s' % ','.join('%s=%d' % (n, len(getattr(self,n))) for n in self.iterative_parameters))
+        return size, no_output_value
+
+    def get_requirements(self):
+        """ Get the resources needed by the execution of all the iterations.
+
+        The cores and memory needed by the iterated process are multiplied
+        by the number of parallel workers, and its walltime by the number of
+        iterations executed by each worker.
+
+        Returns
+        -------
+        requirements: dict
+            the iterations requirements (see Process.get_requirements).
+        """
+        requirements = self.process.get_requirements()
+        size = self.iterations_size()[0]
+        workers = max(min(self.parallel_workers, size or 1), 1)
+        if requirements["cpu"] is not None:
+            requirements["cpu"] *= workers
+        if requirements["memory"] is not None:
+            requirements["memory"] *= workers
+        if requirements["walltime"] is not None:
+            requirements["walltime"] *= max(
+                ((size or 0) + workers - 1) // workers, 1)
+        requirements.update(self.requirements)
+        return requirements
+
+    def iteration_values(self, iteration, no_output_value=False):
+        """ Get the values of the iterative parameters for one iteration.
+
+        Parameters
+        ----------
+        iteration: int (mandatory)
+            the iteration index
+        no_output_value: bool (optional)
+            if True, iterative outputs are not given (see
+            :py:meth:`iterations_size`)
+
+        Returns
+        -------
+        values: dict
+            the iterative parameters values of the iteration
+        """
+        return dict((parameter, getattr(self, parameter)[iteration])
+                    for parameter in self.iterative_parameters
+                    if not no_output_value
+                        or not self.trait(parameter).output)
+
+    def _run_process(self):
+        size, no_output_value = self.iterations_size()
         if size == 0:
             return
-            
+
+        if self.parallel_workers > 1:
+            self._run_parallel(size, no_output_value)
+            return
+
         for parameter in self.regular_parameters:
             setattr(self.process, parameter, getattr(self, parameter))
         if no_output_value:
@@ -97,4 +215,50 @@ class ProcessIteration(Process):
                 for parameter in self.iterative_parameters:
                     setattr(self.process, parameter, getattr(self, parameter)[iteration])
                 self.process()
-            
\ No newline at end of file
+            
+
+    def _run_parallel(self, size, no_output_value):
+        """ Execute the iterations on a pool of parallel_workers threads or
+        on the shared worker processes. Iterative outputs are collected in
+        the iterations order.
+        """
+        if self.parallel_backend not in ('thread', 'process'):
+            raise ValueError('Unknown parallel backend %s, expected "thread" '
+                             'or "process"' % self.parallel_backend)
+
+        regular_values = dict((parameter, getattr(self, parameter))
+                              for parameter in self.regular_parameters)
+        output_names = []
+        if no_output_value:
+            output_names = [parameter
+                            for parameter in self.iterative_parameters
+                            if self.trait(parameter).output]
+        tasks = []
+        for iteration in xrange(size):
+            parameters = dict(regular_values)
+            parameters.update(self.iteration_values(iteration,
+                                                    no_output_value))
+            tasks.append((self._process_source, parameters, output_names))
+
+        if self.parallel_backend == 'process':
+            # The workers are reused by the following executions, pending
+            # iterations are dropped on the first failure
+            history = get_runtime_history()
+            history_file = history.db_file if history is not None else None
+            results = get_worker_pool(self.parallel_workers).map(
+                [task + (history_file, ) for task in tasks], fail_fast=True)
+        else:
+            # Stop pending iterations on the first failure
+            pool = ThreadPool(self.parallel_workers)
+            try:
+                results = pool.map(_run_iteration, tasks, chunksize=1)
+                pool.close()
+            except Exception:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+
+        for parameter in output_names:
+            setattr(self, parameter, [outputs[parameter]
+                                      for outputs in results])
@@ -0,0 +1,111 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+import unittest
+from capsul.pipeline import ProcessNode
+from capsul.pipeline.test.test_activation import MyPipeline
+from capsul.pipeline.test.test_switch_pipeline import SwitchPipeline
+from capsul.pipeline.test.test_double_switch import DoubleSwitchPipeline1
+from capsul.pipeline.test.test_switch_subpipeline import MainTestPipeline
+
+
+def hidden_state(pipeline):
+    """ Get the hidden property of all the process nodes traits.
+    """
+    result = {}
+    for node in pipeline.all_nodes():
+        if isinstance(node, ProcessNode):
+            for plug_name in node.plugs:
+                result[(node.full_name, plug_name)] = bool(
+                    node.process.trait(plug_name).hidden)
+    return result
+
+
+class TestIncrementalActivation(unittest.TestCase):
+
+    def check_full_update(self, pipeline):
+        """ Check that a full activations update does not change the
+        incremental result.
+        """
+        state = pipeline.pipeline_state()
+        hidden = hidden_state(pipeline)
+        pipeline.update_nodes_and_plugs_activation()
+        self.assertEqual(pipeline.compare_to_state(state), [])
+        self.assertEqual(hidden_state(pipeline), hidden)
+
+    def test_nodes_activation(self):
+        pipeline = MyPipeline()
+        for node_name in ("way11", "way12", "way21", "way22"):
+            setattr(pipeline.nodes_activation, node_name, False)
+            self.check_full_update(pipeline)
+        for node_name in ("way21", "way11", "way22", "way12"):
+            setattr(pipeline.nodes_activation, node_name, True)
+            self.check_full_update(pipeline)
+
+    def test_switch(self):
+        pipeline = SwitchPipeline()
+        for value in ("two", "none", "one", "two", "one", "none"):
+            pipeline.switch = value
+            self.check_full_update(pipeline)
+            pipeline.nodes["way21"].enabled = False
+            self.check_full_update(pipeline)
+            pipeline.nodes["way21"].enabled = True
+            self.check_full_update(pipeline)
+
+    def test_double_switch(self):
+        pipeline = DoubleSwitchPipeline1()
+        for value1, value2 in (("two", "one"), ("two", "two"),
+                               ("one", "two"), ("one", "one")):
+            pipeline.switch1 = value1
+            self.check_full_update(pipeline)
+            pipeline.switch2 = value2
+            self.check_full_update(pipeline)
+
+    def test_sub_pipeline(self):
+        pipeline = MainTestPipeline()
+        for value in ("two", "one", "two"):
+            pipeline.which_way = value
+            self.check_full_update(pipeline)
+        pipeline.nodes["way1_1"].process.nodes["process2"].enabled = False
+        self.check_full_update(pipeline)
+        pipeline.nodes["way1_1"].plugs["input2"].enabled = False
+        self.check_full_update(pipeline)
+        pipeline.nodes["way1_1"].plugs["input2"].enabled = True
+        self.check_full_update(pipeline)
+        pipeline.nodes["way1_1"].process.nodes["process2"].enabled = True
+        self.check_full_update(pipeline)
+
+    def test_links(self):
+        pipeline = SwitchPipeline()
+        pipeline.switch = "two"
+        pipeline.remove_link("way21.output_image->way22.input_image")
+        pipeline.add_link("node.output_image->way22.input_image")
+        self.check_full_update(pipeline)
+
+    def test_full_recomputation(self):
+        pipeline = SwitchPipeline()
+        pipeline.incremental_activation = False
+        pipeline.switch = "two"
+        state = pipeline.pipeline_state()
+        other_pipeline = SwitchPipeline()
+        other_pipeline.switch = "two"
+        self.assertEqual(other_pipeline.compare_to_state(state), [])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        TestIncrementalActivation)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
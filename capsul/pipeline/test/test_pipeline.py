@@ -73,6 +73,47 @@ class TestPipeline(unittest.TestCase):
         self.pipeline.workflow_ordered_nodes()
         self.assertEqual(self.pipeline.workflow_repr, "")
 
+    def test_batch_update(self):
+        with self.pipeline.batch_update():
+            setattr(self.pipeline.nodes_activation, "node2", False)
+            with self.pipeline.batch_update():
+                setattr(self.pipeline.nodes_activation, "node1", False)
+            self.assertTrue(self.pipeline.nodes["node1"].activated)
+            self.assertTrue(self.pipeline.nodes["node2"].activated)
+        self.assertFalse(self.pipeline.nodes["node1"].activated)
+        self.assertFalse(self.pipeline.nodes["node2"].activated)
+
+    def test_workflow_cache(self):
+        graph = self.pipeline.workflow_graph()
+        self.assertEqual(graph.topological_sort(), graph.topological_sort())
+        self.assertTrue(self.pipeline.workflow_graph() is graph)
+        self.assertEqual(self.pipeline.workflow_ordered_nodes(),
+                         self.pipeline.workflow_ordered_nodes())
+
+        # Link edits invalidate the graph
+        self.pipeline.remove_link("constant.output_image->node2.input_image")
+        graph = self.pipeline.workflow_graph()
+        self.assertTrue(graph.find_node("constant").links_to == [])
+
+        # Activation changes invalidate the graph
+        setattr(self.pipeline.nodes_activation, "node2", False)
+        self.pipeline.workflow_ordered_nodes()
+        self.assertEqual(self.pipeline.workflow_repr, "")
+        setattr(self.pipeline.nodes_activation, "node2", True)
+        self.assertFalse(self.pipeline.workflow_graph() is graph)
+        self.pipeline.workflow_ordered_nodes()
+        self.assertEqual(self.pipeline.workflow_repr, "node1->node2")
+
+        # Steps toggles select other graphs
+        self.pipeline.add_pipeline_step("step1", ["node2"])
+        self.assertEqual(len(self.pipeline.workflow_ordered_nodes()), 2)
+        self.pipeline.pipeline_steps.step1 = False
+        self.assertEqual(len(self.pipeline.workflow_ordered_nodes()), 1)
+        self.assertEqual(
+            len(self.pipeline.workflow_ordered_nodes(False)), 2)
+        self.pipeline.pipeline_steps.step1 = True
+        self.assertEqual(len(self.pipeline.workflow_ordered_nodes()), 2)
+
 
 def test():
     """ Function to execute unitest
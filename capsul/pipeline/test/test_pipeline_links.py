@@ -0,0 +1,77 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+import unittest
+from capsul.pipeline.test.test_switch_pipeline import SwitchPipeline
+from capsul.pipeline.test.test_switch_subpipeline import MainTestPipeline
+
+
+def plug_links(pipeline):
+    """ Get the links of all the plugs from the plugs links sets and from
+    the pipeline links index.
+    """
+    from_sets = set()
+    from_index = set()
+    link_index = pipeline._link_index
+    for node in pipeline.all_nodes():
+        for plug in node.plugs.itervalues():
+            for nn, pn, n, p, weak_link in plug.links_to:
+                from_sets.add((plug, n, pn, p, weak_link))
+            for n, pn, p, weak_link in link_index.successors(plug):
+                from_index.add((plug, n, pn, p, weak_link))
+            for nn, pn, n, p, weak_link in plug.links_from:
+                from_sets.add((p, node, None, plug, weak_link))
+            for n, pn, p, weak_link in link_index.predecessors(plug):
+                from_index.add((p, node, None, plug, weak_link))
+    return from_sets, from_index
+
+
+class TestPipelineLinks(unittest.TestCase):
+
+    def check_links(self, pipeline):
+        from_sets, from_index = plug_links(pipeline)
+        self.assertTrue(len(from_sets) != 0)
+        self.assertEqual(from_sets, from_index)
+
+    def test_add_remove_link(self):
+        pipeline = SwitchPipeline()
+        self.check_links(pipeline)
+        node = pipeline.nodes["way22"]
+        in_degree, out_degree = pipeline._link_index.node_degree(node)
+        pipeline.remove_link("way21.output_image->way22.input_image")
+        self.check_links(pipeline)
+        self.assertEqual(pipeline._link_index.node_degree(node),
+                         (in_degree - 1, out_degree))
+        pipeline.add_link("node.output_image->way22.input_image",
+                          weak_link=True)
+        pipeline.add_link("node.output_image->way22.input_image",
+                          weak_link=True)
+        self.check_links(pipeline)
+        self.assertEqual(pipeline._link_index.node_degree(node),
+                         (in_degree, out_degree))
+
+    def test_sub_pipeline(self):
+        pipeline = MainTestPipeline()
+        self.check_links(pipeline)
+        sub_pipeline = pipeline.nodes["way1_1"].process
+        self.assertTrue(sub_pipeline._link_index is pipeline._link_index)
+        sub_pipeline.remove_link("process2.output->process4.input2")
+        self.check_links(pipeline)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPipelineLinks)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
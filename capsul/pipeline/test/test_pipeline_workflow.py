@@ -10,11 +10,16 @@
 import unittest
 import os
 import sys
-from traits.api import File
+import shutil
+import tempfile
+import subprocess
+from traits.api import File, List
 from capsul.process import Process
 from capsul.pipeline import Pipeline, PipelineNode
+from capsul.pipeline import pipeline_tools
 from capsul.pipeline import pipeline_workflow
 from capsul.study_config.study_config import StudyConfig
+import soma_workflow.client as swclient
 
 
 class DummyProcess(Process):
@@ -33,6 +38,39 @@ class DummyProcess(Process):
         self.output = self.input
         self.output = self.output
 
+class DummyIterProcess(Process):
+    """ Dummy Test Process to iterate
+    """
+    def __init__(self):
+        super(DummyIterProcess, self).__init__()
+
+        # inputs
+        self.add_trait("input", File(optional=False))
+        self.add_trait("reference", File(optional=False))
+
+        # outputs
+        self.add_trait("output", File(output=True))
+
+    def _run_process(self):
+        self.output = self.input
+
+
+class DummyGatherProcess(Process):
+    """ Dummy Test Process with a list input
+    """
+    def __init__(self):
+        super(DummyGatherProcess, self).__init__()
+
+        # inputs
+        self.add_trait("inputs", List(File(), optional=False))
+
+        # outputs
+        self.add_trait("output", File(output=True))
+
+    def _run_process(self):
+        self.output = self.inputs[0]
+
+
 class DummyPipeline(Pipeline):
 
     def pipeline_definition(self):
@@ -68,6 +106,45 @@ class DummyPipeline(Pipeline):
             'outputs': (518.0, 278.0)}
 
 
+class DummyIterativePipeline(Pipeline):
+
+    def pipeline_definition(self):
+        # Create processes
+        self.add_process("node1", DummyProcess)
+        self.add_iterative_process("iterative", DummyIterProcess,
+                                   iterative_plugs=["input", "output"])
+        self.add_process("gather", DummyGatherProcess)
+        # Links
+        self.add_link("node1.output->iterative.reference")
+        self.add_link("iterative.output->gather.inputs")
+        # Outputs
+        self.export_parameter("node1", "output",
+                              pipeline_parameter="output1")
+        self.export_parameter("gather", "output",
+                              pipeline_parameter="output2")
+        self.export_parameter("iterative", "input",
+                              pipeline_parameter="iterative_input")
+        self.export_parameter("iterative", "output",
+                              pipeline_parameter="iterative_output")
+
+
+class DummyTemplatePipeline(Pipeline):
+
+    def pipeline_definition(self):
+        # Create processes
+        self.add_process("template", DummyProcess)
+        self.add_process("subject", DummyIterProcess)
+        # Links
+        self.add_link("template.output->subject.reference")
+        # Inputs and outputs
+        self.export_parameter("template", "input",
+                              pipeline_parameter="template_input")
+        self.export_parameter("template", "output",
+                              pipeline_parameter="template")
+        self.export_parameter("subject", "input")
+        self.export_parameter("subject", "output")
+
+
 class TestPipelineWorkflow(unittest.TestCase):
 
     def setUp(self):
@@ -112,6 +189,353 @@ class TestPipelineWorkflow(unittest.TestCase):
         self.assertEqual(len(wf.jobs), 3)
         self.assertEqual(len(wf.dependencies), 0)
 
+    def test_iterative_wf(self):
+        pipeline = DummyIterativePipeline()
+        pipeline.input = '/tmp/file_in.nii'
+        pipeline.output1 = '/tmp/file_out1.nii'
+        pipeline.output2 = '/tmp/file_out2.nii'
+        pipeline.iterative_input = ['/tmp/file_in%d.nii' % i
+                                    for i in range(3)]
+        pipeline.iterative_output = ['/tmp/file_out_it%d.nii' % i
+                                     for i in range(3)]
+        wf = pipeline_workflow.workflow_from_pipeline(
+            pipeline, study_config=self.study_config,
+            create_directories=False)
+        # one job per iteration (soma-workflow adds barrier jobs for the
+        # iterations group dependencies)
+        jobs = [job for job in wf.jobs
+                if not isinstance(job, swclient.BarrierJob)]
+        self.assertEqual(len(jobs), 5)
+        iteration_jobs = [job for job in jobs
+                          if job.name.startswith('iterative_')]
+        self.assertEqual(sorted(job.name for job in iteration_jobs),
+                         ['iterative_0', 'iterative_1', 'iterative_2'])
+        for i, job in enumerate(sorted(iteration_jobs,
+                                       key=lambda job: job.name)):
+            self.assertTrue('/tmp/file_out_it%d.nii' % i in job.command)
+        # node1 -> iterations group -> gather, through barriers
+        self.assertEqual(len(wf.dependencies), 8)
+        # the iterated process is left unchanged
+        self.assertEqual(
+            pipeline.nodes['iterative'].process.process.output, '')
+
+    def test_requirements(self):
+        self.pipeline.enable_all_pipeline_steps()
+        self.pipeline.nodes['node2'].process.requirements = {
+            'cpu': 4, 'memory': 2000}
+        self.pipeline.nodes['node3'].requirements['walltime'] = 5400
+        wf = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, native_specification_format='slurm')
+        specifications = dict((job.name, job.native_specification)
+                              for job in wf.jobs)
+        self.assertEqual(specifications, {
+            'node1': None, 'node2': '--cpus-per-task=4 --mem=2000M',
+            'node3': '--time=1:30:00', 'node4': None})
+        self.assertEqual(
+            pipeline_workflow.pbs_native_specification(
+                {'cpu': 4, 'memory': 2000, 'walltime': 5400}),
+            '-l nodes=1:ppn=4,mem=2000mb,walltime=1:30:00')
+
+        # Without format, no native specification is given
+        wf = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False)
+        self.assertEqual(set(job.native_specification for job in wf.jobs),
+                         set([None]))
+
+    def test_batch_jobs(self):
+        # jobs of different steps are not fused: remove the steps
+        for step in ('step1', 'step2', 'step3'):
+            self.pipeline.remove_pipeline_step(step)
+        self.pipeline.nodes['node2'].process.requirements = {'memory': 1000}
+        durations = {'node1': 0.5, 'node2': 0.5, 'node3': 0.5, 'node4': 10.}
+        wf = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, batch_max_duration=1.,
+            nodes_durations=durations, native_specification_format='pbs')
+        jobs = dict((job.name, job) for job in wf.jobs)
+        # node1 and node2 form a chain, node2 is followed by two nodes
+        self.assertEqual(sorted(jobs), ['node1+node2', 'node3', 'node4'])
+        self.assertEqual(sorted((src.name, dst.name)
+                                for src, dst in wf.dependencies),
+                         [('node1+node2', 'node3'), ('node1+node2', 'node4')])
+        batch_job = jobs['node1+node2']
+        self.assertEqual(batch_job.command[:2], ['python', '-c'])
+        self.assertEqual(batch_job.native_specification, '-l mem=1000mb')
+        self.assertEqual(len([item for item in batch_job.command
+                              if isinstance(item, str) and
+                              'DummyProcess()' in item]), 2)
+
+        # Nodes without estimate are not fused
+        wf = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, batch_max_duration=1.)
+        self.assertEqual(len(wf.jobs), 4)
+
+    def test_critical_path_priorities(self):
+        self.pipeline.enable_all_pipeline_steps()
+        wf = pipeline_workflow.workflow_from_pipeline(
+            self.pipeline, study_config=self.study_config,
+            create_directories=False, jobs_priority=10,
+            prioritize_critical_path=True,
+            nodes_durations={'node3': 10., 'node4': 1.})
+        priorities = dict((job.name, job.priority) for job in wf.jobs)
+        self.assertEqual(priorities, {'node1': 13, 'node2': 12, 'node3': 11,
+                                      'node4': 10})
+
+    def test_skeleton_cache(self):
+        pipeline_workflow.clear_workflow_skeletons()
+
+        def job_names(pipeline):
+            wf = pipeline_workflow.workflow_from_pipeline(
+                pipeline, study_config=self.study_config,
+                create_directories=False, use_skeleton_cache=True)
+            return dict((job.name, job) for job in wf.jobs
+                        if not isinstance(job, swclient.BarrierJob))
+
+        pipelines = []
+        for subject, size in (('s1', 3), ('s2', 3), ('s3', 2)):
+            pipeline = DummyIterativePipeline()
+            pipeline.input = '/data/%s/file_in.nii' % subject
+            pipeline.output1 = '/data/%s/file_out1.nii' % subject
+            pipeline.output2 = '/data/%s/file_out2.nii' % subject
+            pipeline.iterative_input = ['/data/%s/file_in%d.nii' % (subject, i)
+                                        for i in range(size)]
+            pipeline.iterative_output = [
+                '/data/%s/file_out_it%d.nii' % (subject, i)
+                for i in range(size)]
+            pipelines.append(pipeline)
+        self.assertEqual(
+            pipeline_tools.structural_fingerprint(pipelines[0]),
+            pipeline_tools.structural_fingerprint(pipelines[1]))
+        job_names(pipelines[0])
+        self.assertEqual(len(pipeline_workflow._workflow_skeletons), 1)
+
+        # Pipelines with the same structure share the skeleton, the jobs
+        # are built from their own values
+        for pipeline, size in zip(pipelines[1:], (3, 2)):
+            jobs = job_names(pipeline)
+            self.assertEqual(len(pipeline_workflow._workflow_skeletons), 1)
+            self.assertEqual(len(jobs), 2 + size)
+            self.assertTrue(pipeline.output2 in jobs['gather'].command)
+            for i in range(size):
+                self.assertTrue(pipeline.iterative_output[i]
+                                in jobs['iterative_%d' % i].command)
+
+        # Empty iterations change the workflow structure
+        pipelines[2].iterative_input = []
+        pipelines[2].iterative_output = []
+        self.assertEqual(sorted(job_names(pipelines[2])), ['gather', 'node1'])
+        self.assertEqual(len(pipeline_workflow._workflow_skeletons), 2)
+
+        # Disabled steps change the fingerprint
+        fingerprint = pipeline_tools.structural_fingerprint(self.pipeline)
+        self.pipeline.pipeline_steps.step3 = False
+        self.assertNotEqual(
+            pipeline_tools.structural_fingerprint(self.pipeline), fingerprint)
+        pipeline_workflow.clear_workflow_skeletons()
+
+    def test_batch_wf(self):
+        pipeline = DummyTemplatePipeline()
+        pipeline.template_input = '/data/atlas.nii'
+        pipeline.template = '/data/template/template.nii'
+
+        def parameters_sets():
+            for subject in ('s1', 's2', 's3'):
+                yield {'subject': subject,
+                       'input': '/data/%s/t1.nii' % subject,
+                       'output': '/data/%s/output/t1.nii' % subject}
+
+        wf = pipeline_workflow.workflow_from_pipeline_batch(
+            pipeline, parameters_sets(), study_config=self.study_config,
+            group_name='subject_{subject}', name='study')
+        self.assertEqual(wf.name, 'study')
+        self.assertEqual([group.name for group in wf.root_group],
+                         ['output directories creation', 'subject_s1',
+                          'subject_s2', 'subject_s3'])
+        jobs = [job for job in wf.jobs
+                if not isinstance(job, swclient.BarrierJob)]
+        # the template is prepared once
+        self.assertEqual(sorted(job.name for job in jobs),
+                         ['output directories creation', 'subject',
+                          'subject', 'subject', 'template'])
+        template_job = [job for job in jobs if job.name == 'template'][0]
+        for subject, group in zip(('s1', 's2', 's3'), wf.root_group[1:]):
+            subject_job = [job for job in group.elements
+                           if job.name == 'subject'][0]
+            template_barrier = [job for job in group.elements
+                                if job.name == 'template'][0]
+            self.assertTrue('/data/%s/t1.nii' % subject
+                            in subject_job.command)
+            self.assertTrue((template_barrier, subject_job)
+                            in wf.dependencies)
+            if template_barrier is not template_job:
+                self.assertTrue((template_job, template_barrier)
+                                in wf.dependencies)
+        # a single job creates the directories of all the subjects
+        dirs_job = wf.root_group[0]
+        self.assertEqual(dirs_job.command[:2], ['python', '-c'])
+        self.assertEqual(sorted(dirs_job.command[3:]),
+                         ['/data/s1/output', '/data/s2/output',
+                          '/data/s3/output', '/data/template'])
+
+        # or a job per subject directory
+        wf = pipeline_workflow.workflow_from_pipeline_batch(
+            pipeline, parameters_sets(), study_config=self.study_config,
+            group_name='subject_{subject}', split_directories_job=True)
+        dirs_jobs = dict((job.name, job) for job in wf.root_group[:4])
+        self.assertEqual(sorted(dirs_jobs), [
+            'output directories creation (/data/%s)' % branch
+            for branch in ('s1', 's2', 's3', 'template')])
+        for subject, group in zip(('s1', 's2', 's3'), wf.root_group[4:]):
+            subject_job = [job for job in group.elements
+                           if job.name == 'subject'][0]
+            self.assertEqual(
+                sorted(src.name for src, dst in wf.dependencies
+                       if dst is subject_job
+                       and src.name.startswith('output')),
+                ['output directories creation (/data/%s)' % subject])
+
+    def test_batch_temporary_files(self):
+        pipeline = Pipeline()
+        pipeline.add_process('a', DummyProcess)
+        pipeline.add_process('b', DummyProcess)
+        pipeline.add_process('c', DummyProcess)
+        pipeline.add_link('a.output->b.input')
+        pipeline.add_link('b.output->c.input')
+        pipeline.export_parameter('a', 'input')
+        pipeline.export_parameter('c', 'output')
+
+        parameters_sets = [{'input': '/data/s%d/t1.nii' % index,
+                            'output': '/data/s%d/out.nii' % index}
+                           for index in (1, 2)]
+        wf = pipeline_workflow.workflow_from_pipeline_batch(
+            pipeline, parameters_sets, study_config=self.study_config,
+            create_directories=False)
+        # the jobs writing or reading temporary files are never merged
+        self.assertEqual([job for job in wf.jobs
+                          if isinstance(job, swclient.BarrierJob)], [])
+        self.assertEqual(sorted(job.name for job in wf.jobs),
+                         ['a', 'a', 'b', 'b', 'c', 'c'])
+        for group in wf.root_group:
+            jobs = dict((job.name, job) for job in group.elements)
+            self.assertTrue((jobs['a'], jobs['b']) in wf.dependencies)
+            self.assertTrue((jobs['b'], jobs['c']) in wf.dependencies)
+            temporary = [item for item in jobs['b'].command
+                         if isinstance(item, swclient.TemporaryPath)]
+            self.assertEqual(len(temporary), 2)
+            self.assertTrue(temporary[0] in jobs['a'].command)
+            self.assertTrue(temporary[1] in jobs['c'].command)
+
+    def test_deduplicate_jobs(self):
+        pipeline = Pipeline()
+        for index in (1, 2):
+            template = 'template%d' % index
+            pipeline.add_process(template, DummyProcess)
+            pipeline.add_process('subject%d' % index, DummyIterProcess)
+            pipeline.add_link('%s.output->subject%d.reference'
+                              % (template, index))
+            pipeline.export_parameter(template, 'input', 'atlas%d' % index)
+            pipeline.export_parameter(template, 'output', template)
+            pipeline.export_parameter('subject%d' % index, 'input',
+                                      'input%d' % index)
+            pipeline.export_parameter('subject%d' % index, 'output',
+                                      'output%d' % index)
+            setattr(pipeline, 'atlas%d' % index, '/data/atlas.nii')
+            setattr(pipeline, template, '/data/template.nii')
+            setattr(pipeline, 'input%d' % index, '/data/s%d/t1.nii' % index)
+            setattr(pipeline, 'output%d' % index, '/data/s%d/out.nii' % index)
+        wf = pipeline_workflow.workflow_from_pipeline(
+            pipeline, study_config=self.study_config,
+            create_directories=False)
+        self.assertEqual(len(wf.jobs), 4)
+        wf = pipeline_workflow.workflow_from_pipeline(
+            pipeline, study_config=self.study_config,
+            create_directories=False, deduplicate_jobs=True)
+        jobs = dict((job.name, job) for job in wf.jobs)
+        self.assertEqual(sorted(jobs), ['subject1', 'subject2', 'template1',
+                                        'template2'])
+        # the duplicate template is a barrier on the first one
+        first, duplicate = sorted(
+            (jobs['template1'], jobs['template2']),
+            key=lambda job: isinstance(job, swclient.BarrierJob))
+        self.assertTrue(isinstance(duplicate, swclient.BarrierJob))
+        self.assertFalse(isinstance(first, swclient.BarrierJob))
+        self.assertEqual(sorted((src.name, dst.name)
+                                for src, dst in wf.dependencies),
+                         sorted([(first.name, duplicate.name),
+                                 ('template1', 'subject1'),
+                                 ('template2', 'subject2')]))
+
+        # jobs with different outputs are not merged
+        pipeline.template2 = '/data/other_template.nii'
+        wf = pipeline_workflow.workflow_from_pipeline(
+            pipeline, study_config=self.study_config,
+            create_directories=False, deduplicate_jobs=True)
+        self.assertEqual([job for job in wf.jobs
+                          if isinstance(job, swclient.BarrierJob)], [])
+
+    def test_directories_job(self):
+        self.assertEqual(
+            pipeline_workflow._directories_subtrees(
+                ['/data/s1/a', '/data/s1/a/b', '/data/s10', '/data/s1/c']),
+            [['/data/s1', ['a/b', 'c']], ['/data/s10', []]])
+        self.assertEqual(
+            pipeline_workflow._directories_subtrees(['/data/s1/a']),
+            [['/data/s1/a', []]])
+
+        directory = tempfile.mkdtemp()
+        inline_size = pipeline_workflow.DIRECTORIES_INLINE_SIZE
+        try:
+            directories = [os.path.join(directory, 'subject%d' % index,
+                                        'output')
+                           for index in range(100)]
+            job = pipeline_workflow._directories_job(directories)
+            self.assertEqual(job.command[3:], sorted(directories))
+
+            # Long lists are read from a file
+            pipeline_workflow.DIRECTORIES_INLINE_SIZE = 100
+            job = pipeline_workflow._directories_job(
+                directories, list_directory=directory)
+            self.assertEqual(job.command[3], '-f')
+            self.assertEqual(os.path.dirname(job.command[4]), directory)
+            subprocess.check_call(job.command)
+            for path in directories:
+                self.assertTrue(os.path.isdir(path))
+            # the list file is removed by the job
+            self.assertFalse(os.path.exists(job.command[4]))
+            # the existing directories are skipped
+            shutil.rmtree(directories[0])
+            job = pipeline_workflow._directories_job(
+                directories, list_directory=directory)
+            subprocess.check_call(job.command)
+            self.assertTrue(os.path.isdir(directories[0]))
+
+            # On a remote resource the list file is transferred or translated
+            job = pipeline_workflow._directories_job(
+                directories, list_directory=directory,
+                transfer_paths=[directory])
+            list_file = job.command[4]
+            self.assertTrue(isinstance(list_file, swclient.FileTransfer))
+            self.assertEqual(job.referenced_input_files, [list_file])
+            self.assertEqual(os.path.dirname(list_file.client_path),
+                             directory)
+            os.remove(list_file.client_path)
+            job = pipeline_workflow._directories_job(
+                directories, list_directory=directory,
+                shared_paths={os.path.dirname(directory): ('data', 'uuid')})
+            list_file = job.command[4]
+            self.assertTrue(isinstance(list_file,
+                                       swclient.SharedResourcePath))
+            self.assertEqual(list_file.namespace, 'data')
+            self.assertEqual(os.path.dirname(list_file.relative_path),
+                             os.path.basename(directory))
+            self.assertEqual(job.referenced_input_files, [])
+        finally:
+            pipeline_workflow.DIRECTORIES_INLINE_SIZE = inline_size
+            shutil.rmtree(directory)
+
     def test_partial_wf3_fail(self):
         self.pipeline.enable_all_pipeline_steps()
         self.pipeline.pipeline_steps.step1 = False
@@ -50,6 +50,14 @@ class ProcessSlice(Process):
         f.write(struct.pack('H', self.slice_number))
         f.close()
 
+class Square(Process):
+    x = Int()
+    y = Int(output=True)
+
+    def _run_process(self):
+        self.y = self.x * self.x
+
+
 class MyPipeline(Pipeline):
     """ Simple Pipeline to test the iterative Node
     """
@@ -116,6 +124,30 @@ class TestPipeline(unittest.TestCase):
         numbers = struct.unpack_from('H' * self.parallel_processes, result)
         self.assertEqual(numbers, tuple(range(self.parallel_processes)))
 
+    def test_parallel_iterations(self):
+        """ Method to test the execution of iterations in parallel.
+        """
+        for backend in ('thread', 'process'):
+            self.output_file.truncate(0)
+            process = self.pipeline.nodes['process_slices'].process
+            process.parallel_workers = 4
+            process.parallel_backend = backend
+            self.pipeline()
+            result = open(self.pipeline.output_image,'rb').read()
+            numbers = struct.unpack_from('H' * self.parallel_processes,
+                                         result)
+            self.assertEqual(numbers, tuple(range(self.parallel_processes)))
+
+    def test_parallel_outputs(self):
+        """ Method to test that parallel iterations outputs are collected
+        in order.
+        """
+        process = ProcessIteration(Square, iterative_parameters=['x', 'y'],
+                                   parallel_workers=3)
+        process.x = range(10)
+        process()
+        self.assertEqual(process.y, [x * x for x in range(10)])
+
 
 def test():
     """ Function to execute unitest
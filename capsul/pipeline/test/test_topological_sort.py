@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+import unittest
+from capsul.pipeline.topological_sort import Graph, GraphNode
+
+
+class TestGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = Graph()
+        for name in ("a", "b", "c", "d", "e"):
+            self.graph.add_node(GraphNode(name, None))
+        for link in (("a", "b"), ("a", "c"), ("b", "d"), ("c", "d"),
+                     ("e", "d")):
+            self.graph.add_link(*link)
+
+    def test_sort_is_repeatable(self):
+        order = [name for name, meta in self.graph.topological_sort()]
+        self.assertEqual(order.index("a") < order.index("b"), True)
+        self.assertEqual(order[-1], "d")
+        self.assertEqual(
+            [name for name, meta in self.graph.topological_sort()], order)
+        self.assertEqual(self.graph.find_node("d").links_from_degree, 3)
+
+    def test_duplicate_links(self):
+        self.graph.add_link("a", "b")
+        node = self.graph.find_node("a")
+        self.assertEqual(len(self.graph._links), 5)
+        self.assertEqual([n.name for n in node.links_to], ["b", "c"])
+        node.remove_link_to(self.graph.find_node("b"))
+        node.add_link_to(self.graph.find_node("b"))
+        self.assertEqual([n.name for n in node.links_to], ["c", "b"])
+        self.assertEqual(node.links_to_degree, 2)
+
+    def test_levels(self):
+        levels = [sorted(level) for level in self.graph.levels()]
+        self.assertEqual(levels, [["a", "e"], ["b", "c"], ["d"]])
+        self.assertEqual(self.graph.level_widths(), [2, 2, 1])
+
+    def test_critical_path(self):
+        costs = {"a": 1., "b": 5., "c": 2., "d": 1., "e": 3.}
+        self.assertEqual(self.graph.top_levels(costs),
+                         {"a": 0., "b": 1., "c": 1., "d": 6., "e": 0.})
+        self.assertEqual(self.graph.bottom_levels(costs),
+                         {"a": 7., "b": 6., "c": 3., "d": 1., "e": 4.})
+        self.assertEqual(self.graph.critical_path(costs),
+                         (["a", "b", "d"], 7.))
+        self.assertEqual(self.graph.critical_path()[1], 3.)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestGraph)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
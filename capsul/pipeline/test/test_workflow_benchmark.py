@@ -0,0 +1,147 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+import os
+import sys
+import json
+import time
+import resource
+import unittest
+import subprocess
+from traits.api import File
+import capsul
+from capsul.process import Process
+from capsul.pipeline import Pipeline
+from capsul.pipeline import pipeline_workflow
+
+# Script measuring a workflow conversion in a new interpreter, so that the
+# peak memory of each size is measured independently
+_MEASURE_SCRIPT = """
+import json
+from capsul.pipeline.test.test_workflow_benchmark import measure_conversion
+print(json.dumps(measure_conversion({subjects})))
+"""
+
+
+class StepProcess(Process):
+    """ A processing step.
+    """
+    input_image = File(optional=True, output=False)
+    output_image = File(optional=True, output=True)
+
+    def _run_process(self):
+        pass
+
+
+class StudyPipeline(Pipeline):
+    """ A chain of three steps for each subject.
+    """
+    def __init__(self, subjects, **kwargs):
+        self.subjects = subjects
+        super(StudyPipeline, self).__init__(
+            autoexport_nodes_parameters=False, **kwargs)
+
+    def pipeline_definition(self):
+        for index in range(self.subjects):
+            steps = ["{0}_{1}".format(step, index)
+                     for step in ("first", "second", "third")]
+            for step in steps:
+                self.add_process(step, StepProcess)
+            self.add_link("{0}.output_image->{1}.input_image".format(
+                *steps[:2]))
+            self.add_link("{0}.output_image->{1}.input_image".format(
+                *steps[1:]))
+            self.nodes[steps[0]].process.input_image = \
+                "/study/subject_{0}/image.nii".format(index)
+            result = "result_{0}".format(index)
+            self.export_parameter(steps[-1], "output_image", result)
+            setattr(self, result,
+                    "/study/subject_{0}/result/image.nii".format(index))
+
+
+def measure_conversion(subjects):
+    """ Convert a study pipeline to a workflow.
+
+    Parameters
+    ----------
+    subjects: int (mandatory)
+        the number of subjects: the workflow has three jobs per subject
+        plus a directories creation job.
+
+    Returns
+    -------
+    measure: dict
+        the number of 'jobs', the conversion 'duration' in seconds and the
+        increase of the peak resident 'memory' in MB during the conversion.
+    """
+    pipeline = StudyPipeline(subjects)
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    workflow = pipeline_workflow.workflow_from_pipeline(pipeline)
+    duration = time.time() - start
+    return {
+        "jobs": len(workflow.jobs),
+        "duration": duration,
+        "memory": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss -
+                   memory) / 1024.
+    }
+
+
+def benchmark(subjects=(100, 300, 1000, 3000)):
+    """ Print the conversion time and peak memory versus the number of
+    jobs, each size being measured in a new interpreter.
+    """
+    env = os.environ.copy()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(capsul.__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        [root] + [path for path in [env.get("PYTHONPATH")] if path])
+    print("{0:>8} {1:>12} {2:>12} {3:>12}".format(
+        "jobs", "duration (s)", "us / job", "memory (MB)"))
+    for count in subjects:
+        output = subprocess.check_output(
+            [sys.executable, "-c", _MEASURE_SCRIPT.format(subjects=count)],
+            env=env)
+        measure = json.loads(output.strip().splitlines()[-1])
+        print("{0:>8} {1:>12.3f} {2:>12.1f} {3:>12.1f}".format(
+            measure["jobs"], measure["duration"],
+            1e6 * measure["duration"] / measure["jobs"], measure["memory"]))
+
+
+class TestWorkflowBenchmark(unittest.TestCase):
+    """ Class to test the conversion of large pipelines.
+    """
+    def test_study_workflow(self):
+        pipeline = StudyPipeline(50)
+        workflow = pipeline_workflow.workflow_from_pipeline(pipeline)
+        self.assertEqual(len(workflow.jobs), 151)
+        jobs = dict((job.name, job) for job in workflow.jobs)
+        self.assertTrue((jobs["first_7"], jobs["second_7"])
+                        in workflow.dependencies)
+        self.assertTrue((jobs["second_7"], jobs["third_7"])
+                        in workflow.dependencies)
+        # the first jobs also depend on the directories creation job
+        self.assertEqual(len(workflow.dependencies), 3 * 50)
+
+    def test_measure(self):
+        measure = measure_conversion(10)
+        self.assertEqual(measure["jobs"], 31)
+        self.assertTrue(measure["duration"] > 0.)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkflowBenchmark)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
+    benchmark()
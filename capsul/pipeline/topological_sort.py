@@ -53,9 +53,12 @@ class GraphNode(object):
         """
         self.name = name
         self.meta = meta
-        # variables to store the graph edges
+        # variables to store the graph edges, indexed by sets to check
+        # the existing edges in constant time
         self.links_to = []
         self.links_from = []
+        self._links_to_set = set()
+        self._links_from_set = set()
         # the degree of the node
         self.links_to_degree = 0
         self.links_from_degree = 0
@@ -68,7 +71,8 @@ class GraphNode(object):
         node: GraphNode (mandatory)
         the successor node
         """
-        if node not in self.links_to:
+        if node not in self._links_to_set:
+            self._links_to_set.add(node)
             self.links_to.append(node)
             self.links_to_degree += 1
 
@@ -80,7 +84,8 @@ class GraphNode(object):
         node: GraphNode (mandatory)
         the successor node
         """
-        if node in self.links_to:
+        if node in self._links_to_set:
+            self._links_to_set.remove(node)
             self.links_to.remove(node)
             self.links_to_degree -= 1
 
@@ -92,7 +97,8 @@ class GraphNode(object):
         node: GraphNode (mandatory)
         the predecessor node
         """
-        if node not in self.links_from:
+        if node not in self._links_from_set:
+            self._links_from_set.add(node)
             self.links_from.append(node)
             self.links_from_degree += 1
 
@@ -104,7 +110,8 @@ class GraphNode(object):
         node: GraphNode (mandatory)
         the predecessor node
         """
-        if node in self.links_from:
+        if node in self._links_from_set:
+            self._links_from_set.remove(node)
             self.links_from.remove(node)
             self.links_from_degree -= 1
 
@@ -114,13 +121,14 @@ class Graph(object):
     topological tree (no cycle).
 
     The algorithm is based on the R.E. Tarjanlinear linear
-    optimization (O(N+A)).
+    optimization (O(N+A)). The sort does not modify the graph, and its
+    result is kept until a node or a link is added.
 
     Attributes
     ----------
     _nodes : dict
         the graph nodes {node.name: node}
-    _links : list
+    _links : set
         graph edges (from_node, to_node)
 
     Methods
@@ -129,13 +137,19 @@ class Graph(object):
     find_node
     add_link
     topological_sort
+    levels
+    level_widths
+    top_levels
+    bottom_levels
+    critical_path
     """
 
     def __init__(self):
         """ Create a Graph
         """
         self._nodes = {}
-        self._links = []
+        self._links = set()
+        self._ordered_nodes = None
 
     def add_node(self, node):
         """ Method to add a GraphNode in the Graph
@@ -152,6 +166,7 @@ class Graph(object):
             raise Exception("Expect a GraphNode with a unique name, "
                             "got {0}".format(node))
         self._nodes[node.name] = node
+        self._ordered_nodes = None
 
     def find_node(self, node_name):
         """ Method to find a GraphNode in the Graph
@@ -185,7 +200,8 @@ class Graph(object):
         if (from_node, to_node) not in self._links:
             self._nodes[to_node].add_link_from(self._nodes[from_node])
             self._nodes[from_node].add_link_to(self._nodes[to_node])
-            self._links.append((from_node, to_node))
+            self._links.add((from_node, to_node))
+            self._ordered_nodes = None
 
     def topological_sort(self):
         """ Perform the topological sort: find an order in which all the
@@ -194,21 +210,28 @@ class Graph(object):
         Step 2: Loop until there are nnil
         a) Delete the current nodes c_nnil of in-degree 0.
         b) Place it in the output.
-        c) Remove all its outgoing links from the graph.
+        c) Remove all its outgoing links from the in-degrees count.
         d) If the node has in-degree 0, add the node to nnil.
         Step 3: Assert that there is no loop in the graph.
 
+        The in-degrees are counted aside, so that the graph is left
+        unchanged and can be sorted again.
+
         Returns
         -------
         output: list of tuple
             a list of ordered nodes with a tuple element containing the node
             name and the node meta element.
         """
+        if self._ordered_nodes is not None:
+            return list(self._ordered_nodes)
         ordered_nodes = []
 
         # Step 1
         nnil = []
+        degrees = {}
         for name, node in self._nodes.iteritems():
+            degrees[node] = node.links_from_degree
             if node.links_from_degree == 0:
                 nnil.append(node)
 
@@ -220,19 +243,146 @@ class Graph(object):
             ordered_nodes.append(c_nnil)
         #-- c
             for node in c_nnil.links_to:
-                node.remove_link_from(c_nnil)
+                degrees[node] -= 1
         #-- d
-                if node.links_from_degree == 0:
+                if degrees[node] == 0:
                     nnil.append(node)
 
         # Step 3
         if len(ordered_nodes) == len(self._nodes):
-            return [(node.name, node.meta) for node in ordered_nodes]
+            self._ordered_nodes = [(node.name, node.meta)
+                                   for node in ordered_nodes]
+            return list(self._ordered_nodes)
         else:
             raise Exception("There is loop in the Graph."
                             "Please inverstigate")
 
 
+    def levels(self):
+        """ Group the nodes in successive waves of nodes that can be taken
+        at the same time: a node is in the wave following the last wave of
+        its predecessors.
+
+        Returns
+        -------
+        levels: list of list of str
+            the node names of each wave, in the topological order.
+        """
+        node_levels = {}
+        levels = []
+        for name, meta in self.topological_sort():
+            level = 0
+            for pnode in self._nodes[name].links_from:
+                level = max(level, node_levels[pnode.name] + 1)
+            node_levels[name] = level
+            if level == len(levels):
+                levels.append([])
+            levels[level].append(name)
+        return levels
+
+    def level_widths(self):
+        """ Get the number of nodes of each wave (see :py:meth:`levels`).
+
+        Returns
+        -------
+        widths: list of int
+            the number of nodes that can be taken at the same time in each
+            wave.
+        """
+        return [len(level) for level in self.levels()]
+
+    def _cost_function(self, costs):
+        """ Get a function returning the cost of a node from its name and
+        meta element.
+        """
+        if costs is None:
+            return lambda name, meta: 1.
+        if isinstance(costs, dict):
+            return lambda name, meta: costs.get(name, 1.)
+        return costs
+
+    def top_levels(self, costs=None):
+        """ Compute the earliest start of each node: the length of the
+        longest path from a node without predecessor to the node, the node
+        excluded.
+
+        Parameters
+        ----------
+        costs: dict or callable (optional)
+            the cost of each node, as a {node.name: cost} dict or as a
+            function returning the cost of a node from its name and meta
+            element. Default: 1 for each node.
+
+        Returns
+        -------
+        top_levels: dict
+            the top level of each node {node.name: top_level}.
+        """
+        cost = self._cost_function(costs)
+        top_levels = {}
+        for name, meta in self.topological_sort():
+            top_level = 0.
+            for pnode in self._nodes[name].links_from:
+                top_level = max(top_level, top_levels[pnode.name] +
+                                cost(pnode.name, pnode.meta))
+            top_levels[name] = top_level
+        return top_levels
+
+    def bottom_levels(self, costs=None):
+        """ Compute the length of the longest path from each node to a node
+        without successor, the node included.
+
+        Nodes with the highest bottom levels are the ones on the critical
+        path and should be taken first when several nodes can be taken.
+
+        Parameters
+        ----------
+        costs: dict or callable (optional)
+            the cost of each node (see :py:meth:`top_levels`).
+
+        Returns
+        -------
+        bottom_levels: dict
+            the bottom level of each node {node.name: bottom_level}.
+        """
+        cost = self._cost_function(costs)
+        bottom_levels = {}
+        for name, meta in reversed(self.topological_sort()):
+            bottom_level = 0.
+            for snode in self._nodes[name].links_to:
+                bottom_level = max(bottom_level, bottom_levels[snode.name])
+            bottom_levels[name] = bottom_level + cost(name, meta)
+        return bottom_levels
+
+    def critical_path(self, costs=None):
+        """ Find the longest path of the graph.
+
+        Parameters
+        ----------
+        costs: dict or callable (optional)
+            the cost of each node (see :py:meth:`top_levels`).
+
+        Returns
+        -------
+        path: list of str
+            the names of the nodes of the longest path.
+        length: float
+            the length of the longest path.
+        """
+        bottom_levels = self.bottom_levels(costs)
+        path = []
+        candidates = [node for node in self._nodes.itervalues()
+                      if node.links_from_degree == 0]
+        while candidates:
+            node = max(candidates, key=lambda n: bottom_levels[n.name])
+            path.append(node.name)
+            candidates = node.links_to
+        length = 0.
+        if path:
+            length = bottom_levels[path[0]]
+        return path, length
+
+
 if __name__ == '__main__':
 
     """ A toy example:
@@ -11,4 +11,7 @@ from process import Process
 from process import NipypeProcess
 from process import ProcessResult
 from process import FileCopyProcess
+from runtime_report import set_runtime_report_level
+from runtime_history import RuntimeHistory
+from runtime_history import set_runtime_history
 from loader import get_process_instance
@@ -9,6 +9,7 @@
 
 # System import
 import logging
+import importlib
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -17,13 +18,20 @@ logger = logging.getLogger(__name__)
 from process import Process
 from nipype_process import nipype_factory
 from capsul.utils.loader import load_objects
+from capsul.utils.lazy_import import loaded_class
 
-# Nipype import
-try:
-    from nipype.interfaces.base import Interface
-# If nipype is not found create a dummy Interface class
-except ImportError:
-    Interface = type("Interface", (object, ), {})
+# Dummy Interface class used when nipype is not imported
+_NoInterface = type("Interface", (object, ), {})
+
+
+def _nipype_interface_class():
+    """ Get the nipype Interface class without importing nipype.
+
+    A nipype interface can only be given if nipype has already been
+    imported, so nipype is not loaded (nor probed) by capsul itself.
+    """
+    return (loaded_class("nipype.interfaces.base", "Interface") or
+            _NoInterface)
 
 
 def get_process_instance(process_or_id, **kwargs):
@@ -78,12 +86,12 @@ def get_process_instance(process_or_id, **kwargs):
 
     # If the function 'process_or_id' parameter is already a Nipye
     # interface instance, wrap this structure in a Process class
-    elif isinstance(process_or_id, Interface):
+    elif isinstance(process_or_id, _nipype_interface_class()):
         result = nipype_factory(process_or_id)
 
     # If the function 'process_or_id' parameter is an Interface class.
     elif (isinstance(process_or_id, type) and
-          issubclass(process_or_id, Interface)):
+          issubclass(process_or_id, _nipype_interface_class())):
         result = nipype_factory(process_or_id())
 
     # If the function 'process_or_id' parameter is a class string
@@ -99,10 +107,17 @@ def get_process_instance(process_or_id, **kwargs):
             module_name = ".".join(id_list[:-1])
             object_name = id_list[-1]
 
+        # Import the module first, so that the nipype Interface class is
+        # known if the module defines nipype interfaces
+        try:
+            importlib.import_module(module_name)
+        except (ImportError, ValueError):
+            pass
+
         # Try to load the class
         module_objects = load_objects(
             module_name, object_name,
-            allowed_instances=[Process, Interface])
+            allowed_instances=[Process, _nipype_interface_class()])
 
         # Expect only one Process
         if len(module_objects) != 1:
@@ -119,7 +134,7 @@ def get_process_instance(process_or_id, **kwargs):
 
         # If we have a Nipype interface, wrap this structure in a Process
         # class
-        if isinstance(result, Interface):
+        if isinstance(result, _nipype_interface_class()):
             result = nipype_factory(result)
 
     else:
@@ -10,13 +10,11 @@
 # System import
 import os
 import operator
-from socket import getfqdn
 from datetime import datetime as datetime
-from copy import deepcopy
 import json
-import subprocess
 import logging
 import shutil
+import time
 
 # Define the logger
 logger = logging.getLogger(__name__)
@@ -35,7 +33,25 @@ from soma.controller.trait_utils import is_trait_pathname
 from soma.controller.trait_utils import get_trait_desc
 
 # Capsul import
+from capsul.info import __version__ as capsul_version
 from capsul.utils.version_utils import get_tool_version
+from capsul.utils.version_utils import get_nipype_interface_version
+from capsul.process.runtime_report import runtime_environ
+from capsul.process.runtime_report import session_hostname
+from capsul.process.runtime_history import get_runtime_history
+from capsul.process.runtime_history import process_input_size
+from capsul.process.runtime_history import commands_peak_memory
+from capsul.process.runtime_history import run_command
+
+# The resources needed by a process execution, None being unknown:
+#   * 'cpu': the number of cores used by the process.
+#   * 'memory': the peak memory used by the process in MB.
+#   * 'walltime': the maximum duration of the process in seconds.
+DEFAULT_REQUIREMENTS = {
+    "cpu": None,
+    "memory": None,
+    "walltime": None
+}
 
 
 class ProcessMeta(Controller.__metaclass__):
@@ -101,6 +117,12 @@ class Process(Controller):
     `log_file` : str (default None)
         if None, the log will be generated in the current directory
         otherwise it will be written in log_file path.
+    `requirements` : dict (default {})
+        the resources needed by the process execution: the number of cores
+        ('cpu'), the peak memory in MB ('memory') and the maximum duration
+        in seconds ('walltime'). Subclasses declare their needs as a class
+        attribute, which can be overriden on an instance or on a pipeline
+        node.
 
     Methods
     -------
@@ -118,12 +140,17 @@ class Process(Controller):
     get_output_spec
     get_inputs
     get_outputs
+    get_requirements
+    get_versions
     set_parameter
     get_parameter
     """
     # Meta class used to complete the class docstring
     __metaclass__ = ProcessMeta
 
+    # The resources needed by the process execution
+    requirements = {}
+
     def __init__(self):
         """ Initialize the Process class.
         """
@@ -136,7 +163,7 @@ class Process(Controller):
 
         # Parameter to store which tools will be used dusring the processing
         self.versions = {
-            "capsul": get_tool_version("capsul")
+            "capsul": capsul_version
         }
 
         # Initialize the log file name
@@ -191,14 +218,16 @@ class Process(Controller):
         # Get the process class
         process = self.__class__
 
-        # Initialize the execution report
+        # Initialize the execution report: the environment is reported
+        # according to the runtime report level and the host name is
+        # resolved once per session (see capsul.process.runtime_report)
         runtime = {
             "start_time": datetime.isoformat(datetime.utcnow()),
             "cwd": os.getcwd(),
             "returncode": None,
-            "environ": deepcopy(os.environ.data),
+            "environ": runtime_environ(),
             "end_time": None,
-            "hostname": getfqdn(),
+            "hostname": session_hostname(),
         }
 
         # Set process parameters if extra arguments are passed
@@ -217,14 +246,31 @@ class Process(Controller):
                 # Set the extra parameter value
                 setattr(self, arg_name, arg_val)
 
+        # Measure the inputs of the execution if it is recorded in the
+        # runtime history
+        history = get_runtime_history()
+        if history is not None:
+            input_size = process_input_size(self)
+            start_time = time.time()
+
         # Execute the process
-        returncode = self._run_process()
+        with commands_peak_memory() as memory_record:
+            returncode = self._run_process()
 
         # Set the execution stop time in the execution report
         runtime["end_time"] = datetime.isoformat(datetime.utcnow())
 
+        # Record the execution duration and memory in the runtime history
+        if history is not None:
+            try:
+                history.record(self.id, input_size, time.time() - start_time,
+                               memory_record["memory"])
+            except Exception as e:
+                logger.warning("Could not record the execution of '{0}' in "
+                               "the runtime history: {1}".format(self.id, e))
+
         # Set the dependencies versions in the execution report
-        runtime["versions"] = self.versions
+        runtime["versions"] = self.get_versions()
 
         # Generate a process result that is returned
         results = ProcessResult(
@@ -252,7 +298,7 @@ class Process(Controller):
         # If yes, we can make use of it to execute the process
         if self.__class__.get_commandline != Process.get_commandline:
             commandline = self.get_commandline()
-            subprocess.check_call(commandline)
+            run_command(commandline)
 
         # Otherwise raise an error
         else:
@@ -423,7 +469,7 @@ class Process(Controller):
              "for i in range((len(sys.argv) - 1) / 2))); "
              "{1}()(**kwargs)").format(module_name, class_name,
                                        repr(argsdict)).replace("'", '"')
-        ] + sum([list(x) for x in pathsdict.items()], [])
+        ] + [item for path_item in pathsdict.items() for item in path_item]
 
         return commandline
 
@@ -475,6 +521,31 @@ class Process(Controller):
                 trait_name, trait_ids(self.trait(trait_name)))
         return output
 
+    def get_requirements(self):
+        """ Method to access the resources needed by the process execution.
+
+        Returns
+        -------
+        requirements: dict
+            the number of cores ('cpu'), the peak memory in MB ('memory')
+            and the maximum duration in seconds ('walltime') needed by the
+            process, None for unknown values.
+        """
+        requirements = dict(DEFAULT_REQUIREMENTS)
+        requirements.update(self.requirements)
+        return requirements
+
+    def get_versions(self):
+        """ Method to access the versions of the tools used by the process.
+
+        Returns
+        -------
+        versions: dict
+            a dictionary with the tool names as keys and the corresponding
+            versions as values.
+        """
+        return self.versions
+
     def get_inputs(self):
         """ Method to access the process inputs.
 
@@ -969,27 +1040,40 @@ class NipypeProcess(FileCopyProcess):
         self.id = ".".join([self._nipype_module, self._nipype_class])
         self.name = self._nipype_interface.__class__.__name__
 
-        # Set the nipype and nipype interface versions
-        if self._nipype_interface_name != "spm":
-            self.versions.update({
-                "nipype": get_tool_version("nipype"),
-                self._nipype_interface_name: self._nipype_interface.version
-            })
-        else:
-            from nipype.interfaces.spm import SPMCommand
-            from nipype.interfaces.matlab import MatlabCommand
-            self.versions.update({
-                "nipype": get_tool_version("nipype"),
-                self._nipype_interface_name: "{0}-{1}|{2}-{3}".format(
-                    SPMCommand._matlab_cmd, MatlabCommand._default_paths,
-                    SPMCommand._paths, SPMCommand._use_mcr)
-            })
+        # Set the nipype version, the interface version is only probed
+        # when it is needed (see get_versions)
+        self.versions["nipype"] = get_tool_version("nipype")
 
         # Add a new trait to store the processing output directory
         super(Process, self).add_trait(
             "output_directory", Directory(Undefined, exists=True,
                                           optional=True))
 
+    def get_versions(self):
+        """ Method to access the versions of the tools used by the process.
+
+        The version of the tool wrapped by the nipype interface is probed
+        at the first call, through the tool version cache.
+
+        Returns
+        -------
+        versions: dict
+            a dictionary with the tool names as keys and the corresponding
+            versions as values.
+        """
+        if self._nipype_interface_name not in self.versions:
+            if self._nipype_interface_name != "spm":
+                version = get_nipype_interface_version(
+                    self._nipype_interface)
+            else:
+                from nipype.interfaces.spm import SPMCommand
+                from nipype.interfaces.matlab import MatlabCommand
+                version = "{0}-{1}|{2}-{3}".format(
+                    SPMCommand._matlab_cmd, MatlabCommand._default_paths,
+                    SPMCommand._paths, SPMCommand._use_mcr)
+            self.versions[self._nipype_interface_name] = version
+        return self.versions
+
     def __call__(self, **kwargs):
         """ Method to execute the NipypeProcess.
 
@@ -0,0 +1,394 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+from __future__ import with_statement
+import os
+import sys
+import errno
+import math
+import time
+import sqlite3
+import logging
+import threading
+import subprocess
+from contextlib import closing
+from contextlib import contextmanager
+
+# Trait import
+from traits.api import Undefined
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# The database schema
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    process_id TEXT NOT NULL,
+    size_bucket INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    memory INTEGER,
+    end_time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_process ON runs (process_id, size_bucket);
+"""
+
+# The runtime history where the process executions are recorded
+_history = {
+    "history": None
+}
+
+# Locks serializing the history writes of each database in a process
+_locks = {}
+_locks_lock = threading.Lock()
+
+# The peak memories of the commands executed by the processes running in
+# each thread (see commands_peak_memory)
+_memory_records = threading.local()
+
+
+def set_runtime_history(history):
+    """ Set the runtime history where the process executions are recorded.
+
+    Parameters
+    ----------
+    history: RuntimeHistory (mandatory)
+        the runtime history, or None to stop recording the executions.
+    """
+    _history["history"] = history
+
+
+def get_runtime_history():
+    """ Get the runtime history where the process executions are recorded.
+
+    Returns
+    -------
+    history: RuntimeHistory
+        the current runtime history, None if the executions are not
+        recorded.
+    """
+    return _history["history"]
+
+
+def input_size_bucket(input_size):
+    """ Get the bucket of a process input size.
+
+    Sizes are gathered by powers of two, so that the executions of a
+    process on inputs of similar sizes can be compared.
+
+    Parameters
+    ----------
+    input_size: int (mandatory)
+        the size in bytes of the process input files.
+
+    Returns
+    -------
+    bucket: int
+        the input size bucket, 0 for processes without input files.
+    """
+    if not input_size:
+        return 0
+    return int(math.log(input_size, 2)) + 1
+
+
+def process_input_size(process):
+    """ Get the total size of the existing input files of a process.
+
+    Parameters
+    ----------
+    process: Process (mandatory)
+        a process.
+
+    Returns
+    -------
+    input_size: int
+        the size in bytes of the existing files given to the input
+        parameters of the process, including lists of files.
+    """
+    def files_size(value, found):
+        if isinstance(value, (list, tuple)):
+            return sum(files_size(item, found) for item in value)
+        if (isinstance(value, basestring) and value not in found and
+                os.path.isfile(value)):
+            found.add(value)
+            return os.path.getsize(value)
+        return 0
+
+    input_size = 0
+    found = set()
+    for name, trait in process.user_traits().iteritems():
+        if trait.output:
+            continue
+        value = getattr(process, name, Undefined)
+        if value is not Undefined:
+            input_size += files_size(value, found)
+    return input_size
+
+
+@contextmanager
+def commands_peak_memory():
+    """ Record the peak memory of the commands executed by
+    :py:func:`run_command` in the current thread.
+
+    The resource usage of the python process is a high-water mark shared by
+    all the executions of the session, only the memory of the commands run
+    in their own process can be attributed to an execution.
+
+    Yields
+    ------
+    record: dict
+        the 'memory' key is set, once the commands are executed, to the
+        largest peak resident memory of the commands in bytes, or None if
+        no command has been executed.
+    """
+    records = getattr(_memory_records, "records", None)
+    if records is None:
+        records = _memory_records.records = []
+    record = {"memory": None}
+    records.append(record)
+    try:
+        yield record
+    finally:
+        records.pop()
+        # The commands of a nested execution are also commands of the
+        # enclosing executions
+        if records and record["memory"] is not None:
+            _record_memory(records[-1], record["memory"])
+
+
+def _record_memory(record, memory):
+    """ Update the peak memory of a record of
+    :py:func:`commands_peak_memory`.
+    """
+    if record["memory"] is None or memory > record["memory"]:
+        record["memory"] = memory
+
+
+def run_command(commandline):
+    """ Execute a command and record its peak memory (see
+    :py:func:`commands_peak_memory`).
+
+    Parameters
+    ----------
+    commandline: list of str (mandatory)
+        the command and its arguments.
+
+    Raises
+    ------
+    CalledProcessError
+        if the command exit status is not zero.
+    """
+    command = subprocess.Popen(commandline)
+    while True:
+        try:
+            pid, status, rusage = os.wait4(command.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        command.returncode = -os.WTERMSIG(status)
+    else:
+        command.returncode = os.WEXITSTATUS(status)
+
+    # The maximum resident set size is given in bytes on Mac OS and in
+    # kilobytes elsewhere
+    memory = rusage.ru_maxrss
+    if sys.platform != "darwin":
+        memory *= 1024
+    records = getattr(_memory_records, "records", None)
+    if records:
+        _record_memory(records[-1], memory)
+
+    if command.returncode != 0:
+        raise subprocess.CalledProcessError(command.returncode, commandline)
+
+
+class RuntimeHistory(object):
+    """ SQLite store of the process executions durations and memory.
+
+    Each execution is recorded with the process id, the bucket of the size
+    of its input files (see :py:func:`input_size_bucket`), its duration in
+    seconds and its peak memory in bytes. Estimates are computed from the
+    latest executions of a process in the closest input size bucket.
+
+    The recorded memory is the largest peak resident memory of the
+    commands executed by the process (see :py:func:`run_command`). It is
+    not recorded for the processes running in the python interpreter, whose
+    memory cannot be told apart from the memory of the other executions.
+
+    Attributes
+    ----------
+    `db_file`: string
+        the history database file.
+    `max_runs`: int
+        the number of latest executions used to compute the estimates.
+
+    Methods
+    -------
+    record
+    estimate
+    estimate_duration
+    estimate_memory
+    clear
+    """
+
+    def __init__(self, db_file, max_runs=20, timeout=60.):
+        """ Open or create a runtime history.
+
+        Parameters
+        ----------
+        db_file: string (mandatory)
+            the history database file.
+        max_runs: int (optional, default 20)
+            the number of latest executions used to compute the estimates.
+        timeout: float (optional, default 60)
+            the time in seconds to wait for the database lock.
+        """
+        self.db_file = db_file
+        self.max_runs = max_runs
+        self.timeout = timeout
+        db_dir = os.path.dirname(os.path.abspath(db_file))
+        if not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        with _locks_lock:
+            self._lock = _locks.setdefault(os.path.abspath(db_file),
+                                           threading.Lock())
+        with self._lock:
+            with closing(self._connect()) as connection:
+                connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        """ Open a connection to the history database.
+        """
+        return sqlite3.connect(self.db_file, timeout=self.timeout)
+
+    def record(self, process_id, input_size, duration, memory=None):
+        """ Record a process execution.
+
+        Parameters
+        ----------
+        process_id: string (mandatory)
+            the process identifier.
+        input_size: int (mandatory)
+            the size in bytes of the process input files.
+        duration: float (mandatory)
+            the execution duration in seconds.
+        memory: int (optional)
+            the peak memory of the execution in bytes.
+        """
+        with self._lock:
+            with closing(self._connect()) as connection:
+                with connection:
+                    connection.execute(
+                        "INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                        (process_id, input_size_bucket(input_size),
+                         duration, memory, time.time()))
+
+    def estimate(self, process_id, input_size=None):
+        """ Estimate the resources needed by a process execution.
+
+        Parameters
+        ----------
+        process_id: string (mandatory)
+            the process identifier.
+        input_size: int (optional)
+            the size in bytes of the process input files. If not given, all
+            the executions of the process are considered.
+
+        Returns
+        -------
+        estimate: dict
+            the mean 'duration' in seconds and the maximum 'memory' in bytes
+            of the latest executions, with the number of considered 'runs',
+            or None if the process has never been executed.
+        """
+        query = "SELECT duration, memory FROM runs WHERE process_id = ?"
+        parameters = (process_id, )
+        if input_size is not None:
+            with closing(self._connect()) as connection:
+                row = connection.execute(
+                    "SELECT size_bucket FROM runs WHERE process_id = ? "
+                    "ORDER BY ABS(size_bucket - ?) LIMIT 1",
+                    (process_id, input_size_bucket(input_size))).fetchone()
+            if row is None:
+                return None
+            query += " AND size_bucket = ?"
+            parameters += (row[0], )
+        query += " ORDER BY end_time DESC LIMIT ?"
+        parameters += (self.max_runs, )
+        with closing(self._connect()) as connection:
+            rows = connection.execute(query, parameters).fetchall()
+        if not rows:
+            return None
+        memories = [memory for duration, memory in rows if memory is not None]
+        return {
+            "duration": sum(duration for duration, memory in rows) / len(rows),
+            "memory": max(memories) if memories else None,
+            "runs": len(rows)
+        }
+
+    def estimate_duration(self, process_id, input_size=None):
+        """ Estimate the duration of a process execution.
+
+        Parameters
+        ----------
+        process_id: string (mandatory)
+            the process identifier.
+        input_size: int (optional)
+            the size in bytes of the process input files.
+
+        Returns
+        -------
+        duration: float
+            the estimated duration in seconds, None if the process has never
+            been executed.
+        """
+        estimate = self.estimate(process_id, input_size)
+        if estimate is None:
+            return None
+        return estimate["duration"]
+
+    def estimate_memory(self, process_id, input_size=None):
+        """ Estimate the peak memory of a process execution.
+
+        Parameters
+        ----------
+        process_id: string (mandatory)
+            the process identifier.
+        input_size: int (optional)
+            the size in bytes of the process input files.
+
+        Returns
+        -------
+        memory: int
+            the estimated memory in bytes, None if unknown.
+        """
+        estimate = self.estimate(process_id, input_size)
+        if estimate is None:
+            return None
+        return estimate["memory"]
+
+    def clear(self, process_id=None):
+        """ Forget the recorded executions.
+
+        Parameters
+        ----------
+        process_id: string (optional)
+            if given, only forget the executions of this process.
+        """
+        query = "DELETE FROM runs"
+        parameters = ()
+        if process_id is not None:
+            query += " WHERE process_id = ?"
+            parameters = (process_id, )
+        with self._lock:
+            with closing(self._connect()) as connection:
+                with connection:
+                    connection.execute(query, parameters)
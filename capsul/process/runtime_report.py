@@ -0,0 +1,116 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import threading
+from socket import getfqdn
+
+# The available runtime report levels:
+#   * 'full': the whole environment is reported.
+#   * 'diff': only the environment variables that changed since the
+#     beginning of the session are reported.
+#   * 'light': the environment is not reported.
+RUNTIME_REPORT_LEVELS = ("full", "diff", "light")
+
+# The session information, captured once
+_session = {
+    "level": "full",
+    "hostname": None,
+    "environ": None
+}
+_session_lock = threading.Lock()
+
+
+def set_runtime_report_level(level):
+    """ Set the level of detail of the process execution reports.
+
+    Parameters
+    ----------
+    level: str (mandatory)
+        one of 'full' (the default, the whole environment is reported),
+        'diff' (only the environment variables that changed since the
+        beginning of the session are reported, removed variables being
+        reported as None) or 'light' (the environment is not reported).
+    """
+    if level not in RUNTIME_REPORT_LEVELS:
+        raise ValueError(
+            "'{0}' is not a valid runtime report level, expect one of "
+            "{1}.".format(level, RUNTIME_REPORT_LEVELS))
+    session_environ()
+    _session["level"] = level
+
+
+def get_runtime_report_level():
+    """ Get the level of detail of the process execution reports.
+
+    Returns
+    -------
+    level: str
+        the current runtime report level.
+    """
+    return _session["level"]
+
+
+def session_hostname():
+    """ Get the fully qualified name of the host, resolved once per session.
+
+    Returns
+    -------
+    hostname: str
+        the host name.
+    """
+    if _session["hostname"] is None:
+        with _session_lock:
+            if _session["hostname"] is None:
+                _session["hostname"] = getfqdn()
+    return _session["hostname"]
+
+
+def session_environ():
+    """ Get the environment captured at the beginning of the session.
+
+    Returns
+    -------
+    environ: dict
+        the environment variables at the first call of this function.
+    """
+    if _session["environ"] is None:
+        with _session_lock:
+            if _session["environ"] is None:
+                _session["environ"] = dict(os.environ)
+    return _session["environ"]
+
+
+def runtime_environ(level=None):
+    """ Get the environment to store in an execution report.
+
+    Parameters
+    ----------
+    level: str (optional)
+        the runtime report level, the current level if not given.
+
+    Returns
+    -------
+    environ: dict
+        the environment variables according to the report level, None for
+        the 'light' level.
+    """
+    if level is None:
+        level = _session["level"]
+    if level == "light":
+        return None
+    if level == "full":
+        return dict(os.environ)
+    baseline = session_environ()
+    environ = dict((name, value) for name, value in os.environ.iteritems()
+                   if baseline.get(name) != value)
+    environ.update((name, None) for name in baseline
+                   if name not in os.environ)
+    return environ
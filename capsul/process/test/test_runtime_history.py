@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+# Capsul import
+from capsul.process import Process
+from capsul.process import RuntimeHistory
+from capsul.process import set_runtime_history
+from capsul.process.runtime_history import get_runtime_history
+from capsul.process.runtime_history import process_input_size
+from capsul.pipeline import Pipeline
+from capsul.pipeline.pipeline_tools import nodes_estimated_durations
+
+# Trait import
+from traits.api import File, Float, List
+
+
+class DummyProcess(Process):
+    input_image = File(optional=True, output=False)
+    other_images = List(File(), output=False)
+    f = Float(output=False)
+    res = Float(output=True)
+
+    def _run_process(self):
+        self.res = 2 * self.f
+
+
+class DoubleProcess(Process):
+    f = Float(output=False)
+    res = Float(output=True)
+
+    def _run_process(self):
+        self.res = 2 * self.f
+
+
+class CommandProcess(Process):
+    """ A process allocating some memory in a command.
+    """
+    size = Float(output=False)
+
+    def get_commandline(self):
+        return [sys.executable, "-c",
+                "assert {0} >= 0; x = ' ' * {0}".format(int(self.size))]
+
+
+class DummyPipeline(Pipeline):
+    def pipeline_definition(self):
+        self.add_process("node1", DoubleProcess)
+        self.add_process("node2", DoubleProcess)
+        self.add_link("node1.res->node2.f")
+
+
+class TestRuntimeHistory(unittest.TestCase):
+    """ Class to test the recording of the processes executions.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = RuntimeHistory(
+            os.path.join(self.directory, "history", "runtime.sqlite"),
+            max_runs=2)
+
+    def tearDown(self):
+        set_runtime_history(None)
+        shutil.rmtree(self.directory)
+
+    def test_estimates(self):
+        self.assertEqual(self.history.estimate("proc"), None)
+        self.history.record("proc", 1000, 1., 100)
+        self.history.record("proc", 1000, 3., 300)
+        self.history.record("proc", 1000000, 10., 1000)
+        self.history.record("proc", 1000000, 20., None)
+
+        # The latest executions on similar inputs are used
+        self.assertEqual(self.history.estimate("proc", 1100),
+                         {"duration": 2., "memory": 300, "runs": 2})
+        self.assertEqual(self.history.estimate_duration("proc", 10 ** 9),
+                         15.)
+        self.assertEqual(self.history.estimate_memory("proc", 10 ** 9), 1000)
+        self.assertEqual(self.history.estimate("proc")["duration"], 15.)
+        self.assertEqual(self.history.estimate_duration("other", 1000), None)
+
+        self.history.clear("proc")
+        self.assertEqual(self.history.estimate("proc"), None)
+
+    def test_process_recording(self):
+        image = os.path.join(self.directory, "image.nii")
+        with open(image, "w") as open_file:
+            open_file.write("x" * 100)
+        process = DummyProcess()
+        process.input_image = image
+        process.other_images = [image, os.path.join(self.directory, "none")]
+        self.assertEqual(process_input_size(process), 100)
+
+        # Executions are only recorded with a runtime history
+        process(f=1.)
+        self.assertEqual(self.history.estimate(process.id), None)
+        set_runtime_history(self.history)
+        self.assertTrue(get_runtime_history() is self.history)
+        process(f=1.)
+        estimate = self.history.estimate(process.id, 100)
+        self.assertEqual(estimate["runs"], 1)
+        self.assertTrue(estimate["duration"] >= 0.)
+
+        # The memory of the python processes is not recorded
+        self.assertEqual(estimate["memory"], None)
+
+    def test_command_memory(self):
+        set_runtime_history(self.history)
+        process = CommandProcess()
+        process(size=100e6)
+        memory = self.history.estimate_memory(process.id)
+        self.assertTrue(memory >= 100e6)
+
+        # The memory of each command is recorded, not the session peak
+        self.history.clear()
+        process(size=0)
+        self.assertTrue(self.history.estimate_memory(process.id) < memory)
+
+        # Failed commands are not recorded
+        self.assertRaises(subprocess.CalledProcessError, process, size=-1)
+        self.assertEqual(self.history.estimate(process.id)["runs"], 1)
+
+    def test_nodes_estimated_durations(self):
+        pipeline = DummyPipeline()
+        self.history.record(pipeline.nodes["node1"].process.id, 0, 5.)
+        durations = nodes_estimated_durations(pipeline, self.history)
+        self.assertEqual(durations, {pipeline.nodes["node1"]: 5.,
+                                     pipeline.nodes["node2"]: 5.})
+        self.history.clear()
+        self.assertEqual(nodes_estimated_durations(pipeline, self.history),
+                         {})
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRuntimeHistory)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import unittest
+
+# Capsul import
+from capsul.process import Process
+from capsul.process import set_runtime_report_level
+from capsul.process.runtime_report import get_runtime_report_level
+
+# Trait import
+from traits.api import Float
+
+
+class DummyProcess(Process):
+    f = Float(output=False)
+    res = Float(output=True)
+
+    def _run_process(self):
+        self.res = 2 * self.f
+
+
+class TestRuntimeReport(unittest.TestCase):
+    """ Class to test the process execution report levels.
+    """
+    def setUp(self):
+        self.level = get_runtime_report_level()
+        self.process = DummyProcess()
+
+    def tearDown(self):
+        set_runtime_report_level(self.level)
+        os.environ.pop("CAPSUL_TEST_RUNTIME_REPORT", None)
+
+    def test_full_report(self):
+        set_runtime_report_level("full")
+        runtime = self.process(f=1.).runtime
+        self.assertEqual(runtime["environ"], dict(os.environ))
+        self.assertTrue(runtime["hostname"])
+
+    def test_diff_report(self):
+        set_runtime_report_level("diff")
+        os.environ["CAPSUL_TEST_RUNTIME_REPORT"] = "1"
+        runtime = self.process(f=1.).runtime
+        self.assertEqual(runtime["environ"]["CAPSUL_TEST_RUNTIME_REPORT"],
+                         "1")
+        self.assertTrue(len(runtime["environ"]) < len(os.environ))
+
+    def test_light_report(self):
+        set_runtime_report_level("light")
+        result = self.process(f=1.)
+        self.assertEqual(result.runtime["environ"], None)
+        self.assertEqual(result.outputs["res"], 2.)
+
+    def test_invalid_level(self):
+        self.assertRaises(ValueError, set_runtime_report_level, "none")
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRuntimeReport)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
@@ -0,0 +1,237 @@
+#! /usr/bin/env python
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+# Capsul import
+from capsul.process import Process
+from capsul.pipeline import Pipeline
+from capsul.pipeline.process_iteration import ProcessIteration
+from capsul.process.worker_pool import WorkerPool
+from capsul.process.worker_pool import can_run_in_worker
+from capsul.process.worker_pool import get_worker_pool
+from capsul.process.worker_pool import shutdown_worker_pool
+from capsul.study_config.study_config import StudyConfig
+
+# Trait import
+from traits.api import Float, Int, List, Directory, String
+
+
+class PidProcess(Process):
+    """ A process doubling its input and returning its python process id.
+    """
+    f = Float(output=False)
+    values = List(Float(), output=False, optional=True)
+    output_directory = Directory(output=False, optional=True, exists=False)
+    res = Float(output=True)
+    pid = Int(output=True)
+
+    def _run_process(self):
+        if self.f < 0:
+            raise ValueError("negative input")
+        self.res = 2 * self.f + sum(self.values)
+        self.pid = os.getpid()
+
+
+class MarkerProcess(Process):
+    """ A process creating a marker file after a delay.
+    """
+    f = Float(output=False)
+    marker = String(output=False)
+    res = Float(output=True)
+
+    def _run_process(self):
+        if self.f < 0:
+            raise ValueError("negative input")
+        time.sleep(self.f)
+        open(self.marker, "w").close()
+        self.res = self.f
+
+
+class KillerProcess(Process):
+    """ A process killing the python process executing it.
+    """
+    f = Float(output=False)
+    res = Float(output=True)
+
+    def _run_process(self):
+        os._exit(1)
+
+
+class PidPipeline(Pipeline):
+    """ A two steps chain.
+    """
+    def pipeline_definition(self):
+        self.add_process("node1", PidProcess)
+        self.add_process("node2", PidProcess)
+        self.add_link("node1.res->node2.f")
+        self.export_parameter("node1", "f")
+        self.export_parameter("node2", "res")
+        self.export_parameter("node1", "pid", "pid1")
+        self.export_parameter("node2", "pid", "pid2")
+
+
+class TestWorkerPool(unittest.TestCase):
+    """ Class to test the execution of processes in persistent workers.
+    """
+    def setUp(self):
+        self.pool = WorkerPool(1)
+
+    def tearDown(self):
+        self.pool.close()
+        shutdown_worker_pool()
+
+    def test_call(self):
+        process = PidProcess()
+        process.values = [1., 2.]
+        result = self.pool.call(process, f=2.)
+        self.assertEqual(process.res, 7.)
+        self.assertNotEqual(process.pid, os.getpid())
+        self.assertEqual(result.outputs["res"], 7.)
+        self.assertTrue(result.runtime["end_time"] is not None)
+
+        # The same worker executes the following processes
+        pid = process.pid
+        self.pool.call(process, f=3.)
+        self.assertEqual(process.res, 9.)
+        self.assertEqual(process.pid, pid)
+
+        # Errors are raised in the calling process
+        self.assertRaises(ValueError, self.pool.call, process, f=-1.)
+
+    def test_map(self):
+        process = PidProcess()
+        tasks = []
+        for value in (1., 2.):
+            process.f = value
+            tasks.append(self.pool.task(process, ["res"]))
+        self.assertEqual(self.pool.map(tasks), [{"res": 2.}, {"res": 4.}])
+
+    def test_dead_worker(self):
+        # The tasks lost by a dead worker fail instead of hanging
+        process = KillerProcess()
+        process.f = 1.
+        self.assertRaises(RuntimeError, self.pool.map,
+                          [self.pool.task(process, ["res"])])
+        self.assertRaises(RuntimeError, get_worker_pool(1).call, process)
+
+        # The executions requested on a broken pool are sent to a new
+        # shared pool
+        process = PidProcess()
+        self.pool.call(process, f=1.)
+        self.assertEqual(process.res, 2.)
+
+    def marker_tasks(self, directory, values):
+        """ Build the tasks of MarkerProcess executions.
+        """
+        process = MarkerProcess()
+        tasks = []
+        for index, value in enumerate(values):
+            process.f = value
+            process.marker = os.path.join(directory, str(index))
+            tasks.append(self.pool.task(process, ["res"]))
+        return tasks
+
+    def test_fail_fast(self):
+        directory = tempfile.mkdtemp()
+        try:
+            # All the tasks are executed by default
+            tasks = self.marker_tasks(directory, [-1., 0., 0., 0.])
+            self.assertRaises(ValueError, self.pool.map, tasks)
+            self.assertEqual(len(os.listdir(directory)), 3)
+
+            # The pending tasks are dropped after the first error
+            for fname in os.listdir(directory):
+                os.remove(os.path.join(directory, fname))
+            self.assertRaises(ValueError, self.pool.map, tasks, True)
+            self.assertEqual(os.listdir(directory), [])
+
+            # Iterations on the shared pool stop on the first failure
+            iteration = ProcessIteration(MarkerProcess, ["f", "marker"],
+                                         parallel_workers=1,
+                                         parallel_backend="process")
+            iteration.f = [-1., 0., 0.]
+            iteration.marker = [os.path.join(directory, str(index))
+                                for index in range(3)]
+            self.assertRaises(ValueError, iteration)
+            self.assertEqual(os.listdir(directory), [])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_pool_replacement(self):
+        directory = tempfile.mkdtemp()
+        try:
+            pool = get_worker_pool(1)
+            tasks = self.marker_tasks(directory, [0.5, 0.])
+            results = []
+            thread = threading.Thread(
+                target=lambda: results.append(pool.map(tasks)))
+            thread.start()
+            time.sleep(0.1)
+
+            # A larger pool replaces the shared pool while it is used
+            larger_pool = get_worker_pool(2)
+            self.assertFalse(larger_pool is pool)
+            thread.join()
+            self.assertEqual(results, [[{"res": 0.5}, {"res": 0.}]])
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+            # The replaced pool is then stopped, and its executions are sent
+            # to the shared pool
+            self.assertTrue(pool._closed)
+            self.assertEqual(pool.map(tasks[1:]), [{"res": 0.}])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_shared_pool(self):
+        pool = get_worker_pool(1)
+        self.assertTrue(get_worker_pool(1) is pool)
+        self.assertTrue(can_run_in_worker(PidProcess()))
+        self.assertFalse(can_run_in_worker(
+            ProcessIteration(PidProcess, ["f"])))
+
+        # The setup of a nipype interface cannot be sent to the workers
+        process = PidProcess()
+        process._nipype_interface = object()
+        self.assertFalse(can_run_in_worker(process))
+
+    def test_study_config(self):
+        output_directory = tempfile.mkdtemp()
+        try:
+            study_config = StudyConfig(
+                modules=["SmartCachingConfig"],
+                use_smart_caching=False,
+                output_directory=output_directory,
+                use_worker_pool=True)
+            pipeline = PidPipeline()
+            pipeline.f = 1.
+            study_config.run(pipeline, verbose=0)
+            self.assertEqual(pipeline.res, 4.)
+            self.assertNotEqual(pipeline.pid1, os.getpid())
+            self.assertEqual(pipeline.pid1, pipeline.pid2)
+        finally:
+            shutil.rmtree(output_directory)
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestWorkerPool)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
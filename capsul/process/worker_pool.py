@@ -0,0 +1,501 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import atexit
+import inspect
+import logging
+import pickle
+import Queue
+import threading
+import traceback
+import multiprocessing
+
+# Trait import
+from traits.api import Undefined
+
+# Capsul import
+from capsul.process.process import ProcessResult
+from capsul.process.loader import get_process_instance
+from capsul.process.runtime_history import RuntimeHistory
+from capsul.process.runtime_history import get_runtime_history
+from capsul.process.runtime_history import set_runtime_history
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# The modules imported by each worker when it is started
+DEFAULT_PRELOAD_MODULES = ("traits.api", "soma.controller", "capsul.process")
+
+# The worker pool shared by the executions of a session
+_shared_pool = {
+    "pool": None
+}
+_shared_pool_lock = threading.Lock()
+
+# The error of the tasks lost by a dead worker
+_WORKER_DIED_MESSAGE = ("A worker process died before the end of its task, "
+                        "the pending tasks of its pool are cancelled")
+
+
+def _initialize_worker(preload_modules):
+    """ Import the preloaded modules in a new worker.
+    """
+    for module_name in preload_modules:
+        try:
+            __import__(module_name)
+        except ImportError as e:
+            logger.warning("Worker could not preload module '{0}': "
+                           "{1}".format(module_name, e))
+
+
+def _plain_value(value):
+    """ Convert the trait containers of a parameter value to picklable
+    python containers.
+    """
+    if isinstance(value, dict):
+        return dict((key, _plain_value(item))
+                    for key, item in value.iteritems())
+    if isinstance(value, tuple):
+        return tuple(_plain_value(item) for item in value)
+    if isinstance(value, list):
+        return [_plain_value(item) for item in value]
+    return value
+
+
+def process_source(process):
+    """ Get the identifier used to create new instances of a process.
+
+    Parameters
+    ----------
+    process: Process (mandatory)
+        a process instance.
+
+    Returns
+    -------
+    source: object
+        the process class, or the nipype interface class of a wrapped
+        nipype interface, to give to get_process_instance.
+    """
+    if hasattr(process, "_nipype_interface"):
+        return process._nipype_interface.__class__
+    return process.__class__
+
+
+def can_run_in_worker(process):
+    """ Check if a process can be rebuilt and executed by a worker.
+
+    Parameters
+    ----------
+    process: Process (mandatory)
+        a process instance.
+
+    Returns
+    -------
+    result: bool
+        True if a new instance of the process can be created without
+        parameters. Wrapped nipype interfaces are executed locally: their
+        setup that is not stored in traits, like the SPM prescript or the
+        matlab configuration, would be lost in a new instance.
+    """
+    if hasattr(process, "_nipype_interface"):
+        return False
+    try:
+        spec = inspect.getargspec(process.__class__.__init__)
+    except TypeError:
+        return True
+    return len(spec.args) - 1 <= len(spec.defaults or ())
+
+
+def run_process_task(task):
+    """ Execute a process on a new instance in a worker.
+
+    Parameters
+    ----------
+    task: tuple (mandatory)
+        (process_source, parameters, output_names, history_file): the
+        process identifier given to get_process_instance, the parameters
+        values to set, the names of the output parameters to return and the
+        runtime history database where the execution is recorded (or None).
+
+    Returns
+    -------
+    outputs: dict
+        the values of the output parameters after execution.
+    runtime: dict
+        the execution report.
+    """
+    source, parameters, output_names, history_file = task
+    history = get_runtime_history()
+    if history_file is None:
+        set_runtime_history(None)
+    elif history is None or history.db_file != history_file:
+        set_runtime_history(RuntimeHistory(history_file))
+    process = get_process_instance(source)
+    for name, value in parameters.iteritems():
+        setattr(process, name, value)
+    result = process()
+    runtime = None
+    if isinstance(result, ProcessResult):
+        runtime = result.runtime
+    return (dict((name, getattr(process, name)) for name in output_names),
+            runtime)
+
+
+def _run_guarded_task(task):
+    """ Execute a process task (see :py:func:`run_process_task`), returning
+    the errors instead of raising them, so that errors which cannot be
+    pickled are also reported.
+    """
+    try:
+        return True, run_process_task(task)
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            e = RuntimeError(str(e))
+        return False, (e, error_traceback)
+
+
+class WorkerPool(object):
+    """ Pool of persistent python processes executing capsul processes.
+
+    The workers are started once, import the preloaded modules and then
+    execute the processes sent to them, so that the interpreter startup
+    and the imports are only paid once. Each process is executed on a new
+    instance created in the worker from the process class and the values
+    of its parameters. Its outputs are then set on the calling instance.
+
+    The processes and their parameters values have to be picklable, and
+    the processes classes importable by the workers.
+
+    The executions started by :py:meth:`map` and :py:meth:`call` hold a
+    reference on the pool: a pool retired by :py:func:`get_worker_pool` is
+    only stopped once they are done, and the executions requested on a
+    stopped pool are sent to the current shared pool.
+
+    A worker that dies, for instance killed by the system when it runs out
+    of memory, never returns its task: the pending executions then fail
+    with a RuntimeError, and the broken pool is replaced by a new shared
+    pool.
+
+    Attributes
+    ----------
+    `size`: int
+        the number of workers.
+    `preload_modules`: tuple of str
+        the modules imported by each worker when it is started.
+
+    Methods
+    -------
+    task
+    apply_async
+    map
+    call
+    retire
+    close
+    """
+
+    def __init__(self, size=None, preload_modules=DEFAULT_PRELOAD_MODULES):
+        """ Start the workers.
+
+        Parameters
+        ----------
+        size: int (optional)
+            the number of workers, the number of cores if not given.
+        preload_modules: sequence of str (optional)
+            the modules imported by each worker when it is started.
+        """
+        self.size = size or multiprocessing.cpu_count()
+        self.preload_modules = tuple(preload_modules)
+        self._pool = multiprocessing.Pool(
+            self.size, _initialize_worker, (self.preload_modules, ))
+        self._pids = set(worker.pid for worker in self._pool._pool)
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+        self._closed = False
+        self._broken = False
+
+    def _acquire(self):
+        """ Hold a reference on the pool during an execution.
+
+        Returns
+        -------
+        acquired: bool
+            False if the pool has been stopped or a worker died.
+        """
+        with self._lock:
+            if self._closed or self._broken:
+                return False
+            self._users += 1
+            return True
+
+    def _release(self):
+        """ Release a reference taken by :py:meth:`_acquire`, and stop a
+        retired pool when it is not used anymore.
+        """
+        with self._lock:
+            self._users -= 1
+            stop = self._retired and self._users == 0 and not self._closed
+            if stop:
+                self._closed = True
+        if stop:
+            self._stop()
+
+    def _stop(self):
+        """ Stop the workers once their tasks are done, or immediately if a
+        worker died since its task would never be done.
+        """
+        if self._broken:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+
+    def _workers_died(self):
+        """ Check if a worker died: multiprocessing replaces the dead
+        workers but their tasks are lost.
+
+        Returns
+        -------
+        died: bool
+            True if a worker died since the pool was started.
+        """
+        workers = list(self._pool._pool)
+        if (set(worker.pid for worker in workers) != self._pids or
+                any(worker.exitcode is not None for worker in workers)):
+            with self._lock:
+                self._broken = True
+        return self._broken
+
+    def task(self, process, output_names=None):
+        """ Build the task executing a process in a worker.
+
+        Parameters
+        ----------
+        process: Process (mandatory)
+            the process to execute.
+        output_names: list of str (optional)
+            the output parameters to return, all of them if not given.
+
+        Returns
+        -------
+        task: tuple
+            the task (see :py:func:`run_process_task`).
+        """
+        parameters = {}
+        for name in process.user_traits():
+            if name in ("nodes_activation", "selection_changed"):
+                continue
+            value = getattr(process, name)
+            if value is not Undefined:
+                parameters[name] = _plain_value(value)
+        if output_names is None:
+            output_names = [name for name, trait
+                            in process.user_traits().iteritems()
+                            if trait.output]
+        history = get_runtime_history()
+        history_file = history.db_file if history is not None else None
+        return (process_source(process), parameters, list(output_names),
+                history_file)
+
+    def apply_async(self, task):
+        """ Send a task to a worker.
+
+        Parameters
+        ----------
+        task: tuple (mandatory)
+            the task (see :py:meth:`task`).
+
+        Returns
+        -------
+        result: AsyncResult
+            the pending result of :py:func:`_run_guarded_task`.
+        """
+        return self._pool.apply_async(_run_guarded_task, (task, ))
+
+    def map(self, tasks, fail_fast=False):
+        """ Execute several tasks and wait for their outputs.
+
+        At most one task per worker is sent at a time.
+
+        Parameters
+        ----------
+        tasks: list of tuple (mandatory)
+            the tasks (see :py:meth:`task`).
+        fail_fast: bool (optional, default False)
+            if True, the tasks that are not started yet are dropped after
+            the first error.
+
+        Returns
+        -------
+        outputs: list of dict
+            the outputs of each task, in the tasks order. The first error
+            is raised after all the started tasks are done.
+        """
+        if not self._acquire():
+            return get_worker_pool(self.size).map(tasks, fail_fast)
+        try:
+            return self._map(tasks, fail_fast)
+        finally:
+            self._release()
+
+    def _map(self, tasks, fail_fast):
+        """ Execute several tasks (see :py:meth:`map`).
+        """
+        done = Queue.Queue()
+
+        def callback(index):
+            return lambda value: done.put((index, value))
+
+        outputs = [None] * len(tasks)
+        running = {}
+        next_index = 0
+        error = None
+        while True:
+            # Keep the workers busy, unless a task failed in fail-fast mode
+            while (next_index < len(tasks) and len(running) < self.size and
+                   (error is None or not fail_fast)):
+                running[next_index] = self._pool.apply_async(
+                    _run_guarded_task, (tasks[next_index], ),
+                    callback=callback(next_index))
+                next_index += 1
+            if not running:
+                break
+
+            # Wait for a task to be done. The tasks that could not be sent
+            # to or received from a worker are ready without callback.
+            try:
+                index, (success, value) = done.get(timeout=1.)
+            except Queue.Empty:
+                failed = [index for index, result in running.iteritems()
+                          if result.ready() and not result.successful()]
+                if not failed:
+                    if self._workers_died():
+                        # The lost tasks would never be done
+                        if error is None:
+                            error = (RuntimeError(_WORKER_DIED_MESSAGE),
+                                     _WORKER_DIED_MESSAGE)
+                        break
+                    continue
+                index = failed[0]
+                try:
+                    running[index].get()
+                except Exception as e:
+                    success, value = False, (e, traceback.format_exc())
+            del running[index]
+            if success:
+                outputs[index] = value[0]
+            elif error is None:
+                error = value
+        if error is not None:
+            logger.error(error[1])
+            raise error[0]
+        return outputs
+
+    def call(self, process, **kwargs):
+        """ Execute a process in a worker and wait for its outputs.
+
+        Parameters
+        ----------
+        process: Process (mandatory)
+            the process to execute. Its outputs are set after execution.
+        kwargs: dict (optional)
+            should correspond to the declared parameter traits.
+
+        Returns
+        -------
+        result: ProcessResult
+            the execution information.
+        """
+        for name, value in kwargs.iteritems():
+            process.set_parameter(name, value)
+        if not self._acquire():
+            return get_worker_pool(self.size).call(process)
+        try:
+            result = self.apply_async(self.task(process))
+            while not result.ready():
+                result.wait(1.)
+                if not result.ready() and self._workers_died():
+                    raise RuntimeError(_WORKER_DIED_MESSAGE)
+            success, value = result.get()
+        finally:
+            self._release()
+        if not success:
+            logger.error(value[1])
+            raise value[0]
+        outputs, runtime = value
+        for name, output in outputs.iteritems():
+            setattr(process, name, output)
+        return ProcessResult(process.__class__, runtime, None,
+                             process.get_inputs(), process.get_outputs())
+
+    def retire(self):
+        """ Stop the workers once the executions using the pool are done.
+        """
+        with self._lock:
+            self._retired = True
+            stop = self._users == 0 and not self._closed
+            if stop:
+                self._closed = True
+        if stop:
+            self._stop()
+
+    def close(self):
+        """ Stop the workers once their tasks are done.
+        """
+        with self._lock:
+            self._closed = True
+        self._stop()
+
+
+def get_worker_pool(size=None):
+    """ Get the worker pool shared by the executions of the session.
+
+    The pool is started at the first call, and replaced by a pool with more
+    workers if a larger pool is requested or if one of its workers died.
+    The replaced pool is stopped once the executions using it are done (see
+    :py:meth:`WorkerPool.retire`).
+
+    Parameters
+    ----------
+    size: int (optional)
+        the minimum number of workers, the number of cores if not given.
+
+    Returns
+    -------
+    pool: WorkerPool
+        the shared worker pool.
+    """
+    size = size or multiprocessing.cpu_count()
+    retired_pool = None
+    with _shared_pool_lock:
+        pool = _shared_pool["pool"]
+        if pool is None or pool.size < size or pool._broken:
+            retired_pool = pool
+            pool = WorkerPool(size)
+            _shared_pool["pool"] = pool
+    if retired_pool is not None:
+        retired_pool.retire()
+    return pool
+
+
+def shutdown_worker_pool():
+    """ Stop the worker pool shared by the executions of the session.
+    """
+    with _shared_pool_lock:
+        pool = _shared_pool["pool"]
+        _shared_pool["pool"] = None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(shutdown_worker_pool)
@@ -0,0 +1,371 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+from __future__ import with_statement
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Name of the cache index database in a memory directory
+CACHE_INDEX_FILE = "cache_index.sqlite"
+
+# The database schema
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    process_dir TEXT PRIMARY KEY,
+    process_hash TEXT NOT NULL,
+    process_id TEXT NOT NULL,
+    inputs TEXT,
+    outputs TEXT,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_process_id ON entries (process_id);
+CREATE TABLE IF NOT EXISTS entry_blobs (
+    process_dir TEXT NOT NULL,
+    blob TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (process_dir, blob)
+);
+CREATE INDEX IF NOT EXISTS entry_blobs_blob ON entry_blobs (blob);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime TEXT NOT NULL,
+    content_hash TEXT NOT NULL
+);
+"""
+
+# The columns of the entries table
+_ENTRY_COLUMNS = ("process_dir", "process_hash", "process_id", "inputs",
+                  "outputs", "size", "created", "last_access", "hits")
+
+# Locks serializing the index writes of each database in a process
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class CacheIndex(object):
+    """ SQLite index of the entries of a smart-caching memory.
+
+    Each cache entry is identified by its directory relative to the memory
+    directory and records the process hash and id, the JSON encoded inputs
+    and outputs, the size of the entry directory, the creation and last
+    access times and the number of hits. The blobs referenced by an entry
+    are recorded with their sizes, so that cache lookups, statistics and
+    eviction never have to walk the memory directory. The index also
+    memorizes the content hashes of the input files, keyed by their path,
+    inode, size and modification time.
+
+    A connection is opened for each operation, so that an index can be
+    used from several threads, and writes are serialized with a lock in a
+    process and with the SQLite database lock between processes.
+
+    Attributes
+    ----------
+    `cachedir`: string
+        the memory directory.
+    `db_file`: string
+        the index database file.
+
+    Methods
+    -------
+    lookup
+    add_entry
+    record_hit
+    remove_entries
+    entries
+    entry_blobs
+    stats
+    get_file_hash
+    set_file_hash
+    """
+
+    def __init__(self, cachedir, timeout=60.):
+        """ Open or create the index of a memory directory.
+
+        Parameters
+        ----------
+        cachedir: string (mandatory)
+            the memory directory.
+        timeout: float (optional, default 60)
+            the time in seconds to wait for the database lock.
+        """
+        self.cachedir = cachedir
+        self.db_file = os.path.join(cachedir, CACHE_INDEX_FILE)
+        self.timeout = timeout
+        with _locks_lock:
+            self._lock = _locks.setdefault(self.db_file, threading.Lock())
+        with self._lock:
+            with closing(self._connect()) as connection:
+                connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        """ Open a connection to the index database.
+        """
+        return sqlite3.connect(self.db_file, timeout=self.timeout)
+
+    def _key(self, process_dir):
+        """ Get the index key of a cache entry directory.
+        """
+        return os.path.relpath(process_dir, self.cachedir)
+
+    def _entry(self, row):
+        """ Build an entry description from a database row.
+        """
+        entry = dict(zip(_ENTRY_COLUMNS, row))
+        entry["process_dir"] = os.path.join(self.cachedir,
+                                            entry["process_dir"])
+        for name in ("inputs", "outputs"):
+            if entry[name] is not None:
+                entry[name] = json.loads(entry[name])
+        return entry
+
+    def lookup(self, process_dir):
+        """ Get a cache entry.
+
+        Parameters
+        ----------
+        process_dir: string (mandatory)
+            the cache entry directory.
+
+        Returns
+        -------
+        entry: dict
+            the cache entry description (see :py:meth:`entries`) or None if
+            the entry is not indexed.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT {0} FROM entries WHERE process_dir = ?".format(
+                    ", ".join(_ENTRY_COLUMNS)),
+                (self._key(process_dir), )).fetchone()
+        if row is None:
+            return None
+        return self._entry(row)
+
+    def add_entry(self, process_dir, process_hash, process_id, inputs,
+                  outputs, size, blobs):
+        """ Record a new cache entry.
+
+        Parameters
+        ----------
+        process_dir: string (mandatory)
+            the cache entry directory.
+        process_hash: string (mandatory)
+            the process hash.
+        process_id: string (mandatory)
+            the process identifier.
+        inputs: string (mandatory)
+            the JSON encoded process inputs.
+        outputs: string (mandatory)
+            the JSON encoded process outputs.
+        size: int (mandatory)
+            the size of the cache entry directory in bytes.
+        blobs: dict (mandatory)
+            the size in bytes of each blob referenced by the entry, blobs
+            being given as paths relative to the memory directory.
+        """
+        key = self._key(process_dir)
+        now = time.time()
+        with self._lock:
+            with closing(self._connect()) as connection:
+                with connection:
+                    connection.execute(
+                        "DELETE FROM entry_blobs WHERE process_dir = ?",
+                        (key, ))
+                    connection.execute(
+                        "INSERT OR REPLACE INTO entries VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, process_hash, process_id, inputs, outputs,
+                         size, now, now, 0))
+                    connection.executemany(
+                        "INSERT INTO entry_blobs VALUES (?, ?, ?)",
+                        [(key, blob, blob_size)
+                         for blob, blob_size in blobs.iteritems()])
+
+    def record_hit(self, process_dir):
+        """ Record an access to a cache entry.
+
+        Parameters
+        ----------
+        process_dir: string (mandatory)
+            the cache entry directory.
+        """
+        with self._lock:
+            with closing(self._connect()) as connection:
+                with connection:
+                    connection.execute(
+                        "UPDATE entries SET last_access = ?, hits = hits + 1 "
+                        "WHERE process_dir = ?",
+                        (time.time(), self._key(process_dir)))
+
+    def remove_entries(self, process_dirs):
+        """ Forget some cache entries.
+
+        Parameters
+        ----------
+        process_dirs: list of string (mandatory)
+            the cache entries directories.
+
+        Returns
+        -------
+        unreferenced_blobs: list of string
+            the blobs, relative to the memory directory, that are not
+            referenced by any indexed entry anymore.
+        """
+        keys = [(self._key(process_dir), ) for process_dir in process_dirs]
+        with self._lock:
+            with closing(self._connect()) as connection:
+                with connection:
+                    removed_blobs = set()
+                    for key in keys:
+                        rows = connection.execute(
+                            "SELECT blob FROM entry_blobs WHERE "
+                            "process_dir = ?", key)
+                        removed_blobs.update(row[0] for row in rows)
+                    connection.executemany(
+                        "DELETE FROM entry_blobs WHERE process_dir = ?", keys)
+                    connection.executemany(
+                        "DELETE FROM entries WHERE process_dir = ?", keys)
+                    unreferenced_blobs = [
+                        blob for blob in sorted(removed_blobs)
+                        if connection.execute(
+                            "SELECT 1 FROM entry_blobs WHERE blob = ? "
+                            "LIMIT 1", (blob, )).fetchone() is None]
+        return unreferenced_blobs
+
+    def entries(self, process_id=None):
+        """ List the cache entries, least recently used first.
+
+        Parameters
+        ----------
+        process_id: string (optional)
+            if given, only list the entries of this process.
+
+        Returns
+        -------
+        entries: list of dict
+            the description of each entry with the 'process_dir',
+            'process_hash', 'process_id', 'inputs', 'outputs', 'size',
+            'created', 'last_access' and 'hits' keys.
+        """
+        query = "SELECT {0} FROM entries".format(", ".join(_ENTRY_COLUMNS))
+        parameters = ()
+        if process_id is not None:
+            query += " WHERE process_id = ?"
+            parameters = (process_id, )
+        query += " ORDER BY last_access"
+        with closing(self._connect()) as connection:
+            rows = connection.execute(query, parameters).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def entry_blobs(self):
+        """ Get the blobs referenced by each cache entry.
+
+        Returns
+        -------
+        entry_blobs: dict
+            the blobs sizes dict (blob relative path -> size) of each cache
+            entry directory.
+        """
+        entry_blobs = {}
+        with closing(self._connect()) as connection:
+            for key, blob, size in connection.execute(
+                    "SELECT process_dir, blob, size FROM entry_blobs"):
+                process_dir = os.path.join(self.cachedir, key)
+                entry_blobs.setdefault(process_dir, {})[blob] = size
+        return entry_blobs
+
+    def stats(self):
+        """ Get the cache statistics.
+
+        Returns
+        -------
+        stats: dict
+            the number of 'entries', the number of 'hits' and the total
+            'size' in bytes of the entries and of the blobs they reference.
+        """
+        with closing(self._connect()) as connection:
+            nb_entries, hits, entries_size = connection.execute(
+                "SELECT COUNT(*), TOTAL(hits), TOTAL(size) "
+                "FROM entries").fetchone()
+            blobs_size = connection.execute(
+                "SELECT TOTAL(size) FROM (SELECT DISTINCT blob, size "
+                "FROM entry_blobs)").fetchone()[0]
+        return {
+            "entries": nb_entries,
+            "hits": int(hits),
+            "size": int(entries_size + blobs_size)
+        }
+
+    def get_file_hash(self, path, inode, size, mtime):
+        """ Get the memorized content hash of a file.
+
+        Parameters
+        ----------
+        path: string (mandatory)
+            the file path.
+        inode: int (mandatory)
+            the file inode number.
+        size: int (mandatory)
+            the file size.
+        mtime: string (mandatory)
+            the representation of the file modification time.
+
+        Returns
+        -------
+        content_hash: string
+            the file content hash, or None if the file has not been hashed
+            or has changed since.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT content_hash FROM file_hashes WHERE path = ? AND "
+                "inode = ? AND size = ? AND mtime = ?",
+                (path, inode, size, mtime)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_file_hash(self, path, inode, size, mtime, content_hash):
+        """ Memorize the content hash of a file.
+
+        Parameters
+        ----------
+        path: string (mandatory)
+            the file path.
+        inode: int (mandatory)
+            the file inode number.
+        size: int (mandatory)
+            the file size.
+        mtime: string (mandatory)
+            the representation of the file modification time.
+        content_hash: string (mandatory)
+            the file content hash.
+        """
+        with self._lock:
+            with closing(self._connect()) as connection:
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO file_hashes VALUES "
+                        "(?, ?, ?, ?, ?)",
+                        (path, inode, size, mtime, content_hash))
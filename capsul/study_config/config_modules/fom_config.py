@@ -8,9 +8,12 @@
 
 import os
 from traits.api import Bool, Str, Undefined
-from soma.fom import AttributesToPaths, PathToAttributes
-from soma.application import Application
 from capsul.study_config.study_config import StudyConfigModule
+from capsul.utils.lazy_import import lazy_import
+
+# FOM modules are only loaded when the FOMs are set up
+soma_fom = lazy_import("soma.fom")
+soma_application = lazy_import("soma.application")
 
 
 class FomConfig(StudyConfigModule):
@@ -53,7 +56,8 @@ class FomConfig(StudyConfigModule):
         if self.study_config.use_fom is False:
             return
         
-        soma_app = Application('capsul', plugin_modules=['soma.fom'])
+        soma_app = soma_application.Application(
+            'capsul', plugin_modules=['soma.fom'])
         if 'soma.fom' not in soma_app.loaded_plugin_modules:
             # WARNING: this is unsafe, may erase configured things, and
             # probably not thread-safe.
@@ -83,13 +87,13 @@ class FomConfig(StudyConfigModule):
         self.study_config.modules_data.fom_pta = {}
 
         for fom_type, fom in self.study_config.modules_data.foms.iteritems():
-            atp = AttributesToPaths(
+            atp = soma_fom.AttributesToPaths(
                 fom,
                 selection={},
                 directories=directories,
                 prefered_formats=set((formats)))
             self.study_config.modules_data.fom_atp[fom_type] = atp
-            pta = PathToAttributes(fom, selection={})
+            pta = soma_fom.PathToAttributes(fom, selection={})
             self.study_config.modules_data.fom_pta[fom_type] = pta
         self.study_config.use_fom = True
     
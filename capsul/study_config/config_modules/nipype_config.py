@@ -9,12 +9,13 @@
 # TRAITS import
 from traits.api import Bool, Undefined
 
-# NIPYPE import
-import nipype.interfaces.matlab as matlab
-from nipype.interfaces import spm
-
 # CAPSUL import
 from capsul.study_config.study_config import StudyConfigModule
+from capsul.utils.lazy_import import lazy_import
+
+# NIPYPE import: nipype is only loaded when the configuration is set up
+matlab = lazy_import("nipype.interfaces.matlab")
+spm = lazy_import("nipype.interfaces.spm")
 
 
 class NipypeConfig(StudyConfigModule):
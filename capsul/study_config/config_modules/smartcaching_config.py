@@ -7,7 +7,7 @@
 # for details.
 ##########################################################################
 
-from traits.api import Bool, Undefined
+from traits.api import Bool, Float, Undefined
 from capsul.study_config.study_config import StudyConfigModule
 
 
@@ -18,5 +18,26 @@ class SmartCachingConfig(StudyConfigModule):
             False,
             output=False,
             desc='Use smart-caching during the execution'))
+        study_config.add_trait('smart_caching_content_hash', Bool(
+            False,
+            output=False,
+            desc='Identify the smart-caching input files by their content '
+                 'rather than by their modification time and size'))
+        study_config.add_trait('smart_caching_hardlink_restore', Bool(
+            False,
+            output=False,
+            desc='Restore the smart-caching result files as hard links to '
+                 'the cached files when they cannot be reflinked, rather '
+                 'than as copies'))
+        study_config.add_trait('smart_caching_max_size', Float(
+            0.,
+            output=False,
+            desc='Maximum size of the smart-caching memory in GB, the least '
+                 'recently used results are evicted above it (0: no limit)'))
+        study_config.add_trait('smart_caching_max_age', Float(
+            0.,
+            output=False,
+            desc='Maximum number of days since the last use of a '
+                 'smart-caching result before it is evicted (0: no limit)'))
         self.study_config = study_config
         # self.study_config.on_trait_change(self._use_smart_caching_changed, 'use_smart_caching')
@@ -31,6 +31,13 @@ class SomaWorkflowConfig(StudyConfigModule):
                     output=False,
                     desc='Soma-workflow paths translations mapping: '
                     '{local_path: (identifier, uuid)}'))
+            self.add_trait(
+                'native_specification_format', Str(
+                    Undefined,
+                    output=False,
+                    desc='scheduler type used to translate the processes '
+                    'requirements into jobs native specifications: \'pbs\' '
+                    'or \'slurm\''))
 
     def __init__(self, study_config, configuration):
 
@@ -18,19 +18,13 @@ import shutil
 import json
 import numpy
 import logging
+import tempfile
 
 # CAPSUL import
 from capsul.process import Process
 from capsul.process import ProcessResult
-
-# NIPYPE import
-try:
-    from nipype.interfaces.base import InterfaceResult
-except ImportError:
-    # if nipype is not here, we will not really need this but it is used in
-    # object type checking in CapsulResultEncoder
-    class InterfaceResult(object):
-        pass
+from capsul.study_config.cache_index import CacheIndex
+from capsul.utils.lazy_import import loaded_class
 
 # TRAITS import
 from traits.api import Undefined
@@ -39,6 +33,20 @@ from traits.api import Undefined
 # Define the logger
 logger = logging.getLogger(__name__)
 
+# Name of the directory of the memory where output files are stored
+BLOBS_DIRECTORY = "blobs"
+
+# Time in seconds during which a stored or reused blob is never removed, so
+# that the blobs of the entries being recorded concurrently are kept
+BLOBS_GRACE_PERIOD = 600.
+
+# Linux ioctl request to clone a file
+_FICLONE = 0x40049409
+
+# The file content hashes computed in this process: path -> ((inode, size,
+# mtime), hash)
+_file_hashes = {}
+
 
 ###########################################################################
 # Proxy process objects
@@ -48,7 +56,7 @@ class UnMemorizedProcess(object):
     """ This class replaces MemorizedProcess when there is no cache.
     It provides an identical API but does not write anything on disk.
     """
-    def __init__(self, process, verbose=1):
+    def __init__(self, process, verbose=1, worker_pool=None):
         """ Initialize the UnMemorizedProcess class.
 
         Parameters
@@ -57,9 +65,13 @@ class UnMemorizedProcess(object):
             the process instance to wrap.
         verbose: int
             if different from zero, print console messages.
+        worker_pool: WorkerPool (optional)
+            if given, the process is executed by a worker of this pool
+            (see :py:class:`capsul.process.worker_pool.WorkerPool`).
         """
         self.process = process
         self.verbose = verbose
+        self.worker_pool = worker_pool
 
     def __call__(self, **kwargs):
         """ Call the process.
@@ -88,7 +100,10 @@ class UnMemorizedProcess(object):
         start_time = time.time()
 
         # Execute the process
-        result = self.process()
+        if self.worker_pool is not None:
+            result = self.worker_pool.call(self.process)
+        else:
+            result = self.process()
         duration = time.time() - start_time
 
         # Information message
@@ -185,9 +200,13 @@ class MemorizedProcess(object):
 
     All values are cached on the filesystem, in a deep directory
     structure. Methods are provided to inspect the cache or clean it.
+    Output files are stored once in a blob store shared by all the cache
+    entries (see :py:func:`store_blob`).
     """
 
-    def __init__(self, process, cachedir, timestamp=None, verbose=1):
+    def __init__(self, process, cachedir, timestamp=None, verbose=1,
+                 hardlink_restore=False, memory=None, content_hash=False,
+                 worker_pool=None):
         """ Initialize the MemorizedProcess class.
 
         Parameters
@@ -204,6 +223,19 @@ class MemorizedProcess(object):
             is called.
         verbose: int
             if different from zero, print console messages.
+        hardlink_restore: bool (optional, default False)
+            if True, cached files are restored as hard links to the blob
+            store when they cannot be reflinked (see :py:func:`restore_blob`).
+        memory: Memory (optional)
+            the memory whose index records the cache entries.
+        content_hash: bool (optional, default False)
+            if True, the input files are identified by their content
+            rather than by their modification time and size (see
+            :py:func:`file_content_fingerprint`). This can be set for each
+            parameter with the 'content_hash' trait metadata.
+        worker_pool: WorkerPool (optional)
+            if given, the process is executed by a worker of this pool
+            (see :py:class:`capsul.process.worker_pool.WorkerPool`).
         """
         # Check the a process is passed
         self.process_class = process.__class__
@@ -231,6 +263,10 @@ class MemorizedProcess(object):
 
         # Store if some messages have to be displayed
         self.verbose = verbose
+        self.hardlink_restore = hardlink_restore
+        self.memory = memory
+        self.content_hash = content_hash
+        self.worker_pool = worker_pool
 
     def __call__(self, **kwargs):
         """ Call wrapped process and cache result, or read cache if
@@ -255,8 +291,26 @@ class MemorizedProcess(object):
         # process
         process_dir, process_hash, input_parameters = self._get_process_id()
 
+        # Load the memorized files mapping
+        file_mapping = None
+        if self._is_cached(process_dir):
+            map_fname = os.path.join(process_dir, "file_mapping.json")
+            try:
+                with open(map_fname) as json_data:
+                    file_mapping = json.load(json_data)
+            except IOError:
+                if self.memory is None:
+                    raise
+                # The entry is incomplete or has been removed from the disk:
+                # forget it and execute the process
+                logger.debug("Removing the stale cache entry '{0}'.".format(
+                    process_dir))
+                self.memory.index.remove_entries([process_dir])
+                if os.path.isdir(process_dir):
+                    shutil.rmtree(process_dir)
+
         # Execute the process
-        if not os.path.isdir(process_dir):
+        if file_mapping is None:
 
             # Create the destination memory folder
             os.makedirs(process_dir)
@@ -287,19 +341,21 @@ class MemorizedProcess(object):
                 shutil.rmtree(process_dir)
                 raise
 
+            # Record the new cache entry
+            if self.memory is not None:
+                self.memory._record_entry(
+                    process_dir, process_hash, self.process.id,
+                    input_parameters, output_parameters, file_mapping)
+
         # Restore the process results from the cache folder
         else:
-            # Restore the memorized files
-            map_fname = os.path.join(process_dir, "file_mapping.json")
-            with open(map_fname) as json_data:
-                file_mapping = json.load(json_data)
-
             # Go through all mapping files
             for workspace_file, memory_file in file_mapping:
 
                 # Determine if the workspace directory is writeable
                 if os.access(os.path.dirname(workspace_file), os.W_OK):
-                    shutil.copy2(memory_file, workspace_file)
+                    restore_blob(memory_file, workspace_file,
+                                 self.hardlink_restore)
                 else:
                     logger.debug("Can't restore file '{0}', access rights are "
                                  "not sufficients.".format(workspace_file))
@@ -307,10 +363,14 @@ class MemorizedProcess(object):
             # Update the process output traits
             result = self._load_process_result(process_dir, input_parameters)
 
+            # Record the cache hit
+            if self.memory is not None:
+                self.memory.index.record_hit(process_dir)
+
         return result
 
     def _copy_files_to_memory(self, python_object, process_dir, file_mapping):
-        """ Copy file items inside the memory.
+        """ Copy file items inside the memory blob store.
 
         Parameters
         ----------
@@ -339,11 +399,32 @@ class MemorizedProcess(object):
             if (python_object is not Undefined and
                     isinstance(python_object, basestring) and
                     os.path.isfile(python_object)):
-                fname = os.path.basename(python_object)
-                out = os.path.join(process_dir, fname)
-                shutil.copy2(python_object, out)
+                out = store_blob(python_object,
+                                 os.path.join(self.cachedir, BLOBS_DIRECTORY))
                 file_mapping.append((python_object, out))
 
+    def _is_cached(self, process_dir):
+        """ Check if a result of the process is in the cache.
+
+        The memory index is queried first so that cached results are found
+        without accessing the file system metadata. Entries that are not
+        indexed are looked for on the disk.
+
+        Parameters
+        ----------
+        process_dir: string
+            the directory where the cache should be written.
+
+        Returns
+        -------
+        is_cached: bool
+            True if the result is in the cache.
+        """
+        if (self.memory is not None and
+                self.memory.index.lookup(process_dir) is not None):
+            return True
+        return os.path.isdir(process_dir)
+
     def _call_process(self, process_dir, input_parameters):
         """ Call a process.
 
@@ -369,7 +450,10 @@ class MemorizedProcess(object):
         start_time = time.time()
 
         # Execute the process
-        result = self.process()
+        if self.worker_pool is not None:
+            result = self.worker_pool.call(self.process)
+        else:
+            result = self.process()
         duration = time.time() - start_time
 
         # Save the result in json format
@@ -448,17 +532,7 @@ class MemorizedProcess(object):
         return process_dir, process_hash, input_parameters
 
     def _get_argument_hash(self):
-        """ Get a hash of the process arguments.
-
-        The user process traits are accessed through the user_traits()
-        method that returns a sorted dictionary.
-
-        Some parameters are not considered during the hash computation:
-            * if the parameter value is not defined
-            * if the corresponding trait has an attribute 'nohash'
-
-        Add the tool versions to check roughly if the running codes have
-        changed.
+        """ Get a hash of the process arguments (see get_argument_hash).
 
         Returns
         -------
@@ -467,82 +541,10 @@ class MemorizedProcess(object):
         input_parameters: dict
             the process input_parameters.
         """
-        # Store for input parameters
-        input_parameters = {}
-
-        # Go through all the user traits
-        for name, trait in self.process.user_traits().iteritems():
-
-            # Get the trait value
-            value = self.process.get_parameter(name)
-
-            # Split input and output traits
-            is_input = True
-            if "output" in trait.__dict__ and trait.output:
-                is_input = False
-
-            # Skip undefined trait attributes and outputs
-            if is_input and value is not Undefined:
-
-                # Check specific flags before hash
-                if has_attribute(trait, "nohash", attribute_value=True,
-                                 recursive=True):
-                    continue
-
-                # Store the input parameter
-                input_parameters[name] = value
-
-        # Add the tool versions to check roughly if the running codes have
-        # changed and add file path fingerprints
-        process_parameters = input_parameters.copy()
-        process_parameters = self._add_fingerprints(process_parameters)
-        process_parameters["versions"] = self.process.versions
-
-        # Generate the process hash
-        hasher = hashlib.new("md5")
-        hasher.update(json.dumps(process_parameters, sort_keys=True))
-        process_hash = hasher.hexdigest()
-
-        return process_hash, input_parameters
-
-    def _add_fingerprints(self, python_object):
-        """ Add file path fingerprints.
-
-        Parameters
-        ----------
-        python_object: object
-            a generic python object.
-
-        Returns
-        -------
-        out: object
-            the input object with fingerprint-file representation.
-        """
-        # Deal with dictionary
-        out = {}
-        if isinstance(python_object, dict):
-            for key, val in python_object.iteritems():
-                if val is not Undefined:
-                    out[key] = self._add_fingerprints(val)
-
-        # Deal with tuple and list
-        elif isinstance(python_object, (list, tuple)):
-            out = []
-            for val in python_object:
-                if val is not Undefined:
-                    out.append(self._add_fingerprints(val))
-            if isinstance(python_object, tuple):
-                out = tuple(out)
-
-        # Otherwise start the deletion if the object is a file
-        else:
-            out = python_object
-            if (python_object is not Undefined and
-                    isinstance(python_object, basestring) and
-                    os.path.isfile(python_object)):
-                out = file_fingerprint(python_object)
-
-        return out
+        memo = None
+        if self.memory is not None:
+            memo = self.memory.index
+        return get_argument_hash(self.process, self.content_hash, memo)
 
     def _get_process_dir(self):
         """ Get the directory corresponding to the cache for the current
@@ -553,15 +555,12 @@ class MemorizedProcess(object):
         process_dir: string
             the directory where the cache should be write.
         """
-        # Build the memory path from the process id
+        # Build the memory path from the process id: the directory is
+        # created with the cache entries
         path = [self.cachedir]
         path.extend(self.process.id.split("."))
         process_dir = os.path.join(*path)
 
-        # Guarantee the path exists on the disk
-        if not os.path.exists(process_dir):
-            os.makedirs(process_dir)
-
         return process_dir
 
     def __repr__(self):
@@ -613,6 +612,136 @@ class MemorizedProcess(object):
             super(MemorizedProcess, self).__setattr__(name, value)
 
 
+def get_argument_hash(process, content_hash=False, memo=None):
+    """ Get a hash of the process arguments.
+
+    The user process traits are accessed through the user_traits()
+    method that returns a sorted dictionary.
+
+    Some parameters are not considered during the hash computation:
+        * if the parameter value is not defined
+        * if the corresponding trait has an attribute 'nohash'
+
+    Input files are identified by their content if the corresponding
+    trait has a True 'content_hash' attribute, or if the content_hash
+    option is set and the trait has no False 'content_hash' attribute.
+
+    Add the tool versions to check roughly if the running codes have
+    changed.
+
+    Parameters
+    ----------
+    process: Process (mandatory)
+        the process whose input parameters are hashed.
+    content_hash: bool (optional, default False)
+        if True, identify the input files by their content unless their
+        trait has a False 'content_hash' attribute.
+    memo: CacheIndex (optional)
+        a persistent memo of the file content hashes.
+
+    Returns
+    -------
+    process_hash: string
+        the process md5 hash.
+    input_parameters: dict
+        the process input_parameters.
+    """
+    # Store for input parameters
+    input_parameters = {}
+    content_hash_parameters = set()
+
+    # Go through all the user traits
+    for name, trait in process.user_traits().iteritems():
+
+        # Get the trait value
+        value = process.get_parameter(name)
+
+        # Split input and output traits
+        is_input = True
+        if "output" in trait.__dict__ and trait.output:
+            is_input = False
+
+        # Skip undefined trait attributes and outputs
+        if is_input and value is not Undefined:
+
+            # Check specific flags before hash
+            if has_attribute(trait, "nohash", attribute_value=True,
+                             recursive=True):
+                continue
+
+            # Store the input parameter
+            input_parameters[name] = value
+            if has_attribute(trait, "content_hash", attribute_value=True,
+                             recursive=True):
+                content_hash_parameters.add(name)
+            elif (content_hash and not has_attribute(
+                    trait, "content_hash", attribute_value=False,
+                    recursive=True)):
+                content_hash_parameters.add(name)
+
+    # Add the tool versions to check roughly if the running codes have
+    # changed and add file path fingerprints
+    process_parameters = {}
+    for name, value in input_parameters.iteritems():
+        process_parameters[name] = add_fingerprints(
+            value, name in content_hash_parameters, memo)
+    process_parameters["versions"] = process.get_versions()
+
+    # Generate the process hash
+    hasher = hashlib.new("md5")
+    hasher.update(json.dumps(process_parameters, sort_keys=True))
+    process_hash = hasher.hexdigest()
+
+    return process_hash, input_parameters
+
+
+def add_fingerprints(python_object, content_hash=False, memo=None):
+    """ Add file path fingerprints.
+
+    Parameters
+    ----------
+    python_object: object
+        a generic python object.
+    content_hash: bool (optional, default False)
+        if True, use file content fingerprints.
+    memo: CacheIndex (optional)
+        a persistent memo of the file content hashes.
+
+    Returns
+    -------
+    out: object
+        the input object with fingerprint-file representation.
+    """
+    # Deal with dictionary
+    out = {}
+    if isinstance(python_object, dict):
+        for key, val in python_object.iteritems():
+            if val is not Undefined:
+                out[key] = add_fingerprints(val, content_hash, memo)
+
+    # Deal with tuple and list
+    elif isinstance(python_object, (list, tuple)):
+        out = []
+        for val in python_object:
+            if val is not Undefined:
+                out.append(add_fingerprints(val, content_hash, memo))
+        if isinstance(python_object, tuple):
+            out = tuple(out)
+
+    # Otherwise start the deletion if the object is a file
+    else:
+        out = python_object
+        if (python_object is not Undefined and
+                isinstance(python_object, basestring) and
+                os.path.isfile(python_object)):
+            if content_hash:
+                out = file_content_fingerprint(python_object, memo)
+            else:
+                out = file_fingerprint(python_object)
+
+    return out
+
+
 def get_process_signature(process, input_parameters):
     """ Generate the process signature.
 
@@ -674,6 +803,141 @@ def has_attribute(trait, attribute_name, attribute_value=None,
     return count > 0
 
 
+def file_content_hash(afile, block_size=1 << 20):
+    """ Computes the hash of a file content.
+
+    The file is read by blocks so that large files are not loaded in memory.
+
+    Parameters
+    ----------
+    afile: string
+        the file to process.
+    block_size: int (optional)
+        the size of the blocks read from the file.
+
+    Returns
+    -------
+    content_hash: string
+        the sha1 hash of the file content.
+    """
+    hasher = hashlib.sha1()
+    with open(afile, "rb") as open_file:
+        for block in iter(lambda: open_file.read(block_size), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def store_blob(afile, blobdir):
+    """ Store a file in a content-addressed blob store.
+
+    Files are named after the hash of their content, so that identical
+    files are stored once. The blob is written in a temporary file and
+    renamed, so that concurrent writers never expose a partial blob.
+
+    Parameters
+    ----------
+    afile: string
+        the file to store.
+    blobdir: string
+        the blob store directory.
+
+    Returns
+    -------
+    blob: string
+        the path of the stored blob.
+    """
+    content_hash = file_content_hash(afile)
+    blob_subdir = os.path.join(blobdir, content_hash[:2])
+    blob = os.path.join(blob_subdir, content_hash)
+    if os.path.isfile(blob):
+        # Refresh the blob change time (keeping its modification time),
+        # so that it is not removed before the entry is recorded
+        try:
+            os.utime(blob, (time.time(), os.path.getmtime(blob)))
+        except OSError:
+            pass
+    if not os.path.isfile(blob):
+        if not os.path.isdir(blob_subdir):
+            try:
+                os.makedirs(blob_subdir)
+            except OSError:
+                # The directory may have been created concurrently
+                if not os.path.isdir(blob_subdir):
+                    raise
+        fd, tmp_blob = tempfile.mkstemp(dir=blob_subdir, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copy2(afile, tmp_blob)
+            os.rename(tmp_blob, blob)
+        except:
+            os.remove(tmp_blob)
+            raise
+    return blob
+
+
+def _reflink(source, destination):
+    """ Create a copy-on-write clone of a file, on filesystems supporting
+    it (Linux FICLONE ioctl).
+
+    Returns
+    -------
+    done: bool
+        True if the clone has been created.
+    """
+    try:
+        import fcntl
+        with open(source, "rb") as source_file:
+            with open(destination, "wb") as destination_file:
+                fcntl.ioctl(destination_file.fileno(), _FICLONE,
+                            source_file.fileno())
+    except (ImportError, IOError, OSError):
+        return False
+    shutil.copystat(source, destination)
+    return True
+
+
+def restore_blob(blob, afile, hardlink=False):
+    """ Restore a file from the blob store.
+
+    The file is cloned when the filesystem supports it, otherwise it is
+    copied. Hard links are cheaper, but the blob is then shared with the
+    restored file: a tool modifying the file in place would corrupt all the
+    cache entries referencing this blob. They are therefore only used if
+    requested.
+
+    Parameters
+    ----------
+    blob: string
+        the stored blob.
+    afile: string
+        the file to restore.
+    hardlink: bool (optional, default False)
+        if True, create a hard link to the blob when it cannot be cloned and
+        when it is on the same filesystem.
+    """
+    # Write a temporary file that replaces the restored file at the end
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(afile),
+                                    prefix=".capsul_restore_")
+    os.close(fd)
+    try:
+        if not _reflink(blob, tmp_file):
+            linked = False
+            if hardlink:
+                os.remove(tmp_file)
+                try:
+                    os.link(blob, tmp_file)
+                    linked = True
+                except OSError:
+                    pass
+            if not linked:
+                shutil.copy2(blob, tmp_file)
+        os.rename(tmp_file, afile)
+    except:
+        if os.path.lexists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
 def file_fingerprint(afile):
     """ Computes the file fingerprint.
 
@@ -702,6 +966,45 @@ def file_fingerprint(afile):
     return fingerprint
 
 
+def file_content_fingerprint(afile, memo=None):
+    """ Computes the file fingerprint from its content.
+
+    The file content hash is memorized, in the current process and in the
+    optional memo, with the file inode, size and modification time, so
+    that an unchanged file is hashed once.
+
+    Parameters
+    ----------
+    afile: string
+        the file to process.
+    memo: CacheIndex (optional)
+        a persistent memo of the file content hashes.
+
+    Returns
+    -------
+    fingerprint: dict
+        the file location and content hash.
+    """
+    stat = os.stat(afile)
+    key = (stat.st_ino, stat.st_size, repr(stat.st_mtime))
+    memorized = _file_hashes.get(afile)
+    if memorized is not None and memorized[0] == key:
+        content_hash = memorized[1]
+    else:
+        content_hash = None
+        if memo is not None:
+            content_hash = memo.get_file_hash(afile, *key)
+        if content_hash is None:
+            content_hash = file_content_hash(afile)
+            if memo is not None:
+                memo.set_file_hash(afile, *(key + (content_hash, )))
+        _file_hashes[afile] = (key, content_hash)
+    return {
+        "name": afile,
+        "content": content_hash
+    }
+
+
 class CapsulResultEncoder(json.JSONEncoder):
     """ Deal with ProcessResult in json.
     """
@@ -718,8 +1021,11 @@ class CapsulResultEncoder(json.JSONEncoder):
         if isinstance(obj, Undefined.__class__):
             return "<undefined_trait_value>"
 
-        # InterfaceResult special case
-        if isinstance(obj, InterfaceResult):
+        # InterfaceResult special case: nipype is not imported if no nipype
+        # interface is executed
+        interface_result = loaded_class("nipype.interfaces.base",
+                                        "InterfaceResult")
+        if interface_result is not None and isinstance(obj, interface_result):
             return "<skip_nipype_interface_result>"
 
         # Array special case
@@ -789,24 +1095,62 @@ class CapsulResultDecoder(json.JSONDecoder):
 class Memory(object):
     """ Memory context to provide caching for processes.
 
+    The cache entries created through this class are recorded in an SQLite
+    index of the memory directory (see
+    :py:class:`~capsul.study_config.cache_index.CacheIndex`), which is used
+    to look the results up, list the entries and evict them without
+    walking the whole cache.
+
     Attributes
     ----------
     `cachedir`: string
         the location for the caching. If None is given, no caching is done.
+    `index`: CacheIndex
+        the index of the cache entries, None if no caching is done.
+    `max_size`: int
+        the default maximum size of the cache in bytes used by
+        :py:meth:`evict`. If None, the size is not limited.
+    `max_age`: float
+        the default maximum time in seconds since the last access of a cache
+        entry used by :py:meth:`evict`. If None, the age is not limited.
+    `content_hash`: bool
+        if True, the input files are identified by their content rather
+        than by their modification time and size.
+    `blobs_grace_period`: float
+        the time in seconds during which a stored or reused blob is never
+        removed as unreferenced.
 
     Methods
     -------
     cache
     clear
+    evict
+    entries
+    stats
     """
 
-    def __init__(self, cachedir):
+    def __init__(self, cachedir, hardlink_restore=False, max_size=None,
+                 max_age=None, content_hash=False,
+                 blobs_grace_period=BLOBS_GRACE_PERIOD):
         """ Initialize the Memory class.
 
         Parameters
         ----------
         base_dir: string
             the directory name of the location for the caching.
+        hardlink_restore: bool (optional, default False)
+            if True, cached files are restored as hard links to the blob
+            store when they cannot be reflinked (see :py:func:`restore_blob`).
+        max_size: int (optional)
+            the default maximum size of the cache in bytes.
+        max_age: float (optional)
+            the default maximum age of the cache entries in seconds.
+        content_hash: bool (optional, default False)
+            if True, the input files are identified by their content
+            rather than by their modification time and size.
+        blobs_grace_period: float (optional)
+            the time in seconds during which a stored or reused blob is
+            never removed as unreferenced.
         """
         # Build the capsul memory folder
         if cachedir is not None:
@@ -820,8 +1164,16 @@ class Memory(object):
         # Define class parameters
         self.cachedir = cachedir
         self.timestamp = time.time()
+        self.hardlink_restore = hardlink_restore
+        self.max_size = max_size
+        self.max_age = max_age
+        self.content_hash = content_hash
+        self.blobs_grace_period = blobs_grace_period
+        self.index = None
+        if cachedir is not None:
+            self.index = CacheIndex(cachedir)
 
-    def cache(self, process, verbose=1):
+    def cache(self, process, verbose=1, worker_pool=None):
         """ Create a proxy of the given process in order to only execute
         the process for input parameters not cached on disk.
 
@@ -831,6 +1183,9 @@ class Memory(object):
             the capsul Process to be wrapped and cached.
         verbose: int
             if different from zero, print console messages.
+        worker_pool: WorkerPool (optional)
+            if given, the process is executed by a worker of this pool
+            (see :py:class:`capsul.process.worker_pool.WorkerPool`).
 
         Returns
         -------
@@ -871,31 +1226,199 @@ class Memory(object):
 
         # If the cachedir is None no caching is done
         if self.cachedir is None:
-            return UnMemorizedProcess(process, verbose)
+            return UnMemorizedProcess(process, verbose, worker_pool)
         # Otherwise a proxy process is created
         else:
             return MemorizedProcess(process, self.cachedir, self.timestamp,
-                                    verbose)
+                                    verbose, self.hardlink_restore, self,
+                                    self.content_hash, worker_pool)
 
     def clear(self, skips=None):
         """ Remove all the cache appart from those given to the method
         input.
 
+        Only the indexed entries are considered. The blobs that are not
+        referenced anymore are removed, unless they have been stored or
+        reused during the last blobs_grace_period seconds.
+
         Parameters
         ----------
         skips: list
             a list of path to keep during the cache deletion.
         """
         # Get all memory directories to remove
-        to_remove_folders = []
         skips = skips or []
-        for root, dirs, files in os.walk(self.cachedir):
-            if "result.json" and files and dirs == [] and root not in skips:
-                to_remove_folders.append(root)
+        to_remove_folders = [
+            entry["process_dir"] for entry in self.index.entries()
+            if entry["process_dir"] not in skips]
 
-        # Delete memory directories
+        # Forget the removed entries and delete their directories
+        self.index.remove_entries(to_remove_folders)
         for folder in to_remove_folders:
-            shutil.rmtree(folder)
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+
+        # Delete the files that are not used anymore
+        self._remove_unreferenced_blobs()
+
+    def evict(self, max_size=None, max_age=None, dry_run=False):
+        """ Remove cache entries according to their last access time.
+
+        Entries that have not been accessed for more than max_age seconds
+        are removed, then the least recently used entries are removed until
+        the cache size is below max_size. Only the indexed entries are
+        considered. As in clear(), the blobs that are no longer referenced
+        are kept while they are younger than blobs_grace_period.
+
+        Parameters
+        ----------
+        max_size: int (optional)
+            the maximum size of the cache in bytes. Default: self.max_size.
+        max_age: float (optional)
+            the maximum time in seconds since the last access of an entry.
+            Default: self.max_age.
+        dry_run: bool (optional, default False)
+            if True, nothing is removed, only the report is returned.
+
+        Returns
+        -------
+        report: dict
+            'evicted': list of (process_dir, last_access, freed_size) for
+            each evicted entry, 'freed_size': the total freed size in bytes,
+            'size_before' and 'size_after': the cache sizes in bytes.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_age is None:
+            max_age = self.max_age
+        now = time.time()
+        entries = self.index.entries()
+        entry_blobs = self.index.entry_blobs()
+
+        # Count the blobs references and the cache size
+        blob_references = {}
+        blob_sizes = {}
+        total_size = 0
+        for entry in entries:
+            total_size += entry["size"]
+            for blob, size in entry_blobs.get(
+                    entry["process_dir"], {}).iteritems():
+                blob_references[blob] = blob_references.get(blob, 0) + 1
+                blob_sizes[blob] = size
+        total_size += sum(blob_sizes.itervalues())
+        size_before = total_size
+
+        # Select the entries to remove, least recently used first
+        evicted = []
+        for entry in entries:
+            too_old = (max_age is not None and
+                       now - entry["last_access"] > max_age)
+            too_big = max_size is not None and total_size > max_size
+            if not (too_old or too_big):
+                continue
+            freed_size = entry["size"]
+            for blob in entry_blobs.get(entry["process_dir"], {}):
+                blob_references[blob] -= 1
+                if blob_references[blob] == 0:
+                    freed_size += blob_sizes[blob]
+            total_size -= freed_size
+            evicted.append((entry["process_dir"], entry["last_access"],
+                            freed_size))
+
+        # Remove the entries and the blobs they only reference
+        if not dry_run and evicted:
+            process_dirs = [item[0] for item in evicted]
+            for process_dir in process_dirs:
+                if os.path.isdir(process_dir):
+                    shutil.rmtree(process_dir)
+            now = time.time()
+            for blob in self.index.remove_entries(process_dirs):
+                self._remove_blob(os.path.join(self.cachedir, blob), now)
+
+        return {
+            "evicted": evicted,
+            "freed_size": size_before - total_size,
+            "size_before": size_before,
+            "size_after": total_size
+        }
+
+    def entries(self, process_id=None):
+        """ List the indexed cache entries, least recently used first.
+
+        Parameters
+        ----------
+        process_id: string (optional)
+            if given, only list the entries of this process.
+
+        Returns
+        -------
+        entries: list of dict
+            the description of each entry (see
+            :py:meth:`CacheIndex.entries
+            <capsul.study_config.cache_index.CacheIndex.entries>`).
+        """
+        return self.index.entries(process_id)
+
+    def stats(self):
+        """ Get the statistics of the indexed cache entries.
+
+        Returns
+        -------
+        stats: dict
+            the number of 'entries', the number of 'hits' and the total
+            'size' in bytes of the cache.
+        """
+        return self.index.stats()
+
+    def _record_entry(self, process_dir, process_hash, process_id,
+                      input_parameters, output_parameters, file_mapping):
+        """ Record a new cache entry in the index.
+        """
+        size = sum(os.path.getsize(os.path.join(process_dir, fname))
+                   for fname in os.listdir(process_dir))
+        blobs = dict((os.path.relpath(memory_file, self.cachedir),
+                      os.path.getsize(memory_file))
+                     for workspace_file, memory_file in file_mapping)
+        self.index.add_entry(
+            process_dir, process_hash, process_id,
+            json.dumps(input_parameters, sort_keys=True,
+                       cls=CapsulResultEncoder),
+            json.dumps(output_parameters, sort_keys=True,
+                       cls=CapsulResultEncoder),
+            size, blobs)
+
+    def _remove_unreferenced_blobs(self):
+        """ Remove the blobs that are not referenced by any indexed cache
+        entry and that have not been stored or reused during the last
+        blobs_grace_period seconds.
+        """
+        blobdir = os.path.join(self.cachedir, BLOBS_DIRECTORY)
+        if not os.path.isdir(blobdir):
+            return
+        referenced_blobs = set()
+        for blobs in self.index.entry_blobs().itervalues():
+            referenced_blobs.update(blobs)
+        now = time.time()
+        for blob_subdir in os.listdir(blobdir):
+            blob_subdir = os.path.join(blobdir, blob_subdir)
+            if not os.path.isdir(blob_subdir):
+                continue
+            for fname in os.listdir(blob_subdir):
+                blob = os.path.join(blob_subdir, fname)
+                if os.path.relpath(blob, self.cachedir) in referenced_blobs:
+                    continue
+                self._remove_blob(blob, now)
+
+    def _remove_blob(self, blob, now):
+        """ Remove a blob unless it has been stored or reused during the
+        last blobs_grace_period seconds.
+        """
+        try:
+            if now - os.stat(blob).st_ctime >= self.blobs_grace_period:
+                os.remove(blob)
+        except OSError:
+            # The blob may have been removed concurrently
+            pass
 
     def __repr__(self):
         """ Memory class representation.
@@ -22,7 +22,8 @@ logger = logging.getLogger(__name__)
 
 
 def run_process(output_dir, process_instance, cachedir=None,
-                generate_logging=False, verbose=1, **kwargs):
+                generate_logging=False, verbose=1, worker_pool=None,
+                **kwargs):
     """ Execute a capsul process in a specific directory.
 
     Parameters
@@ -31,13 +32,16 @@ def run_process(output_dir, process_instance, cachedir=None,
         the folder where the process will write results.
     process_instance: Process (madatory)
         the capsul process we want to execute.
-    cachedir: str (optional, default None)
+    cachedir: str or Memory (optional, default None)
         save in the cache the current process execution.
         If None, no caching is done.
     generate_logging: bool (optional, default False)
         if True save the log stored in the process after its execution.
     verbose: int
         if different from zero, print console messages.
+    worker_pool: WorkerPool (optional)
+        if given, the process is executed by a worker of this pool
+        (see :py:class:`capsul.process.worker_pool.WorkerPool`).
 
     Returns
     -------
@@ -73,8 +77,12 @@ def run_process(output_dir, process_instance, cachedir=None,
         process_instance.log_file = output_log_file
 
     # Create a memory object
-    mem = Memory(cachedir)
-    proxy_instance = mem.cache(process_instance, verbose=verbose)
+    if isinstance(cachedir, Memory):
+        mem = cachedir
+    else:
+        mem = Memory(cachedir)
+    proxy_instance = mem.cache(process_instance, verbose=verbose,
+                               worker_pool=worker_pool)
 
     # Execute the proxy process
     returncode = proxy_instance(**kwargs)
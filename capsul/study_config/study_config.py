@@ -10,7 +10,12 @@
 import os
 import logging
 import json
+import hashlib
 import sys
+import Queue
+import weakref
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 if sys.version_info[:2] >= (2, 7):
     from collections import OrderedDict
 else:
@@ -20,7 +25,7 @@ else:
 logger = logging.getLogger(__name__)
 
 # Trait import
-from traits.api import Directory, Bool, String, Undefined
+from traits.api import Directory, File, Bool, String, Int, Undefined
 
 # Soma import
 from soma.controller import Controller
@@ -29,9 +34,28 @@ from soma.controller import Controller
 from capsul.pipeline import Pipeline
 from capsul.process import Process
 from run import run_process
-from capsul.pipeline.pipeline_workflow import (
-    workflow_from_pipeline, local_workflow_run)
+from memory import Memory
+from memory import CapsulResultEncoder
 from capsul.pipeline.pipeline_nodes import Node
+from capsul.pipeline.pipeline_tools import critical_path_priorities
+from capsul.pipeline.pipeline_tools import nodes_estimated_durations
+from capsul.process.runtime_history import RuntimeHistory
+from capsul.process.runtime_history import get_runtime_history
+from capsul.process.runtime_history import set_runtime_history
+from capsul.process.worker_pool import can_run_in_worker
+from capsul.process.worker_pool import get_worker_pool
+
+
+def _local_resources():
+    """ Get the number of cores and the memory in MB of the local machine.
+    """
+    cpu_count = multiprocessing.cpu_count()
+    try:
+        memory = (os.sysconf("SC_PHYS_PAGES") *
+                  os.sysconf("SC_PAGE_SIZE")) // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        memory = None
+    return cpu_count, memory
 
 
 class StudyConfig(Controller):
@@ -69,6 +93,20 @@ class StudyConfig(Controller):
         parameter to set the study output directory
     `generate_logging` : bool (default False)
         parameter to control the log generation
+    `number_of_local_workers` : int (default 1)
+        parameter to set the number of pipeline nodes executed in parallel
+        on the local machine
+    `incremental_run` : bool (default False)
+        parameter to skip the pipeline nodes whose inputs did not change
+        since their last execution, nor the inputs of the nodes they depend
+        on, during the lifetime of the study configuration
+    `use_worker_pool` : bool (default False)
+        parameter to execute the processes in persistent python worker
+        processes, started once with their modules imported
+    `runtime_history_file` : str
+        parameter to set the database where the durations of the executed
+        processes are recorded, the longest pipeline nodes being started
+        first in the following runs
 
     Methods
     -------
@@ -105,6 +143,30 @@ class StudyConfig(Controller):
         False,
         desc="Parameter to control the log generation")
 
+    number_of_local_workers = Int(
+        1,
+        desc="Maximum number of pipeline nodes executed in parallel on the "
+             "local machine when soma-workflow is not used")
+
+    incremental_run = Bool(
+        False,
+        desc="If True, only execute the pipeline nodes whose inputs changed "
+             "since their last execution, and the nodes depending on them, "
+             "when soma-workflow is not used. The executions are only "
+             "remembered during the lifetime of this study configuration")
+
+    use_worker_pool = Bool(
+        False,
+        desc="If True, execute the processes in a pool of persistent python "
+             "worker processes when soma-workflow is not used, to save the "
+             "interpreter startup and the imports of each process")
+
+    runtime_history_file = File(
+        Undefined,
+        desc="Parameter to set the database recording the processes "
+             "executions durations, used to start the longest pipeline nodes "
+             "first")
+
     automatic_configuration = Bool(
         False,
         desc="If True, tries to automatically setup configuration on startup")
@@ -132,6 +194,13 @@ class StudyConfig(Controller):
         # Inheritance
         super(StudyConfig, self).__init__()
 
+        # The inputs hash of the last successful execution of each process,
+        # used by incremental runs: these states are only kept in memory
+        self._execution_states = weakref.WeakKeyDictionary()
+
+        # The runtime history opened from runtime_history_file
+        self._history = None
+
         if study_name:
             self.study_name = study_name
 
@@ -249,19 +318,78 @@ class StudyConfig(Controller):
         verbose: int
             if different from zero, print console messages.
         """
+        # Record the processes executions in the runtime history during the
+        # run
+        previous_history = get_runtime_history()
+        history = self._runtime_history()
+        if history is not None:
+            set_runtime_history(history)
+        try:
+            result = self._run_with_history(process_or_pipeline,
+                                            executer_qc_nodes, verbose,
+                                            history, **kwargs)
+        finally:
+            set_runtime_history(previous_history)
+
+        # Evict the old cached results once the whole execution is done
+        if not self.get_trait_value("use_soma_workflow"):
+            self._evict_smart_caching()
+        return result
+
+    def _evict_smart_caching(self):
+        """ Evict the smart-caching results above the configured maximum
+        size or age.
+        """
+        if self.get_trait_value("use_smart_caching") in [None, False]:
+            return
+        max_size = self.get_trait_value("smart_caching_max_size")
+        max_age = self.get_trait_value("smart_caching_max_age")
+        if max_size or max_age:
+            Memory(self.output_directory).evict(
+                max_size=max_size * 1e9 if max_size else None,
+                max_age=max_age * 86400. if max_age else None)
+
+    def _runtime_history(self):
+        """ Get the runtime history of the study.
+
+        Returns
+        -------
+        history: RuntimeHistory
+            the runtime history recorded in runtime_history_file, None if
+            this file is not set.
+        """
+        if self.runtime_history_file in (Undefined, None, ""):
+            return None
+        history = self._history
+        if history is None or history.db_file != self.runtime_history_file:
+            history = RuntimeHistory(self.runtime_history_file)
+            self._history = history
+        return history
+
+    def _run_with_history(self, process_or_pipeline, executer_qc_nodes,
+                          verbose, history, **kwargs):
+        """ Execute a process or a pipeline (see :py:meth:`run`), the
+        pipeline nodes being prioritized according to their estimated
+        durations in the runtime history.
+        """
         # Use soma worflow to execute the pipeline or porcess in parallel
         # on the local machine
         if self.get_trait_value("use_soma_workflow"):
 
+            # Import soma-workflow only when it is used
+            from capsul.pipeline.pipeline_workflow import (
+                workflow_from_pipeline, local_workflow_run)
+            from soma_workflow import constants as swconstants
+
             # Create soma workflow pipeline
-            workflow = workflow_from_pipeline(process_or_pipeline)
+            workflow = workflow_from_pipeline(
+                process_or_pipeline,
+                prioritize_critical_path=history is not None,
+                runtime_history=history, use_skeleton_cache=True)
             controller, wf_id = local_workflow_run(process_or_pipeline.id,
                                                    workflow)
             workflow_status = controller.workflow_status(wf_id)
             elements_status = controller.workflow_elements_status(wf_id)
-            # FIXME: it would be better if study_config does not require
-            # soma_workflow modules.
-            from soma_workflow import constants as swconstants
             self.failed_jobs = [
                 element for element in elements_status[0]
                 if element[1] != swconstants.DONE
@@ -295,6 +423,20 @@ class StudyConfig(Controller):
                     "Can't create folder '{0}', please investigate.".format(
                         self.output_directory))
 
+            # Execute independent pipeline nodes in parallel
+            if (isinstance(process_or_pipeline, Pipeline) and
+                    self.number_of_local_workers > 1):
+                self._run_parallel(process_or_pipeline, executer_qc_nodes,
+                                   verbose, history, **kwargs)
+                return
+
+            # Execute the pipeline nodes whose inputs changed
+            if (isinstance(process_or_pipeline, Pipeline) and
+                    self.incremental_run):
+                self._run_incremental(process_or_pipeline, executer_qc_nodes,
+                                      verbose, **kwargs)
+                return
+
             # Generate ordered execution list
             execution_list = []
             if isinstance(process_or_pipeline, Pipeline):
@@ -321,7 +463,217 @@ class StudyConfig(Controller):
                 else:
                     self._run(process_node, verbose, **kwargs)
 
-    def _run(self, process_instance, verbose, **kwargs):
+    def _run_incremental(self, pipeline, executer_qc_nodes, verbose,
+                         **kwargs):
+        """ Method to execute the pipeline nodes whose inputs changed since
+        their last execution.
+
+        A node is executed if one of the nodes it depends on has been
+        executed, or if its input values differ from the values of its last
+        successful execution. Unchanged nodes are skipped without accessing
+        their cache entries or files. The executions are only recorded in
+        memory: a new study configuration, or a new python session, executes
+        all the nodes again.
+
+        Parameters
+        ----------
+        pipeline: Pipeline instance (mandatory)
+            the pipeline we want to execute
+        executer_qc_nodes: bool (mandatory)
+            if True execute process nodes that are taged as qualtity control
+            process nodes.
+        verbose: int
+            if different from zero, print console messages.
+        """
+        executed_nodes = set()
+        for node, dependencies in pipeline.workflow_nodes_dependencies():
+            if not executer_qc_nodes and node.node_type == "view_node":
+                continue
+            state = self._execution_state(node.process, kwargs)
+            if (dependencies.isdisjoint(executed_nodes) and
+                    state is not None and
+                    self._execution_states.get(node.process) == state):
+                continue
+            executed_nodes.add(node)
+            self._execution_states.pop(node.process, None)
+            self._run(node.process, verbose, **kwargs)
+            self._execution_states[node.process] = state
+
+    def _execution_state(self, process_instance, kwargs):
+        """ Get a hash of the input values of a process that are compared
+        by incremental runs.
+
+        The input values are identified by their content, so that arrays
+        modified in place are detected. The process output directory, which
+        is set at each execution, is replaced by the study output directory.
+
+        Parameters
+        ----------
+        process_instance: Process instance (mandatory)
+            the process
+        kwargs: dict (mandatory)
+            the parameters given to the execution
+
+        Returns
+        -------
+        state: string
+            the md5 hash of the input values, None if they cannot be
+            serialized and the process must always be executed.
+        """
+        values = dict(kwargs)
+        for name, trait in process_instance.user_traits().iteritems():
+            if not trait.output and name != "output_directory":
+                values.setdefault(name, process_instance.get_parameter(name))
+        values["output_directory"] = self.output_directory
+        try:
+            state = json.dumps(values, sort_keys=True,
+                               cls=CapsulResultEncoder)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.md5(state).hexdigest()
+
+    def _run_parallel(self, pipeline, executer_qc_nodes, verbose,
+                      history=None, **kwargs):
+        """ Method to execute a pipeline nodes in parallel on the local
+        machine.
+
+        Nodes are executed by a pool of number_of_local_workers threads as
+        soon as the nodes they depend on have been executed, the nodes on
+        the critical path of the pipeline being started first, according to
+        the durations estimated from the runtime history if any. Process
+        counters are given to the nodes in the order they are started. A
+        node is only started if the cores and memory it requires (see
+        Process.requirements) are available on the local machine, a node
+        requiring more than the machine being executed alone, and undeclared
+        requirements being ignored. After a
+        failure, no other node is started, and the error is raised when the
+        running nodes are done. Unchanged nodes are skipped in incremental
+        runs (see :py:meth:`_run_incremental`).
+
+        Parameters
+        ----------
+        pipeline: Pipeline instance (mandatory)
+            the pipeline we want to execute
+        executer_qc_nodes: bool (mandatory)
+            if True execute process nodes that are taged as qualtity control
+            process nodes.
+        verbose: int
+            if different from zero, print console messages.
+        history: RuntimeHistory (optional)
+            the recorded executions used to estimate the nodes durations.
+        """
+        waiting_nodes = pipeline.workflow_nodes_dependencies()
+        durations = None
+        if history is not None:
+            durations = nodes_estimated_durations(pipeline, history)
+        priorities = critical_path_priorities(pipeline.workflow_graph(),
+                                              durations)
+        waiting_nodes.sort(key=lambda item: -priorities.get(item[0], 0))
+        done_nodes = set()
+        running_nodes = set()
+        executed_nodes = set()
+        results = Queue.Queue()
+        failure = None
+        cpu_count, memory = _local_resources()
+        capacity = {"cpu": cpu_count, "memory": memory}
+        available = dict(capacity)
+        reserved = {}
+
+        def node_requirements(node):
+            requirements = node.get_requirements()
+            return dict(
+                (name, min(requirements[name] or 0, capacity[name])
+                 if capacity[name] is not None else 0)
+                for name in ("cpu", "memory"))
+
+        def fits(requirements):
+            if not running_nodes:
+                return True
+            if len(running_nodes) >= self.number_of_local_workers:
+                return False
+            return all(available[name] is None or
+                       requirements[name] <= available[name]
+                       for name in requirements)
+
+        def execute(node, process_counter, state):
+            try:
+                self._run(node.process, verbose, process_counter, **kwargs)
+                self._execution_states[node.process] = state
+                results.put((node, None))
+            except Exception:
+                results.put((node, sys.exc_info()))
+
+        pool = ThreadPool(self.number_of_local_workers)
+        try:
+            while waiting_nodes or running_nodes:
+                # Start the nodes whose dependencies have been executed
+                if failure is None:
+                    ready = True
+                    while ready:
+                        ready = False
+                        still_waiting_nodes = []
+                        for node, dependencies in waiting_nodes:
+                            if not dependencies.issubset(done_nodes):
+                                still_waiting_nodes.append(
+                                    (node, dependencies))
+                                continue
+                            if (not executer_qc_nodes and
+                                    node.node_type == "view_node"):
+                                # Filtered nodes are not executed
+                                done_nodes.add(node)
+                                ready = True
+                                continue
+                            state = self._execution_state(node.process,
+                                                          kwargs)
+                            if (self.incremental_run and
+                                    dependencies.isdisjoint(executed_nodes) and
+                                    state is not None and
+                                    self._execution_states.get(
+                                        node.process) == state):
+                                # Unchanged nodes are not executed
+                                done_nodes.add(node)
+                                ready = True
+                                continue
+                            requirements = node_requirements(node)
+                            if not fits(requirements):
+                                # Wait for resources to be released
+                                still_waiting_nodes.append(
+                                    (node, dependencies))
+                            else:
+                                for name, value in requirements.iteritems():
+                                    if available[name] is not None:
+                                        available[name] -= value
+                                reserved[node] = requirements
+                                running_nodes.add(node)
+                                executed_nodes.add(node)
+                                self._execution_states.pop(node.process, None)
+                                pool.apply_async(
+                                    execute,
+                                    (node, self.process_counter, state))
+                                self.process_counter += 1
+                        waiting_nodes = still_waiting_nodes
+                if not running_nodes:
+                    break
+
+                # Wait for a node to be executed
+                node, error = results.get()
+                running_nodes.remove(node)
+                for name, value in reserved.pop(node).iteritems():
+                    if available[name] is not None:
+                        available[name] += value
+                if error is not None:
+                    if failure is None:
+                        failure = error
+                else:
+                    done_nodes.add(node)
+        finally:
+            pool.close()
+            pool.join()
+        if failure is not None:
+            raise failure[0], failure[1], failure[2]
+
+    def _run(self, process_instance, verbose, process_counter=None,
+             **kwargs):
         """ Method to execute a process in a study configuration environment.
 
         Parameters
@@ -330,28 +682,44 @@ class StudyConfig(Controller):
             the process we want to execute
         verbose: int
             if different from zero, print console messages.
+        process_counter: int (optional)
+            the number of the process execution. If not given, the study
+            process_counter is used and incremented.
         """
         # Message
         logger.info("Study Config: executing process '{0}'...".format(
             process_instance.id))
 
         # Run
+        increment_counter = process_counter is None
+        if increment_counter:
+            process_counter = self.process_counter
         destination_folder = os.path.join(
             self.output_directory,
-            "{0}-{1}".format(self.process_counter, process_instance.name))
+            "{0}-{1}".format(process_counter, process_instance.name))
         if self.get_trait_value("use_smart_caching") in [None, False]:
-            cachedir = None
+            memory = None
         else:
-            cachedir = self.output_directory
+            memory = Memory(
+                self.output_directory,
+                hardlink_restore=bool(
+                    self.get_trait_value("smart_caching_hardlink_restore")),
+                content_hash=bool(
+                    self.get_trait_value("smart_caching_content_hash")))
+        worker_pool = None
+        if self.use_worker_pool and can_run_in_worker(process_instance):
+            worker_pool = get_worker_pool(self.number_of_local_workers)
         returncode, log_file = run_process(
             destination_folder,
             process_instance,
-            cachedir,
+            memory,
             self.generate_logging,
+            worker_pool=worker_pool,
             **kwargs)
 
         # Increment the number of executed process count
-        self.process_counter += 1
+        if increment_counter:
+            self.process_counter += 1
 
     def reset_process_counter(self):
         """ Method to reset the process counter to one.
@@ -0,0 +1,207 @@
+#! /usr/bin/env python
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import tempfile
+import shutil
+import numpy
+
+# Capsul import
+from capsul.process import Process
+from capsul.pipeline import Pipeline
+from capsul.study_config.study_config import StudyConfig
+from capsul.study_config.memory import Memory
+
+# Trait import
+from traits.api import Float, Directory, Array
+
+
+# The executed processes
+executed = []
+
+
+class CountingProcess(Process):
+    """ A process adding its inputs and recording its executions.
+    """
+    f = Float(output=False, optional=False, desc="a float")
+    g = Float(0., output=False, optional=True, desc="a float")
+    output_directory = Directory(output=False, optional=True,
+                                 exists=False, desc="a directory")
+    res = Float(output=True, desc="a float")
+
+    def _run_process(self):
+        executed.append(self)
+        self.res = self.f + self.g
+
+
+class ChainsPipeline(Pipeline):
+    """ A pipeline with a two steps chain and an independent node.
+    """
+    def pipeline_definition(self):
+        self.add_process("a1", CountingProcess)
+        self.add_process("a2", CountingProcess)
+        self.add_process("b1", CountingProcess)
+        self.add_link("a1.res->a2.f")
+        self.export_parameter("a1", "f", "fa")
+        self.export_parameter("a2", "g", "ga")
+        self.export_parameter("b1", "f", "fb")
+        self.export_parameter("a2", "res", "res_a")
+        self.export_parameter("b1", "res", "res_b")
+
+
+class ArrayProcess(Process):
+    """ A process summing an array and recording its executions.
+    """
+    a = Array(output=False, optional=False, desc="an array")
+    output_directory = Directory(output=False, optional=True,
+                                 exists=False, desc="a directory")
+    res = Float(output=True, desc="a float")
+
+    def _run_process(self):
+        executed.append(self)
+        self.res = float(self.a.sum())
+
+
+class ArrayPipeline(Pipeline):
+    """ A pipeline with an array input.
+    """
+    def pipeline_definition(self):
+        self.add_process("sum", ArrayProcess)
+        self.export_parameter("sum", "a", "a")
+        self.export_parameter("sum", "res", "res")
+
+
+class TestIncrementalRun(unittest.TestCase):
+    """ Only execute the pipeline nodes whose inputs changed.
+    """
+    def setUp(self):
+        self.output_directory = tempfile.mkdtemp()
+        del executed[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.output_directory)
+
+    def check_incremental_run(self, number_of_local_workers):
+        study_config = StudyConfig(
+            modules=["SmartCachingConfig"],
+            use_smart_caching=False,
+            output_directory=self.output_directory,
+            number_of_local_workers=number_of_local_workers,
+            incremental_run=True)
+        pipeline = ChainsPipeline()
+        nodes = dict((name, pipeline.nodes[name].process)
+                     for name in ("a1", "a2", "b1"))
+        pipeline.fa = 1.
+        pipeline.fb = 3.
+
+        # All the nodes are executed the first time
+        study_config.run(pipeline)
+        self.assertEqual(set(executed), set(nodes.values()))
+        self.assertEqual(pipeline.res_a, 1.)
+
+        # Nothing is executed when nothing changed
+        del executed[:]
+        study_config.run(pipeline)
+        self.assertEqual(executed, [])
+
+        # Only the changed node is executed
+        pipeline.ga = 2.
+        study_config.run(pipeline)
+        self.assertEqual(executed, [nodes["a2"]])
+        self.assertEqual(pipeline.res_a, 3.)
+
+        # The nodes depending on a changed node are executed
+        del executed[:]
+        pipeline.fa = 2.
+        study_config.run(pipeline)
+        self.assertEqual(executed, [nodes["a1"], nodes["a2"]])
+        self.assertEqual(pipeline.res_a, 4.)
+        self.assertEqual(pipeline.res_b, 3.)
+
+    def test_sequential_incremental_run(self):
+        self.check_incremental_run(1)
+
+    def test_parallel_incremental_run(self):
+        self.check_incremental_run(2)
+
+    def test_array_incremental_run(self):
+        """ Arrays are compared by content.
+        """
+        study_config = StudyConfig(
+            modules=["SmartCachingConfig"],
+            use_smart_caching=False,
+            output_directory=self.output_directory,
+            incremental_run=True)
+        pipeline = ArrayPipeline()
+        pipeline.a = numpy.array([1., 2.])
+        study_config.run(pipeline)
+        self.assertEqual(len(executed), 1)
+        self.assertEqual(pipeline.res, 3.)
+
+        # An equal array does not trigger an execution
+        del executed[:]
+        pipeline.a = numpy.array([1., 2.])
+        study_config.run(pipeline)
+        self.assertEqual(executed, [])
+
+        # An array modified in place is detected
+        pipeline.a[0] = 2.
+        study_config.run(pipeline)
+        self.assertEqual(len(executed), 1)
+        self.assertEqual(pipeline.res, 4.)
+
+        # Changing the output directory triggers an execution
+        del executed[:]
+        other_directory = tempfile.mkdtemp()
+        try:
+            study_config.output_directory = other_directory
+            study_config.run(pipeline)
+        finally:
+            shutil.rmtree(other_directory)
+        self.assertEqual(len(executed), 1)
+
+    def test_eviction_after_run(self):
+        """ The smart-caching results are evicted once per run.
+        """
+        study_config = StudyConfig(
+            modules=["SmartCachingConfig"],
+            use_smart_caching=True,
+            smart_caching_max_size=1e-12,
+            output_directory=self.output_directory)
+        pipeline = ChainsPipeline()
+        pipeline.fa = 1.
+        pipeline.fb = 3.
+        evictions = []
+        evict = Memory.evict
+
+        def counting_evict(memory, *args, **kwargs):
+            evictions.append(memory)
+            return evict(memory, *args, **kwargs)
+
+        Memory.evict = counting_evict
+        try:
+            study_config.run(pipeline)
+        finally:
+            Memory.evict = evict
+        self.assertEqual(len(executed), 3)
+        self.assertEqual(len(evictions), 1)
+        self.assertEqual(evictions[0].entries(), [])
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestIncrementalRun)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -12,12 +12,13 @@ import unittest
 import os
 import tempfile
 import shutil
+import time
 
 # Capsul import
 from capsul.process import Process
 from capsul.process import FileCopyProcess
 from capsul.process import get_process_instance
-from capsul.study_config.memory import Memory
+from capsul.study_config.memory import Memory, BLOBS_DIRECTORY
 
 # Trait import
 from traits.api import Float, File, List, String
@@ -49,6 +50,31 @@ class DummyCopyProcess(FileCopyProcess):
         self.s = repr(self.copied_inputs)
 
 
+class DummyFileProcess(Process):
+    """ Dummy file writer.
+    """
+    f = Float(output=False, optional=False, desc="a float")
+    o = File(output=True, optional=False, desc="an output file")
+
+    def _run_process(self):
+        with open(self.o, "w") as open_file:
+            open_file.write("dummy content")
+
+
+class DummyReadProcess(Process):
+    """ Dummy file reader.
+    """
+    i = File(output=False, optional=False, desc="an input file")
+    j = File(output=False, optional=True, content_hash=False,
+             desc="an input file identified by its modification time")
+    size = Float(output=True, desc="the input file size")
+    runs = 0
+
+    def _run_process(self):
+        DummyReadProcess.runs += 1
+        self.size = os.path.getsize(self.i)
+
+
 class TestMemory(unittest.TestCase):
     """ Execute a process using smart-caching functionalities.
     """
@@ -91,6 +117,208 @@ class TestMemory(unittest.TestCase):
         # Call the test
         self.proxy_process_copy()
 
+    def test_blob_store(self):
+        """ Test that cached files are stored once and restored.
+        """
+        # Create the memory object
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir)
+        proxy_process = self.mem.cache(DummyFileProcess(), verbose=0)
+        blobdir = os.path.join(self.mem.cachedir, BLOBS_DIRECTORY)
+
+        # Identical outputs are stored once
+        out1 = os.path.join(self.workspace_dir, "out1.txt")
+        out2 = os.path.join(self.workspace_dir, "out2.txt")
+        proxy_process(f=1., o=out1)
+        proxy_process(f=2., o=out2)
+        blobs = [fname for root, dirs, files in os.walk(blobdir)
+                 for fname in files]
+        self.assertEqual(len(blobs), 1)
+
+        # Files are restored from the store
+        os.remove(out1)
+        proxy_process(f=1., o=out1)
+        self.assertEqual(open(out1).read(), "dummy content")
+
+        # Recently stored blobs are kept when the entries are removed
+        process_dirs = [entry["process_dir"] for entry in self.mem.entries()]
+        self.mem.clear(skips=process_dirs[:1])
+        self.assertEqual(
+            [entry["process_dir"] for entry in self.mem.entries()],
+            process_dirs[:1])
+        self.assertFalse(os.path.isdir(process_dirs[1]))
+        self.mem.clear()
+        self.assertEqual(self.mem.entries(), [])
+        blobs = [fname for root, dirs, files in os.walk(blobdir)
+                 for fname in files]
+        self.assertEqual(len(blobs), 1)
+
+        # Blobs are removed with the cache entries after the grace period
+        self.mem.blobs_grace_period = 0.
+        self.mem.clear()
+        blobs = [fname for root, dirs, files in os.walk(blobdir)
+                 for fname in files]
+        self.assertEqual(blobs, [])
+
+        # Rm temporary folder
+        shutil.rmtree(self.cachedir)
+
+    def test_eviction(self):
+        """ Test the least recently used cache entries eviction.
+        """
+        # Create the memory object
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir, blobs_grace_period=0.)
+        proxy_process = self.mem.cache(DummyFileProcess(), verbose=0)
+        blobdir = os.path.join(self.mem.cachedir, BLOBS_DIRECTORY)
+
+        # Create three entries and use the first one again
+        out = os.path.join(self.workspace_dir, "out.txt")
+        for value in (1., 2., 3., 1.):
+            proxy_process(f=value, o=out)
+            time.sleep(0.01)
+        entries = self.mem.entries()
+        self.assertEqual(len(entries), 3)
+        self.assertEqual([entry["hits"] for entry in entries], [0, 0, 1])
+        self.assertEqual(entries[-1]["inputs"]["f"], 1.)
+        self.assertEqual(entries[-1]["outputs"]["o"], out)
+        stats = self.mem.stats()
+        self.assertEqual((stats["entries"], stats["hits"]), (3, 1))
+
+        # The least recently used entry is selected first
+        report = self.mem.evict(max_size=0, dry_run=True)
+        self.assertEqual(len(report["evicted"]), 3)
+        self.assertEqual(report["size_after"], 0)
+        self.assertEqual(report["size_before"], stats["size"])
+        self.assertEqual(report["freed_size"], report["size_before"])
+        process_dirs = [item[0] for item in report["evicted"]]
+        self.assertEqual(process_dirs[-1],
+                         proxy_process._get_process_id(f=1., o=out)[0])
+        self.assertTrue(all(os.path.isdir(item) for item in process_dirs))
+
+        # Evict all the entries but the most recently used one
+        # (the last evicted entry frees the shared blob)
+        report = self.mem.evict(max_size=report["evicted"][-1][2])
+        self.assertEqual(len(report["evicted"]), 2)
+        self.assertEqual([item[0] for item in report["evicted"]],
+                         process_dirs[:2])
+        self.assertFalse(any(os.path.isdir(item) for item in process_dirs[:2]))
+        self.assertEqual(len(self.mem.entries()), 1)
+        blobs = [fname for root, dirs, files in os.walk(blobdir)
+                 for fname in files]
+        self.assertEqual(len(blobs), 1)
+
+        # Evict the remaining entry according to its age
+        report = self.mem.evict(max_age=0.)
+        self.assertEqual(len(report["evicted"]), 1)
+        self.assertEqual(self.mem.entries(), [])
+        blobs = [fname for root, dirs, files in os.walk(blobdir)
+                 for fname in files]
+        self.assertEqual(blobs, [])
+
+        # Rm temporary folder
+        shutil.rmtree(self.cachedir)
+
+    def test_eviction_fresh_blob(self):
+        """ Test that the eviction keeps the blobs younger than the grace
+        period.
+        """
+        # Create the memory object
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir)
+        proxy_process = self.mem.cache(DummyFileProcess(), verbose=0)
+        blobdir = os.path.join(self.mem.cachedir, BLOBS_DIRECTORY)
+
+        # Evict a freshly stored entry: its blob is kept
+        out = os.path.join(self.workspace_dir, "out.txt")
+        proxy_process(f=1., o=out)
+        report = self.mem.evict(max_size=0)
+        self.assertEqual(len(report["evicted"]), 1)
+        self.assertEqual(self.mem.entries(), [])
+        blobs = [os.path.join(root, fname)
+                 for root, dirs, files in os.walk(blobdir) for fname in files]
+        self.assertEqual(len(blobs), 1)
+
+        # Once the grace period is over, the orphan blob is removed
+        self.mem.blobs_grace_period = 0.
+        self.mem.clear()
+        self.assertFalse(any(os.path.isfile(blob) for blob in blobs))
+
+        # Rm temporary folder
+        shutil.rmtree(self.cachedir)
+
+    def test_stale_entry(self):
+        """ Test that an incomplete cache entry is recomputed.
+        """
+        # Create the memory object
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir)
+        proxy_process = self.mem.cache(DummyReadProcess(), verbose=0)
+        ifile = os.path.join(self.workspace_dir, "in.txt")
+        with open(ifile, "w") as open_file:
+            open_file.write("dummy content")
+
+        # Remove the files mapping of the cached entry
+        DummyReadProcess.runs = 0
+        proxy_process(i=ifile)
+        process_dir = proxy_process._get_process_id(i=ifile)[0]
+        os.remove(os.path.join(process_dir, "file_mapping.json"))
+
+        # The entry is executed again and cached
+        proxy_process(i=ifile)
+        self.assertEqual(DummyReadProcess.runs, 2)
+        self.assertEqual(proxy_process.size, 13)
+        self.assertTrue(
+            os.path.isfile(os.path.join(process_dir, "file_mapping.json")))
+        proxy_process(i=ifile)
+        self.assertEqual(DummyReadProcess.runs, 2)
+        self.assertEqual(len(self.mem.entries()), 1)
+
+        # Rm temporary folder
+        shutil.rmtree(self.cachedir)
+
+    def test_content_hash(self):
+        """ Test the input files content fingerprints.
+        """
+        # Create the memory object
+        self.cachedir = tempfile.mkdtemp()
+        self.mem = Memory(self.cachedir, content_hash=True)
+        proxy_process = self.mem.cache(DummyReadProcess(), verbose=0)
+        ifile = os.path.join(self.workspace_dir, "in.txt")
+        jfile = os.path.join(self.workspace_dir, "in2.txt")
+        for fname in (ifile, jfile):
+            with open(fname, "w") as open_file:
+                open_file.write("dummy content")
+        DummyReadProcess.runs = 0
+
+        # Touching an input file keeps the cached result
+        proxy_process(i=ifile, j=jfile)
+        stat = os.stat(ifile)
+        os.utime(ifile, (stat.st_atime, stat.st_mtime + 10))
+        proxy_process(i=ifile, j=jfile)
+        self.assertEqual(DummyReadProcess.runs, 1)
+
+        # The content hash is memorized
+        stat = os.stat(ifile)
+        self.assertTrue(self.mem.index.get_file_hash(
+            ifile, stat.st_ino, stat.st_size, repr(stat.st_mtime))
+            is not None)
+
+        # Modifying the content invalidates the cached result
+        with open(ifile, "a") as open_file:
+            open_file.write("more content")
+        proxy_process(i=ifile, j=jfile)
+        self.assertEqual(DummyReadProcess.runs, 2)
+
+        # Trait metadata disables the content fingerprint
+        stat = os.stat(jfile)
+        os.utime(jfile, (stat.st_atime, stat.st_mtime + 10))
+        proxy_process(i=ifile, j=jfile)
+        self.assertEqual(DummyReadProcess.runs, 3)
+
+        # Rm temporary folder
+        shutil.rmtree(self.cachedir)
+
     def proxy_process(self):
         """ Test the proxy process behaviours.
         """
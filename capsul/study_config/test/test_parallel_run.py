@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import tempfile
+import shutil
+import threading
+import time
+import os
+import multiprocessing
+
+# Capsul import
+from capsul.process import Process
+from capsul.pipeline import Pipeline
+from capsul.study_config.study_config import StudyConfig
+
+# Trait import
+from traits.api import Float, Directory
+
+
+# Processes of the first level that are running at the same time
+started = []
+started_condition = threading.Condition()
+
+# Processes running at the same time
+running = {"current": 0, "max": 0}
+running_lock = threading.Lock()
+
+
+class MultiplyProcess(Process):
+    """ A process multiplying its input.
+    """
+    f = Float(output=False, optional=False, desc="a float")
+    output_directory = Directory(output=False, optional=True,
+                                 exists=False, desc="a directory")
+    res = Float(output=True, desc="a float")
+
+    def _run_process(self):
+        self.res = self.f * 2.
+
+
+class WaitingProcess(MultiplyProcess):
+    """ A process waiting for another one to be started.
+    """
+    def _run_process(self):
+        with started_condition:
+            started.append(self)
+            started_condition.notify_all()
+            if len(started) < 2:
+                started_condition.wait(10.)
+        super(WaitingProcess, self)._run_process()
+
+
+class FailingProcess(MultiplyProcess):
+    """ A failing process.
+    """
+    def _run_process(self):
+        raise RuntimeError("failure")
+
+
+class GreedyProcess(MultiplyProcess):
+    """ A process using all the cores of the machine.
+    """
+    requirements = {"cpu": 100000}
+
+    def _run_process(self):
+        with running_lock:
+            running["current"] += 1
+            running["max"] = max(running["max"], running["current"])
+        time.sleep(0.1)
+        with running_lock:
+            running["current"] -= 1
+        super(GreedyProcess, self)._run_process()
+
+
+class BranchesPipeline(Pipeline):
+    """ A pipeline with two independent branches.
+    """
+    def pipeline_definition(self):
+        self.add_process("a1", WaitingProcess)
+        self.add_process("a2", MultiplyProcess)
+        self.add_process("b1", WaitingProcess)
+        self.add_process("b2", MultiplyProcess)
+        self.add_link("a1.res->a2.f")
+        self.add_link("b1.res->b2.f")
+        self.export_parameter("a1", "f", "fa")
+        self.export_parameter("b1", "f", "fb")
+        self.export_parameter("a2", "res", "res_a")
+        self.export_parameter("b2", "res", "res_b")
+
+
+class FailingPipeline(Pipeline):
+    """ A pipeline with a failing node.
+    """
+    def pipeline_definition(self):
+        self.add_process("a1", FailingProcess)
+        self.add_process("a2", MultiplyProcess)
+        self.add_link("a1.res->a2.f")
+        self.export_parameter("a1", "f")
+        self.export_parameter("a2", "res")
+
+
+class GreedyPipeline(Pipeline):
+    """ A pipeline with two independent nodes using all the cores.
+    """
+    def pipeline_definition(self):
+        self.add_process("a", GreedyProcess)
+        self.add_process("b", GreedyProcess)
+        self.export_parameter("a", "f", "fa")
+        self.export_parameter("b", "f", "fb")
+        self.export_parameter("a", "res", "res_a")
+        self.export_parameter("b", "res", "res_b")
+
+
+class TestParallelRun(unittest.TestCase):
+    """ Execute pipelines nodes in parallel.
+    """
+    def setUp(self):
+        self.output_directory = tempfile.mkdtemp()
+        self.study_config = StudyConfig(
+            modules=["SmartCachingConfig"],
+            use_smart_caching=False,
+            output_directory=self.output_directory,
+            number_of_local_workers=2)
+        del started[:]
+        running["max"] = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.output_directory)
+
+    def test_parallel_branches(self):
+        pipeline = BranchesPipeline()
+        pipeline.fa = 1.
+        pipeline.fb = 3.
+        self.study_config.run(pipeline)
+        self.assertEqual(len(started), 2)
+        self.assertEqual(pipeline.res_a, 4.)
+        self.assertEqual(pipeline.res_b, 12.)
+        self.assertEqual(self.study_config.process_counter, 5)
+        directories = sorted(os.listdir(self.output_directory))
+        self.assertEqual(directories,
+                         ["1-WaitingProcess", "2-WaitingProcess",
+                          "3-MultiplyProcess", "4-MultiplyProcess"])
+
+    def test_requirements(self):
+        pipeline = GreedyPipeline()
+        pipeline.fa = 1.
+        pipeline.fb = 3.
+        self.study_config.run(pipeline)
+        self.assertEqual(running["max"], 1)
+        self.assertEqual(pipeline.res_b, 6.)
+
+        # The requirements can be overriden on a node
+        pipeline.nodes["a"].requirements["cpu"] = 1
+        pipeline.nodes["b"].requirements["cpu"] = 1
+        self.study_config.run(pipeline)
+        self.assertEqual(running["max"],
+                         min(multiprocessing.cpu_count(), 2))
+
+    def test_failure(self):
+        pipeline = FailingPipeline()
+        pipeline.f = 1.
+        self.assertRaises(RuntimeError, self.study_config.run, pipeline)
+        self.assertEqual(self.study_config.process_counter, 2)
+
+
+def test():
+    """ Function to execute unitest.
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestParallelRun)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
@@ -37,12 +37,19 @@ tests_no_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         "use_fsl": False,
         'use_matlab': False,
         'use_spm': False,
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
@@ -55,12 +62,19 @@ tests_no_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         "use_fsl": False,
         'use_matlab': False,
         'use_spm': False,
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
@@ -73,12 +87,19 @@ tests_no_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         "use_fsl": False,
         'use_matlab': False,
         'use_spm': False,
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
@@ -99,6 +120,9 @@ tests_no_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'automatic_configuration': False,
         'use_soma_workflow': False,
     },
@@ -110,6 +134,9 @@ tests_no_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         "use_fsl": False,
         'use_matlab': False,
         'use_spm': False,
@@ -120,6 +147,10 @@ tests_no_files = [
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['BrainVISAConfig', 'FSLConfig', 'FreeSurferConfig', 'MatlabConfig', 
@@ -140,12 +171,19 @@ tests_standard_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         "use_fsl": False,
         'use_matlab': False,
         'use_spm': False,
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
@@ -160,6 +198,9 @@ tests_standard_files = [
         'input_fom': "",
         'somaworkflow_computing_resources_config': {},
         'generate_logging': False,
+        'number_of_local_workers': 1,
+        'incremental_run': False,
+        'use_worker_pool': False,
         "shared_directory": os.path.join(soma.config.BRAINVISA_SHARE, 
                                          'brainvisa-share-%s' % \
                                          bv_share_version),
@@ -179,12 +220,19 @@ tests_standard_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'use_fsl': False,
         'use_matlab': False,
         'use_spm': False,
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig',
@@ -196,6 +244,9 @@ tests_standard_files = [
 [[(),dict(init_config={'config_modules':[]})], [
     {
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'automatic_configuration': False,
     },
     [],
@@ -207,6 +258,9 @@ tests_standard_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'automatic_configuration': False,
         'use_soma_workflow': False,
     },
@@ -224,12 +278,19 @@ tests_custom_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'use_fsl': False,
         'use_matlab': False,
         'use_spm': False,
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig', 'SomaWorkflowConfig'],
@@ -243,6 +304,9 @@ tests_custom_files = [
         'input_fom': "",
         'somaworkflow_computing_resources_config': {},
         'generate_logging': False,
+        'number_of_local_workers': 1,
+        'incremental_run': False,
+        'use_worker_pool': False,
         "shared_directory": os.path.join(soma.config.BRAINVISA_SHARE, 
                                          'brainvisa-share-%s' % \
                                          bv_share_version),
@@ -262,12 +326,19 @@ tests_custom_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'use_fsl': False,
         'use_matlab': False,
         'use_spm': False,
         'automatic_configuration': False,
         'spm_standalone': False,
         'use_smart_caching': False,
+        'smart_caching_content_hash': False,
+        'smart_caching_hardlink_restore': False,
+        'smart_caching_max_size': 0.,
+        'smart_caching_max_age': 0.,
         'use_soma_workflow': False,
     },
     ['FSLConfig', 'MatlabConfig', 'SPMConfig', 'SmartCachingConfig', 'SomaWorkflowConfig'],
@@ -278,6 +349,9 @@ tests_custom_files = [
 [[(),dict(init_config={'config_modules':[]})], [
     {
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'automatic_configuration': False,
     },
     [],
@@ -289,6 +363,9 @@ tests_custom_files = [
     {
         "somaworkflow_computing_resources_config": {},
         "generate_logging": False,
+        "number_of_local_workers": 1,
+        "incremental_run": False,
+        "use_worker_pool": False,
         'automatic_configuration': False,
         'use_soma_workflow': False,
     },
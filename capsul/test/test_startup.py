@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+##########################################################################
+# Capsul - Copyright (C) CEA, 2014
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+# Capsul import
+import capsul
+from capsul.utils.lazy_import import LazyModule
+from capsul.utils.lazy_import import lazy_import
+from capsul.utils.lazy_import import is_loaded
+
+# The optional backends which must not be loaded at startup
+OPTIONAL_MODULES = ("soma_workflow", "nipype", "PyQt4", "PySide", "soma.fom",
+                    "soma.application")
+
+# Script importing a module in a new interpreter and reporting the import
+# duration and the loaded optional modules
+_STARTUP_SCRIPT = """
+import sys, time, json
+start = time.time()
+import {module}
+duration = time.time() - start
+optional = [name for name in sys.modules
+            if sys.modules[name] is not None and
+            (name.split('.')[0] in {optional!r} or
+             '.'.join(name.split('.')[:2]) in {optional!r})]
+print(json.dumps({{"duration": duration, "optional": sorted(optional)}}))
+"""
+
+
+def measure_startup(module="capsul.study_config.study_config"):
+    """ Import a module in a new interpreter.
+
+    Parameters
+    ----------
+    module: str (optional)
+        the module to import.
+
+    Returns
+    -------
+    measure: dict
+        the import 'duration' in seconds and the 'optional' backends
+        modules loaded by the import.
+    """
+    env = os.environ.copy()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(capsul.__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(
+        [root] + [path for path in [env.get("PYTHONPATH")] if path])
+    output = subprocess.check_output(
+        [sys.executable, "-c", _STARTUP_SCRIPT.format(
+            module=module, optional=OPTIONAL_MODULES)], env=env)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark(modules=("capsul.process", "capsul.pipeline",
+                       "capsul.study_config.study_config"), repeat=5):
+    """ Print the mean import duration of capsul modules in new
+    interpreters.
+    """
+    for module in modules:
+        durations = [measure_startup(module)["duration"]
+                     for index in range(repeat)]
+        print("{0}: {1:.3f}s (min {2:.3f}s)".format(
+            module, sum(durations) / len(durations), min(durations)))
+
+
+class TestStartup(unittest.TestCase):
+    """ Class to test that the optional backends are loaded on first use.
+    """
+    def test_lazy_module(self):
+        module = LazyModule("colorsys")
+        self.assertEqual(module.lazy_module_name, "colorsys")
+        self.assertEqual(module.rgb_to_hsv(1., 0., 0.), (0., 1., 1.))
+        self.assertTrue(is_loaded(module))
+        self.assertTrue(lazy_import("os") is os)
+        self.assertRaises(ImportError, getattr,
+                          lazy_import("capsul_missing_module"), "attribute")
+
+    def test_no_optional_module_at_startup(self):
+        for module in ("capsul.process", "capsul.pipeline.pipeline_workflow",
+                       "capsul.study_config.study_config"):
+            self.assertEqual(measure_startup(module)["optional"], [])
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestStartup)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print("RETURNCODE: ", test())
+    benchmark()
@@ -0,0 +1,144 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import sys
+import types
+import logging
+import importlib
+import threading
+
+# Define the logger
+logger = logging.getLogger(__name__)
+
+# Lock serializing the first imports of the lazy modules
+_import_lock = threading.RLock()
+
+
+class LazyModule(types.ModuleType):
+    """ Module proxy importing the real module on first attribute access.
+
+    Optional backends (soma-workflow, nipype, Qt, FOM) are only needed by
+    some executions: importing them through a lazy module keeps them out of
+    the capsul startup. An ImportError is only raised when the missing
+    module is actually used.
+
+    Attributes
+    ----------
+    `lazy_module_name`: str
+        the name of the proxied module.
+    """
+
+    def __init__(self, module_name):
+        """ Initialize the proxy, the module is not imported.
+
+        Parameters
+        ----------
+        module_name: str (mandatory)
+            the name of the module to import on first use, ie.
+            'soma_workflow.client'.
+        """
+        super(LazyModule, self).__init__(module_name)
+        self.__dict__["lazy_module_name"] = module_name
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        """ Import the proxied module once.
+        """
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with _import_lock:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module_name = self.__dict__["lazy_module_name"]
+                    logger.debug("Lazy import of module '{0}'.".format(
+                        module_name))
+                    module = importlib.import_module(module_name)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            return "<lazy module '{0}' (not loaded)>".format(
+                self.__dict__["lazy_module_name"])
+        return repr(module)
+
+
+def lazy_import(module_name):
+    """ Get a module imported on first use.
+
+    If the module is already imported, it is returned directly.
+
+    Parameters
+    ----------
+    module_name: str (mandatory)
+        the module name, ie. module1.module2
+
+    Returns
+    -------
+    module: module or LazyModule
+        the module, or a proxy importing it on first attribute access.
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    return LazyModule(module_name)
+
+
+def is_loaded(module):
+    """ Check if a module, possibly lazy, is imported.
+
+    Parameters
+    ----------
+    module: module or LazyModule (mandatory)
+        the module to check.
+
+    Returns
+    -------
+    loaded: bool
+        False if the module is a lazy module which has not been used yet.
+    """
+    if isinstance(module, LazyModule):
+        return module.__dict__["_lazy_module"] is not None
+    return True
+
+
+def loaded_class(module_name, class_name):
+    """ Get a class from a module only if this module is already imported.
+
+    It allows type checks against classes of optional modules without
+    importing them: an object cannot be an instance of a class whose module
+    is not imported.
+
+    Parameters
+    ----------
+    module_name: str (mandatory)
+        the module name, ie. 'nipype.interfaces.base'.
+    class_name: str (mandatory)
+        the class name.
+
+    Returns
+    -------
+    klass: class
+        the class, None if the module is not imported.
+    """
+    module = sys.modules.get(module_name)
+    if module is None or isinstance(module, LazyModule):
+        return None
+    return getattr(module, class_name, None)
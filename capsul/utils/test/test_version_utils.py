@@ -0,0 +1,163 @@
+#! /usr/bin/env python
+##########################################################################
+# CAPSUL - Copyright (C) CEA, 2013
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Capsul import
+import capsul
+from capsul.utils import version_utils
+from capsul.utils.version_utils import cached_version
+from capsul.utils.version_utils import clear_version_cache
+from capsul.utils.version_utils import get_tool_version
+from capsul.utils.version_utils import set_version_cache
+from capsul.utils.version_utils import version_cache_key
+
+
+class Probe(object):
+    """ Version probe counting its calls.
+    """
+    def __init__(self, version):
+        self.version = version
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if isinstance(self.version, Exception):
+            raise self.version
+        return self.version
+
+
+class TestVersionCache(unittest.TestCase):
+    """ Class to test the tool versions cache.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.directory, "cache",
+                                       "tool_versions.json")
+        self.previous_cache = (version_utils._version_cache["cache_file"],
+                               version_utils._version_cache["ttl"])
+        set_version_cache(self.cache_file)
+
+    def tearDown(self):
+        set_version_cache(*self.previous_cache)
+        os.environ.pop("CAPSUL_TEST_TOOL_HOME", None)
+        shutil.rmtree(self.directory)
+
+    def test_python_version(self):
+        self.assertEqual(get_tool_version("capsul"), capsul.__version__)
+        self.assertEqual(get_tool_version("error_capsul"), None)
+
+    def test_cached_version(self):
+        probe = Probe("5.0.9")
+        for index in range(3):
+            self.assertEqual(cached_version("fsl", probe), "5.0.9")
+        self.assertEqual(probe.calls, 1)
+
+        # The versions are shared through the cache file
+        with open(self.cache_file) as open_file:
+            entries = json.load(open_file)
+        self.assertEqual([entry["version"] for entry in entries.values()],
+                         ["5.0.9"])
+        set_version_cache(self.cache_file)
+        self.assertEqual(cached_version("fsl", probe), "5.0.9")
+        self.assertEqual(probe.calls, 1)
+
+        # Probing errors give a None version, which is not written in the
+        # cache file
+        failing_probe = Probe(ValueError())
+        self.assertEqual(cached_version("other", failing_probe), None)
+        self.assertEqual(cached_version("other", failing_probe), None)
+        self.assertEqual(failing_probe.calls, 1)
+        with open(self.cache_file) as open_file:
+            self.assertEqual(len(json.load(open_file)), 1)
+
+        clear_version_cache()
+        self.assertFalse(os.path.exists(self.cache_file))
+        self.assertEqual(cached_version("fsl", probe), "5.0.9")
+        self.assertEqual(probe.calls, 2)
+
+    def test_time_to_live(self):
+        set_version_cache(self.cache_file, ttl=0.)
+        probe = Probe("1.0")
+        cached_version("tool", probe)
+        cached_version("tool", probe)
+        self.assertEqual(probe.calls, 2)
+
+    def test_failed_time_to_live(self):
+        set_version_cache(self.cache_file, failed_ttl=0.)
+        probe = Probe(ValueError())
+        cached_version("tool", probe)
+        cached_version("tool", probe)
+        self.assertEqual(probe.calls, 2)
+        self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_concurrent_sessions(self):
+        cached_version("tool", Probe("1.0"))
+
+        # The versions written by another session are kept
+        with open(self.cache_file) as open_file:
+            entries = json.load(open_file)
+        entries["other-key"] = {"version": "2.0", "time": 0.}
+        with open(self.cache_file, "w") as open_file:
+            json.dump(entries, open_file)
+        cached_version("other", Probe("3.0"))
+        with open(self.cache_file) as open_file:
+            entries = json.load(open_file)
+        self.assertEqual(sorted(entry["version"]
+                                for entry in entries.values()),
+                         ["1.0", "2.0", "3.0"])
+
+    def test_probe_outside_lock(self):
+        # Other tools can be looked up while a tool is probed
+        results = []
+
+        def probe():
+            thread = threading.Thread(target=lambda: results.append(
+                cached_version("other", Probe("2.0"))))
+            thread.start()
+            thread.join(10.)
+            return "1.0"
+
+        self.assertEqual(cached_version("tool", probe), "1.0")
+        self.assertEqual(results, ["2.0"])
+
+    def test_installation_key(self):
+        environment_names = ("CAPSUL_TEST_TOOL_HOME", )
+        key = version_cache_key("tool", "ls -l", environment_names)
+        self.assertEqual(version_cache_key("tool", "ls", environment_names),
+                         key)
+        self.assertNotEqual(version_cache_key("tool"), key)
+        os.environ["CAPSUL_TEST_TOOL_HOME"] = self.directory
+        self.assertNotEqual(
+            version_cache_key("tool", "ls", environment_names), key)
+
+        # Another installation is probed again
+        probe = Probe("1.0")
+        cached_version("tool", probe, environment_names=environment_names)
+        os.environ["CAPSUL_TEST_TOOL_HOME"] = "/other"
+        cached_version("tool", probe, environment_names=environment_names)
+        self.assertEqual(probe.calls, 2)
+
+
+def test():
+    """ Function to execute unitest
+    """
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestVersionCache)
+    runtime = unittest.TextTestRunner(verbosity=2).run(suite)
+    return runtime.wasSuccessful()
+
+
+if __name__ == "__main__":
+    print "RETURNCODE: ", test()
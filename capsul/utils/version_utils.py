@@ -8,17 +8,268 @@
 ##########################################################################
 
 # System import
+import os
+import json
+import time
+import hashlib
 import logging
+import tempfile
+import threading
+from distutils.spawn import find_executable
 
 # Define the logger
 logger = logging.getLogger(__name__)
 
+# The default time in seconds during which a probed version is reused
+DEFAULT_VERSION_TTL = 24 * 3600.
+
+# The default time in seconds before a tool whose version could not be
+# probed is probed again
+DEFAULT_FAILED_VERSION_TTL = 60.
+
+# The environment variables identifying the installation of each tool,
+# the 'PATH' being always considered
+TOOLS_ENVIRONMENT = {
+    "fsl": ("FSLDIR", "FSLOUTPUTTYPE"),
+    "freesurfer": ("FREESURFER_HOME", ),
+    "matlab": ("MATLABCMD", ),
+    "spm": ("MATLABCMD", "SPMMCRCMD", "FORCE_SPMMCR")
+}
+
+# The probed tool versions shared by the session and their on-disk copy
+_version_cache = {
+    "versions": {},
+    "cache_file": os.environ.get(
+        "CAPSUL_VERSION_CACHE",
+        os.path.expanduser("~/.config/capsul/tool_versions.json")),
+    "ttl": DEFAULT_VERSION_TTL,
+    "failed_ttl": DEFAULT_FAILED_VERSION_TTL,
+    "loaded": False
+}
+_version_cache_lock = threading.RLock()
+
+# Locks serializing the probes of each tool installation
+_probe_locks = {}
+
+# The versions of the python modules
+_python_versions = {}
+
+
+def set_version_cache(cache_file, ttl=DEFAULT_VERSION_TTL,
+                      failed_ttl=DEFAULT_FAILED_VERSION_TTL):
+    """ Set the file where the probed tool versions are stored.
+
+    Parameters
+    ----------
+    cache_file: str (mandatory)
+        the json file shared by the sessions, None to only keep the
+        versions in memory.
+    ttl: float (optional, default one day)
+        the time in seconds during which a probed version is reused.
+    failed_ttl: float (optional, default one minute)
+        the time in seconds during which a version that could not be probed
+        is reused. These versions are not written in the cache file.
+    """
+    with _version_cache_lock:
+        _version_cache["cache_file"] = cache_file
+        _version_cache["ttl"] = ttl
+        _version_cache["failed_ttl"] = failed_ttl
+        _version_cache["versions"] = {}
+        _version_cache["loaded"] = False
+
+
+def clear_version_cache():
+    """ Forget the probed tool versions, in memory and on disk.
+    """
+    with _version_cache_lock:
+        _version_cache["versions"] = {}
+        _version_cache["loaded"] = True
+        _python_versions.clear()
+        cache_file = _version_cache["cache_file"]
+        if cache_file is not None and os.path.isfile(cache_file):
+            os.remove(cache_file)
+
+
+def version_cache_key(tool, command=None, environment_names=()):
+    """ Get the key identifying a tool installation in the version cache.
+
+    Parameters
+    ----------
+    tool: str (mandatory)
+        the tool name.
+    command: str (optional)
+        the tool command: its executable path and modification time are
+        part of the key.
+    environment_names: sequence of str (optional)
+        the environment variables identifying the tool installation, in
+        addition to the 'PATH'.
+
+    Returns
+    -------
+    key: str
+        the tool installation key.
+    """
+    executable = None
+    if command:
+        executable = find_executable(command.split()[0])
+    mtime = None
+    if executable is not None:
+        mtime = os.path.getmtime(executable)
+    environment = [(name, os.environ.get(name))
+                   for name in sorted(set(("PATH", ) +
+                                          tuple(environment_names)))]
+    description = json.dumps([tool, executable, mtime, environment])
+    return "{0}-{1}".format(tool, hashlib.md5(description).hexdigest())
+
+
+def _merge_version_cache_file():
+    """ Add the versions of the on-disk version cache that are more recent
+    than the versions in memory.
+    """
+    cache_file = _version_cache["cache_file"]
+    if cache_file is None or not os.path.isfile(cache_file):
+        return
+    try:
+        with open(cache_file) as open_file:
+            versions = json.load(open_file)
+    except (IOError, ValueError) as e:
+        logger.warning("Could not read the version cache '{0}': "
+                       "{1}".format(cache_file, e))
+        return
+    for key, entry in versions.iteritems():
+        cached = _version_cache["versions"].get(key)
+        if cached is None or cached[1] < entry["time"]:
+            _version_cache["versions"][key] = (entry["version"],
+                                               entry["time"])
+
+
+def _load_version_cache():
+    """ Read the on-disk version cache once per session.
+    """
+    if _version_cache["loaded"]:
+        return
+    _version_cache["loaded"] = True
+    _merge_version_cache_file()
+
+
+def _lookup_version(key):
+    """ Get a cached version which has not expired.
+
+    Returns
+    -------
+    found: bool
+        True if the version is cached.
+    version: str
+        the cached version.
+    """
+    _load_version_cache()
+    cached = _version_cache["versions"].get(key)
+    if cached is None:
+        return False, None
+    ttl = _version_cache["ttl"]
+    if cached[0] is None:
+        ttl = _version_cache["failed_ttl"]
+    if time.time() - cached[1] >= ttl:
+        return False, None
+    return True, cached[0]
+
+
+def _save_version_cache():
+    """ Write the probed versions to the on-disk version cache, merged
+    with the versions written by the other sessions.
+    """
+    cache_file = _version_cache["cache_file"]
+    if cache_file is None:
+        return
+    _merge_version_cache_file()
+    versions = dict(
+        (key, {"version": version, "time": probe_time})
+        for key, (version, probe_time)
+        in _version_cache["versions"].iteritems()
+        if version is not None)
+    try:
+        cache_dir = os.path.dirname(os.path.abspath(cache_file))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Write a temporary file first so that concurrent sessions never
+        # read a partial file
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir,
+                                        prefix=".tool_versions_")
+        with os.fdopen(fd, "w") as open_file:
+            json.dump(versions, open_file, indent=2, sort_keys=True)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        logger.warning("Could not write the version cache '{0}': "
+                       "{1}".format(cache_file, e))
+
+
+def cached_version(tool, probe, command=None, environment_names=()):
+    """ Get a tool version, probing it only if it is not cached.
+
+    The versions are cached for the session and in the version cache file
+    (see :py:func:`set_version_cache`), keyed by the tool installation
+    (see :py:func:`version_cache_key`). Cached versions expire after the
+    cache time to live, the versions that could not be probed after a short
+    time and are only kept in memory. The probes are run outside of the
+    cache lock, a tool installation being probed by one thread at a time.
+
+    Parameters
+    ----------
+    tool: str (mandatory)
+        the tool name.
+    probe: callable (mandatory)
+        function without parameter returning the tool version. Errors are
+        reported as a None version.
+    command: str (optional)
+        the tool command.
+    environment_names: sequence of str (optional)
+        the environment variables identifying the tool installation. The
+        variables of TOOLS_ENVIRONMENT are used if not given.
+
+    Returns
+    -------
+    version: str
+        the tool version, None if it could not be probed.
+    """
+    environment_names = (environment_names or
+                         TOOLS_ENVIRONMENT.get(tool, ()))
+    key = version_cache_key(tool, command, environment_names)
+    with _version_cache_lock:
+        found, version = _lookup_version(key)
+        if found:
+            return version
+        probe_lock = _probe_locks.setdefault(key, threading.Lock())
+
+    with probe_lock:
+        # The version may have been probed by another thread meanwhile
+        with _version_cache_lock:
+            found, version = _lookup_version(key)
+        if found:
+            return version
+
+        # Probe the version
+        try:
+            version = probe()
+        except Exception as e:
+            logger.debug("Could not probe the version of '{0}': "
+                         "{1}".format(tool, e))
+            version = None
+        if version is not None and not isinstance(version, basestring):
+            version = str(version)
+        logger.debug("Tool '{0}' version is {1}".format(tool, version))
+        with _version_cache_lock:
+            _version_cache["versions"][key] = (version, time.time())
+            if version is not None:
+                _save_version_cache()
+    return version
+
 
 def get_tool_version(tool):
     """ Get the version of a python tool.
 
     Check if the python tool module has a '__version__' attribute and return
-    this value. If this attribute is not found, return None.
+    this value. If this attribute is not found, return None. The version is
+    looked up once per session.
 
     Parameters
     ----------
@@ -30,6 +281,10 @@ def get_tool_version(tool):
     version: str
         the tool version, None if no information found in the module.
     """
+    # Use the version found previously
+    if tool in _python_versions:
+        return _python_versions[tool]
+
     # Initialize the version to None ie. not found
     version = None
 
@@ -42,16 +297,45 @@ def get_tool_version(tool):
 
     # Debug message
     logger.debug("Module '{0}' version is {1}".format(tool, version))
+    _python_versions[tool] = version
 
     return version
 
 
+def get_nipype_interface_version(interface):
+    """ Get the version of the tool wrapped by a nipype interface.
+
+    Only the tool of this interface is probed, and its version is cached
+    (see :py:func:`cached_version`).
+
+    Parameters
+    ----------
+    interface: nipype Interface (mandatory)
+        a nipype interface instance.
+
+    Returns
+    -------
+    version: str
+        the interface tool version, None if no information found.
+    """
+    module_name = interface.__class__.__module__
+    tool = module_name.split(".")[2]
+    command = getattr(interface, "_cmd", None)
+    if not isinstance(command, basestring):
+        command = None
+    return cached_version(tool, lambda: interface.version, command=command)
+
+
 def get_nipype_interfaces_versions():
     """ Get the versions of the nipype interfaces.
 
     If nipype is not found, return None.
     If no interfaces are configured, returned an empty dictionary.
 
+    Probing all the interfaces runs external commands: prefer
+    :py:func:`get_nipype_interface_version` for the interfaces actually
+    used. The probed versions are cached (see :py:func:`cached_version`).
+
     Returns
     -------
     versions: dict
@@ -63,24 +347,24 @@ def get_nipype_interfaces_versions():
 
     # Try to load the nipype interfaces module
     try:
-        nipype_module = __import__("nipype.interfaces")
+        interfaces_module = __import__("nipype.interfaces").interfaces
 
         # List all the interface
         sub_modules = [
             "{0}".format(i)
-            for i in dir(nipype_module)
+            for i in dir(interfaces_module)
             if (not i.startswith("_") and not i[0].isupper())]
 
         # For each interface, try to get its version and fill the
         # output structure
         for module in sub_modules:
-            try:
-                version = eval("nipype_module.{0}."
-                               "Info.version()".format(module))
-                if version:
-                    versions[module] = version
-            except:
-                pass
+            info = getattr(getattr(interfaces_module, module, None),
+                           "Info", None)
+            if info is None:
+                continue
+            version = cached_version(module, info.version)
+            if version:
+                versions[module] = version
     except:
         versions = None
 
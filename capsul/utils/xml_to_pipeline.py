@@ -87,6 +87,16 @@ class AutoPipeline(Pipeline):
     """
     def pipeline_definition(self):
         """ Define the pipeline from its description.
+
+        The whole definition is done in a single transaction so that the
+        pipeline activations are not updated for each new link.
+        """
+        with self.batch_update():
+            self._define_from_description()
+
+    def _define_from_description(self):
+        """ Add the nodes, switches, links and exported parameters of the
+        pipeline description.
         """
         # Add all the pipeline standard processes
         if "standard" in self._parameters["pipeline"]["processes"]: